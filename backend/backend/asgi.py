@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Serve the extract endpoint with the native async view (see inventory/async_views.py)
+os.environ.setdefault('EXTRACTION_ASYNC_VIEW', 'True')
 
 application = get_asgi_application()
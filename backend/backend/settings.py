@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 try:
     # load .env from backend folder if present
@@ -41,6 +42,36 @@ if not OPENAI_API_KEY:
     except Exception:
         OPENAI_API_KEY = None
 
+# Vision model client (see inventory/llm.py). OPENAI_BASE_URL overrides the API
+# endpoint, e.g. to point at the stub server in benchmarks/stub_openai.py.
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4.1-mini')
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))  # seconds
+OPENAI_READ_TIMEOUT = float(os.getenv('OPENAI_READ_TIMEOUT', '30'))  # seconds
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))  # Keep-alive pool size per process
+# Retries for transient failures, with full-jitter exponential backoff (seconds)
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '2'))
+OPENAI_RETRY_BACKOFF = float(os.getenv('OPENAI_RETRY_BACKOFF', '0.5'))
+OPENAI_RETRY_BACKOFF_MAX = float(os.getenv('OPENAI_RETRY_BACKOFF_MAX', '8'))
+# Circuit breaker: consecutive failed calls before failing fast, and seconds before a trial call
+OPENAI_BREAKER_THRESHOLD = int(os.getenv('OPENAI_BREAKER_THRESHOLD', '5'))
+OPENAI_BREAKER_RESET = float(os.getenv('OPENAI_BREAKER_RESET', '30'))
+# Admission control for model calls (inventory/admission.py), shared by every worker on the
+# host through a SQLite file: at most MODEL_MAX_IN_FLIGHT calls at once and a token bucket of
+# MODEL_RATE_LIMIT calls per second (bursts of MODEL_RATE_BURST; 0 disables either limit).
+# A request waits up to MODEL_ADMISSION_MAX_WAIT seconds, with at most
+# MODEL_ADMISSION_MAX_QUEUE waiting at once, before it is answered with a 429.
+MODEL_ADMISSION_ENABLED = os.getenv('MODEL_ADMISSION_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+MODEL_ADMISSION_PATH = os.getenv('MODEL_ADMISSION_PATH',
+                                 os.path.join(tempfile.gettempdir(), 'inventory-model-admission.sqlite3'))
+MODEL_MAX_IN_FLIGHT = int(os.getenv('MODEL_MAX_IN_FLIGHT', '8'))
+MODEL_RATE_LIMIT = float(os.getenv('MODEL_RATE_LIMIT', '8'))
+MODEL_RATE_BURST = int(os.getenv('MODEL_RATE_BURST', '16'))
+MODEL_ADMISSION_MAX_WAIT = float(os.getenv('MODEL_ADMISSION_MAX_WAIT', '10'))
+MODEL_ADMISSION_MAX_QUEUE = int(os.getenv('MODEL_ADMISSION_MAX_QUEUE', '32'))
+# A call's slot is freed after this many seconds even if its worker died without releasing it
+MODEL_LEASE_SECONDS = float(os.getenv('MODEL_LEASE_SECONDS', '120'))
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -62,6 +93,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -99,6 +131,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Concurrent writers (async requests, job and batch threads) wait for the
+        # write lock instead of failing with "database is locked"
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -143,3 +181,142 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Route POST /api/product/extract/ to the native async view. backend/asgi.py turns
+# this on, so it only needs setting explicitly to test the async view elsewhere.
+EXTRACTION_ASYNC_VIEW = os.getenv('EXTRACTION_ASYNC_VIEW', 'False').lower() in ('1', 'true', 'yes')
+
+# Number of background threads (per process) that run queued extraction jobs
+EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', '2'))
+# A job still 'running' this many seconds after it started is assumed to belong to a crashed
+# worker and is queued again. Keep it above the slowest extraction, including the admission wait.
+EXTRACTION_JOB_TIMEOUT = int(os.getenv('EXTRACTION_JOB_TIMEOUT', '900'))
+
+# How OCR is combined with the vision-model call: 'off', 'parallel' or 'blocking'.
+# Can be overridden per request with the `ocr` form field.
+EXTRACTION_OCR_MODE = os.getenv('EXTRACTION_OCR_MODE', 'parallel')
+# In parallel mode, how long (seconds) to wait for OCR after the model call when
+# its text is needed for a follow-up hint
+EXTRACTION_OCR_BUDGET = float(os.getenv('EXTRACTION_OCR_BUDGET', '2.0'))
+# Threads (per process) available for running OCR
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', '4'))
+
+# OCR engine: 'auto' (pooled tesserocr if installed, else pytesseract), 'tesserocr' or 'pytesseract'
+OCR_BACKEND = os.getenv('OCR_BACKEND', 'auto')
+OCR_LANG = os.getenv('OCR_LANG', 'eng')
+# Maximum number of live Tesseract handles kept by the pooled backend
+OCR_POOL_SIZE = int(os.getenv('OCR_POOL_SIZE', str(OCR_WORKERS)))
+OCR_TESSDATA_PATH = os.getenv('OCR_TESSDATA_PATH') or None
+
+# Perceptual-hash cache that reuses extraction results for near-duplicate photos
+CAPTURE_CACHE_ENABLED = os.getenv('CAPTURE_CACHE_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+# Maximum Hamming distance (out of 64 bits) for two captures to count as the same photo
+CAPTURE_CACHE_MAX_DISTANCE = int(os.getenv('CAPTURE_CACHE_MAX_DISTANCE', '4'))
+CAPTURE_CACHE_TTL = int(os.getenv('CAPTURE_CACHE_TTL', str(7 * 24 * 3600)))  # seconds since last use
+CAPTURE_CACHE_MAX_ENTRIES = int(os.getenv('CAPTURE_CACHE_MAX_ENTRIES', '5000'))
+
+# Ingest-time image normalization (see inventory/imaging.py)
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '1280'))  # Long-edge cap in pixels; 0 disables downscaling
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'JPEG')  # Re-encode format for the model and storage: JPEG or WEBP
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '85'))
+IMAGE_OCR_BINARIZE = os.getenv('IMAGE_OCR_BINARIZE', 'True').lower() in ('1', 'true', 'yes')
+# Store the untouched upload instead of the normalized re-encode
+IMAGE_KEEP_ORIGINAL = os.getenv('IMAGE_KEEP_ORIGINAL', 'False').lower() in ('1', 'true', 'yes')
+
+# Batch extraction: images accepted per request and images analyzed concurrently
+EXTRACTION_BATCH_MAX_IMAGES = int(os.getenv('EXTRACTION_BATCH_MAX_IMAGES', '50'))
+EXTRACTION_BATCH_CONCURRENCY = int(os.getenv('EXTRACTION_BATCH_CONCURRENCY', '4'))
+
+# Rows fetched per database round trip by the streaming exports
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# Cursor pagination for the session/history list endpoints
+DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '500'))
+
+# Barcode fast path: decode EAN/UPC codes locally (needs the optional pyzbar package)
+# and answer known GTINs from the Product catalog without calling the model
+BARCODE_ENABLED = os.getenv('BARCODE_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+BARCODE_CATALOG_CONFIDENCE = float(os.getenv('BARCODE_CATALOG_CONFIDENCE', '0.99'))
+# Minimum capture confidence counted by the build_catalog command
+CATALOG_MIN_CONFIDENCE = float(os.getenv('CATALOG_MIN_CONFIDENCE', '0.8'))
+
+# Fuzzy product index (inventory/product_index.py): OCR text that names a known product
+# answers the capture without the model, and model names close to a known one are
+# saved with its spelling. Build the snapshot with `python manage.py build_product_index`.
+PRODUCT_INDEX_ENABLED = os.getenv('PRODUCT_INDEX_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+PRODUCT_INDEX_PATH = os.getenv('PRODUCT_INDEX_PATH', str(BASE_DIR / 'product_index.pkl'))
+# Share of a known product's trigrams (name + unit) that must appear in the OCR text
+PRODUCT_INDEX_OCR_THRESHOLD = float(os.getenv('PRODUCT_INDEX_OCR_THRESHOLD', '0.85'))
+# Shorter entries are never matched from OCR text (a generic "Milk" is in too many labels)
+PRODUCT_INDEX_MIN_TRIGRAMS = int(os.getenv('PRODUCT_INDEX_MIN_TRIGRAMS', '10'))
+# Trigram similarity (Dice) above which a model name is replaced by the known one
+PRODUCT_INDEX_CANONICAL_THRESHOLD = float(os.getenv('PRODUCT_INDEX_CANONICAL_THRESHOLD', '0.8'))
+# In parallel OCR mode, seconds to wait for OCR before calling the model (0 disables the check there)
+PRODUCT_INDEX_OCR_WAIT = float(os.getenv('PRODUCT_INDEX_OCR_WAIT', '0.5'))
+
+# Local category classifier (inventory/categories.py), trained with
+# `python manage.py train_category_model`. 'off' only repairs aliases such as
+# "Cleanings"; 'validate' also lets a confident prediction override the model's
+# category; 'replace' always predicts locally and drops the category from the prompt.
+CATEGORY_CLASSIFIER = os.getenv('CATEGORY_CLASSIFIER', 'validate')
+CATEGORY_MODEL_PATH = os.getenv('CATEGORY_MODEL_PATH', str(BASE_DIR / 'category_model.npz'))
+CATEGORY_OVERRIDE_CONFIDENCE = float(os.getenv('CATEGORY_OVERRIDE_CONFIDENCE', '0.9'))
+
+# Thumbnails of stored images (inventory/thumbnails.py), served with the originals from
+# /api/media/<sha256>/<variant>/. Rendered in THUMBNAIL_WORKERS background threads after
+# ingest (THUMBNAIL_ENABLED) or on first request. Media URLs are cached as immutable, so
+# after changing the sizes run `backfill_thumbnails --force` and expect clients to keep
+# their cached copies until they expire.
+THUMBNAIL_ENABLED = os.getenv('THUMBNAIL_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+THUMBNAIL_FORMAT = os.getenv('THUMBNAIL_FORMAT', 'WEBP')  # WEBP or JPEG
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', '75'))
+THUMBNAIL_SMALL_EDGE = int(os.getenv('THUMBNAIL_SMALL_EDGE', '200'))  # Long edge in pixels
+THUMBNAIL_MEDIUM_EDGE = int(os.getenv('THUMBNAIL_MEDIUM_EDGE', '640'))
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', '2'))
+
+# Resumable uploads (inventory/uploads.py): chunks are spooled to UPLOAD_SPOOL_DIR, which
+# must be on disk (not tmpfs) and shared by all workers. Unfinished uploads are removed
+# after UPLOAD_EXPIRY_HOURS.
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR', str(BASE_DIR / 'uploads'))
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(25 * 1024 * 1024)))
+UPLOAD_CHUNK_MAX_BYTES = int(os.getenv('UPLOAD_CHUNK_MAX_BYTES', str(8 * 1024 * 1024)))
+UPLOAD_EXPIRY_HOURS = float(os.getenv('UPLOAD_EXPIRY_HOURS', '24'))
+
+# Conditional GET for /api/session/products/ and /api/sessions/ (inventory/read_cache.py).
+# Serialized payloads are cached in the default cache (per process unless CACHES points
+# at a shared backend) for READ_CACHE_TIMEOUT seconds; payloads of more than
+# READ_CACHE_MAX_ROWS rows are only answered with ETags, not cached.
+READ_CACHE_ENABLED = os.getenv('READ_CACHE_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+READ_CACHE_TIMEOUT = int(os.getenv('READ_CACHE_TIMEOUT', '300'))
+READ_CACHE_MAX_ROWS = int(os.getenv('READ_CACHE_MAX_ROWS', '5000'))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('READ_CACHE_MAX_ENTRIES', '500'))},
+    },
+}
+
+# Stage timings and Prometheus metrics (inventory/metrics.py). Every worker process
+# writes its values to METRICS_DIR at most every METRICS_FLUSH_INTERVAL seconds and
+# /api/metrics/ sums them, so all gunicorn workers must share the directory.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'inventory-metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# One JSON line per request (method, route, status, stage and database timings)
+# is logged at INFO to the 'inventory.requests' logger, which is quiet unless
+# REQUEST_LOG_LEVEL is set to INFO (or lower)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+REQUEST_LOG_LEVEL = os.getenv('REQUEST_LOG_LEVEL', 'WARNING')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'inventory': {'handlers': ['console'], 'level': LOG_LEVEL},
+        'inventory.requests': {'level': REQUEST_LOG_LEVEL},
+    },
+}
@@ -0,0 +1,93 @@
+"""Benchmarks for the inventory backend.
+
+Run them from the ``backend`` directory, e.g. ``python -m benchmarks.ocr``.
+Every benchmark prints a human-readable summary and can also write its
+results as JSON (``--output``) so runs can be compared. ``benchmarks.suite``
+runs the standard set into one report and ``benchmarks.compare`` flags
+regressions between two reports.
+"""
+import json
+import math
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+CAPTURES_DIR = BACKEND_DIR / 'captures'
+
+
+def setup_django():
+    """Configure Django using the project settings."""
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+
+
+def use_temp_database():
+    """Point Django at a fresh, migrated SQLite file (and media dir) in a temp directory.
+
+    Must be called after ``setup_django`` and before anything touches the
+    database. Returns the temporary directory.
+    """
+    import tempfile
+    from django.conf import settings
+    from django.core.management import call_command
+
+    tmp = Path(tempfile.mkdtemp(prefix='inventory-bench-'))
+    settings.DATABASES['default']['NAME'] = str(tmp / 'bench.sqlite3')
+    settings.MEDIA_ROOT = str(tmp / 'media')
+    call_command('migrate', verbosity=0)
+    return tmp
+
+
+def sample_images(directory=None):
+    """Return paths of the files in ``directory`` (default ``captures/``) that PIL can open."""
+    from PIL import Image
+
+    directory = Path(directory) if directory else CAPTURES_DIR
+    paths = []
+    for path in sorted(directory.iterdir()):
+        if not path.is_file():
+            continue
+        try:
+            with Image.open(path) as img:
+                img.verify()
+        except Exception:
+            continue
+        paths.append(path)
+    return paths
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (``pct`` in 0..100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(seconds):
+    """Summarize a list of durations (seconds) as milliseconds."""
+    if not seconds:
+        return {'n': 0}
+    ms = [s * 1000 for s in seconds]
+    return {
+        'n': len(ms),
+        'mean_ms': round(sum(ms) / len(ms), 3),
+        'min_ms': round(min(ms), 3),
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'max_ms': round(max(ms), 3),
+    }
+
+
+def write_report(report, output=None):
+    """Print ``report`` as JSON and optionally save it to ``output``."""
+    text = json.dumps(report, indent=2, default=str)
+    if output:
+        Path(output).write_text(text + '\n')
+    print(text)
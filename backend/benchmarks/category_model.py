@@ -0,0 +1,97 @@
+"""Local category classifier: training time, accuracy and prediction latency.
+
+    python -m benchmarks.category_model [--examples 20000] [--predict 5000] [--seed 1]
+                                        [--output results.json]
+
+Trains ``CategoryClassifier`` on synthetic captures (a brand, a product word
+that determines the category, a variant and a short description; 10% of
+the names have a misread character) and reports holdout accuracy, the
+latency of single predictions and the throughput of batch predictions as
+used by ``recategorize``. Also prints how much shorter the prompt is when
+``CATEGORY_CLASSIFIER=replace`` drops the category list.
+"""
+import argparse
+import random
+import time
+
+from . import setup_django, summarize, write_report
+from .product_index import SYLLABLES, VARIANTS, typo
+
+PRODUCTS = {
+    'Food': ['sardines', 'corned beef', 'noodles', 'biscuits', 'crackers', 'ketchup', 'chips', 'tuna'],
+    'Drinks': ['juice', 'soda', 'cola', 'iced tea', 'mineral water', 'energy drink'],
+    'Medicine': ['paracetamol', 'ibuprofen', 'cough syrup', 'antacid', 'vitamin c'],
+    'Hygiene': ['shampoo', 'toothpaste', 'soap', 'deodorant', 'sanitary pads'],
+    'Cleaning Supplies': ['detergent', 'bleach', 'dishwashing liquid', 'fabric conditioner'],
+    'Insecticide': ['mosquito coil', 'insect spray', 'ant killer'],
+    'School Supplies': ['notebook', 'pencil', 'crayons', 'ballpen'],
+    'Tobacco': ['cigarettes', 'menthol cigarettes'],
+    'Alcohol': ['beer', 'gin', 'rum', 'brandy'],
+    'Frozen Goods': ['hotdog', 'chicken nuggets', 'frozen tocino', 'ice cream'],
+    'Bread & Pastries': ['pandesal', 'loaf bread', 'ensaymada', 'cupcake'],
+    'Baby Products': ['diapers', 'baby wipes', 'infant formula'],
+    'Rice & Grains': ['jasmine rice', 'brown rice', 'oats', 'corn grits'],
+}
+DESCRIPTIONS = ['{p} in a sealed pack', 'best-selling {p}', '{p}, retail size', 'sari-sari store {p}']
+
+
+def make_examples(n, rng):
+    brands = [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title() for _ in range(300)]
+    texts, labels = [], []
+    for _ in range(n):
+        category = rng.choice(list(PRODUCTS))
+        product = rng.choice(PRODUCTS[category])
+        name = f'{rng.choice(brands)} {product} {rng.choice(VARIANTS)}'.title()
+        if rng.random() < 0.1:
+            name = typo(name, rng)
+        texts.append(f'{name} {rng.choice(DESCRIPTIONS).format(p=product)}')
+        labels.append(category)
+    return texts, labels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--examples', type=int, default=20000, help='Synthetic training examples')
+    parser.add_argument('--predict', type=int, default=5000, help='Texts predicted one at a time and in batch')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from inventory.categories import CategoryClassifier
+    from inventory.extraction import CATEGORY_FIELD, USER_PROMPT
+
+    rng = random.Random(args.seed)
+    texts, labels = make_examples(args.examples, rng)
+    test_texts, test_labels = make_examples(args.predict, rng)
+    report = {'examples': args.examples, 'predict': args.predict}
+
+    start = time.perf_counter()
+    model = CategoryClassifier.train(texts, labels, seed=args.seed)
+    report['train_s'] = round(time.perf_counter() - start, 3)
+    report['features'] = len(model.vocabulary)
+
+    timings, predicted = [], []
+    for text in test_texts:
+        start = time.perf_counter()
+        predicted.append(model.predict([text])[0][0])
+        timings.append(time.perf_counter() - start)
+    report['single'] = summarize(timings)
+    report['single']['p50_us'] = round(report['single']['p50_ms'] * 1000, 1)
+    report['holdout_accuracy'] = round(sum(p == t for p, t in zip(predicted, test_labels)) / len(test_labels), 4)
+
+    start = time.perf_counter()
+    for i in range(0, len(test_texts), 2000):
+        model.predict(test_texts[i:i + 2000])
+    elapsed = time.perf_counter() - start
+    report['batch_per_s'] = round(len(test_texts) / elapsed)
+
+    full = USER_PROMPT.format(ocr_text='', category_field=CATEGORY_FIELD)
+    short = USER_PROMPT.format(ocr_text='', category_field='')
+    report['prompt_chars'] = {'with_categories': len(full), 'replace_mode': len(short)}
+
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
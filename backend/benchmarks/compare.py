@@ -0,0 +1,90 @@
+"""Compare two benchmark reports and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 0.2] [--min-ms 1.0]
+
+Works with the report of any single benchmark or of ``benchmarks.suite``.
+Both reports are flattened into paths such as
+``results.reads.results[rows=100000].export_all.p95_ms``. Entries in a
+result list are keyed by their ``rows`` when they have one, so reports
+with different sizes still line up. Latencies (``mean_ms`` and
+``p50_ms``/``p95_ms``/``p99_ms``) that grew by more than ``threshold`` (and
+by at least ``min_ms``) are regressions. So are memory peaks
+(``peak_mb_per_capture``) that grew and throughputs (``*_per_s``,
+``*_per_sec``, ``*_rps``) that fell by more than ``threshold``. Prints
+every compared metric and exits with status 1 if anything regressed.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+LATENCY_KEYS = ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms')
+MEMORY_KEYS = ('peak_mb_per_capture',)
+THROUGHPUT_SUFFIXES = ('_per_s', '_per_sec', '_rps')
+
+
+def flatten(value, prefix=''):
+    """Map every numeric leaf of a report to its dotted path."""
+    flat = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flat.update(flatten(item, f'{prefix}.{key}' if prefix else key))
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            label = f"rows={item['rows']}" if isinstance(item, dict) and 'rows' in item else i
+            flat.update(flatten(item, f'{prefix}[{label}]'))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        flat[prefix] = value
+    return flat
+
+
+def direction(path):
+    """+1 if a higher value is worse (latency, memory), -1 if lower is worse (throughput), else 0."""
+    key = path.rsplit('.', 1)[-1]
+    if key in LATENCY_KEYS or key in MEMORY_KEYS:
+        return 1
+    if key.endswith(THROUGHPUT_SUFFIXES):
+        return -1
+    return 0
+
+
+def compare(baseline, candidate, threshold=0.2, min_ms=1.0):
+    """Return one row per metric present in both reports: ``(path, old, new, change, regressed)``."""
+    old, new = flatten(baseline), flatten(candidate)
+    rows = []
+    for path in sorted(old.keys() & new.keys()):
+        sign = direction(path)
+        if not sign or not old[path]:
+            continue
+        change = (new[path] - old[path]) / old[path]
+        regressed = sign * change > threshold
+        if regressed and path.rsplit('.', 1)[-1] in LATENCY_KEYS and new[path] - old[path] < min_ms:
+            regressed = False  # a sub-millisecond wobble is noise, not a regression
+        rows.append((path, old[path], new[path], change, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative change (0.2 = 20%%)')
+    parser.add_argument('--min-ms', type=float, default=1.0, help='Ignore latency increases smaller than this')
+    args = parser.parse_args(argv)
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    candidate = json.loads(Path(args.candidate).read_text())
+    rows = compare(baseline, candidate, args.threshold, args.min_ms)
+
+    width = max((len(path) for path, *_ in rows), default=10)
+    for path, old, new, change, regressed in rows:
+        flag = 'REGRESSED' if regressed else ''
+        print(f'{path:<{width}}  {old:>12.3f}  {new:>12.3f}  {change:>+8.1%}  {flag}')
+    regressions = [row for row in rows if row[-1]]
+    print(f'\n{len(rows)} metrics compared, {len(regressions)} regressed (threshold {args.threshold:.0%})')
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
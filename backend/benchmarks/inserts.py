@@ -0,0 +1,83 @@
+"""Compare row-by-row inserts with the bulk persistence layer.
+
+    python -m benchmarks.inserts [--sizes 10,100,1000] [--output results.json]
+
+Runs against a temporary file-backed SQLite database so every commit pays
+its real fsync cost. For each session size the same payload (validated by
+``ProductCaptureSerializer``, all rows sharing one uploaded image) is saved
+twice:
+
+- ``row_by_row``: one ``serializer.create`` per item in autocommit mode,
+  which is how ``SaveSessionView`` and the extraction loop used to insert;
+- ``bulk``: ``ProductCaptureSerializer(many=True).save()``, i.e. one
+  ``bulk_create`` in a single transaction.
+"""
+import argparse
+import io
+import time
+
+from . import setup_django, use_temp_database, write_report
+
+
+def make_payload(n, image_bytes):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    return [
+        {
+            'image': SimpleUploadedFile(f'capture_{i}.jpg', image_bytes, content_type='image/jpeg'),
+            'product_name': f'Product {i}',
+            'unit': '500g',
+            'description': 'benchmark row',
+            'category': 'Food',
+            'confidence': 0.9,
+            'session_id': f'bench-{n}',
+        }
+        for i in range(n)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    use_temp_database()
+    from PIL import Image
+    from inventory.models import ProductCapture
+    from inventory.serializers import ProductCaptureSerializer
+
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 30, 30)).save(buf, 'JPEG')
+    image_bytes = buf.getvalue()
+
+    report = {'benchmark': 'inserts', 'results': []}
+    for n in [int(x) for x in args.sizes.split(',')]:
+        row = {'rows': n}
+
+        serializer = ProductCaptureSerializer(data=make_payload(n, image_bytes), many=True)
+        serializer.is_valid(raise_exception=True)
+        start = time.perf_counter()
+        for attrs in serializer.validated_data:
+            ProductCaptureSerializer().create(dict(attrs))
+        elapsed = time.perf_counter() - start
+        row['row_by_row'] = {'seconds': round(elapsed, 4), 'inserts_per_sec': round(n / elapsed, 1)}
+        ProductCapture.objects.all().delete()
+
+        serializer = ProductCaptureSerializer(data=make_payload(n, image_bytes), many=True)
+        serializer.is_valid(raise_exception=True)
+        start = time.perf_counter()
+        serializer.save()
+        elapsed = time.perf_counter() - start
+        row['bulk'] = {'seconds': round(elapsed, 4), 'inserts_per_sec': round(n / elapsed, 1)}
+        ProductCapture.objects.all().delete()
+
+        row['speedup'] = round(row['row_by_row']['seconds'] / row['bulk']['seconds'], 1)
+        report['results'].append(row)
+
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Concurrent-capture load test: sync WSGI worker vs async ASGI worker.
+
+    python -m benchmarks.loadtest [--mode both] [--workers 1] [--concurrency 32]
+                                  [--requests 128] [--latency 1.0] [--items 2]
+                                  [--replay [DIR]] [--output results.json]
+
+Starts the stub model API (``benchmarks/stub_openai.py``) with ``latency``
+seconds per response and ``items`` products per answer, then for each mode
+launches a server on a fresh SQLite database, ``gunicorn`` (sync workers)
+for ``wsgi`` and ``uvicorn`` for ``asgi``, and fires ``requests``
+extraction uploads from ``concurrency`` client threads. ``peak_model_calls``
+is the most model requests the stub saw at once, i.e. how many captures
+one server kept in flight.
+
+By default every upload is the same synthetic photo. ``--replay`` cycles
+through the sample images in ``captures/`` (or ``DIR``) instead, so
+decoding and normalization see real photo sizes.
+
+OCR is off by default so the numbers isolate the model wait; pass
+``--ocr parallel`` to include Tesseract.
+"""
+import argparse
+import io
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from . import BACKEND_DIR, CAPTURES_DIR, sample_images, summarize, write_report
+from .stub_openai import StubServer, canned_content
+
+SETTINGS_TEMPLATE = """from backend.settings import *  # noqa
+
+DATABASES['default']['NAME'] = {db!r}
+MEDIA_ROOT = {media!r}
+DEBUG = False
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def sample_upload():
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new('RGB', (960, 720), (180, 40, 40)).save(buf, 'JPEG', quality=85)
+    return buf.getvalue()
+
+
+def server_command(mode, port, workers, threads=1):
+    if mode == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', 'backend.asgi:application', '--host', '127.0.0.1',
+                '--port', str(port), '--workers', str(workers), '--log-level', 'warning']
+    return [sys.executable, '-m', 'gunicorn', 'backend.wsgi:application', '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers), '--threads', str(threads), '--timeout', '120', '--log-level', 'warning']
+
+
+def start_server(mode, workers, stub, tmp, threads=1):
+    """Migrate a fresh database and start the server; returns (process, base_url)."""
+    (tmp / 'bench_settings.py').write_text(SETTINGS_TEMPLATE.format(
+        db=str(tmp / f'{mode}.sqlite3'), media=str(tmp / 'media')))
+    env = dict(os.environ)
+    env.pop('EXTRACTION_ASYNC_VIEW', None)  # asgi.py enables it for the ASGI run
+    env.update({
+        'PYTHONPATH': os.pathsep.join([str(tmp), str(BACKEND_DIR)]),
+        'DJANGO_SETTINGS_MODULE': 'bench_settings',
+        'OPENAI_BASE_URL': stub.base_url,
+        'OPENAI_API_KEY': env.get('OPENAI_API_KEY') or 'stub',
+        'CAPTURE_CACHE_ENABLED': 'False',
+        'LOG_LEVEL': 'WARNING',  # no per-request log lines
+    })
+    subprocess.run([sys.executable, 'manage.py', 'migrate', '--no-input', '-v', '0'],
+                   cwd=BACKEND_DIR, env=env, check=True)
+
+    port = free_port()
+    proc = subprocess.Popen(server_command(mode, port, workers, threads), cwd=BACKEND_DIR, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{base_url}/api/health/', timeout=1).ok:
+                return proc, base_url
+        except requests.RequestException:
+            pass
+        if proc.poll() is not None:
+            raise RuntimeError(f'{mode} server exited with code {proc.returncode}')
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f'{mode} server did not become ready')
+
+
+def run_load(base_url, uploads, total, concurrency, ocr):
+    """POST ``total`` extractions, cycling through ``uploads`` (a list of image bytes)."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+
+    def one(i):
+        start = time.perf_counter()
+        response = session.post(
+            f'{base_url}/api/product/extract/',
+            data={'session_id': 'loadtest', 'ocr': ocr, 'cache': '0'},
+            files={'image': (f'{i}.jpg', uploads[i % len(uploads)], 'application/octet-stream')},
+            timeout=300,
+        )
+        return time.perf_counter() - start, response.status_code, response.text[:300]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    timings = [t for t, status, _ in results if status == 200]
+    errors = [(status, body) for _, status, body in results if status != 200]
+    report = summarize(timings)
+    report['errors'] = len(errors)
+    if errors:
+        report['first_error'] = errors[0]
+    report['elapsed_s'] = round(elapsed, 3)
+    report['throughput_rps'] = round(len(timings) / elapsed, 2)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('wsgi', 'asgi', 'both'), default='both')
+    parser.add_argument('--workers', type=int, default=1, help='Server worker processes')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client uploads')
+    parser.add_argument('--requests', type=int, default=128, help='Total uploads per mode')
+    parser.add_argument('--latency', type=float, default=1.0, help='Stub model latency (seconds)')
+    parser.add_argument('--ocr', default='off', help='ocr form field sent with each upload')
+    parser.add_argument('--items', type=int, default=2, help='Products in each stub answer')
+    parser.add_argument('--replay', nargs='?', const=str(CAPTURES_DIR), metavar='DIR',
+                        help='Upload the sample images in DIR (default captures/) instead of one synthetic photo')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    modes = ('wsgi', 'asgi') if args.mode == 'both' else (args.mode,)
+    if args.replay:
+        uploads = [path.read_bytes() for path in sample_images(args.replay)]
+        if not uploads:
+            parser.error(f'No images found in {args.replay}')
+    else:
+        uploads = [sample_upload()]
+    report = {key: getattr(args, key) for key in ('workers', 'concurrency', 'requests', 'latency', 'ocr', 'items')}
+    report['images'] = len(uploads)
+    tmp = Path(tempfile.mkdtemp(prefix='inventory-loadtest-'))
+    with StubServer(latency=args.latency, content=canned_content(args.items)) as stub:
+        for mode in modes:
+            proc, base_url = start_server(mode, args.workers, stub, tmp)
+            try:
+                stub.peak_active = 0
+                report[mode] = run_load(base_url, uploads, args.requests, args.concurrency, args.ocr)
+                report[mode]['peak_model_calls'] = stub.peak_active
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Compare a client per call with the shared model client, against the local stub API.
+
+    python -m benchmarks.model_client [--calls 50] [--latency 0.05] [--output results.json]
+
+Reports per-call latency and how many TCP connections the stub saw for
+each strategy, then measures how quickly calls fail once the stub starts
+answering 503 and the circuit breaker opens.
+"""
+import argparse
+import time
+
+from . import setup_django, summarize, write_report
+from .stub_openai import StubServer
+
+MESSAGES = [{'role': 'user', 'content': 'ping'}]
+
+
+def bench_per_call_client(stub, calls):
+    from django.conf import settings
+    from openai import OpenAI
+
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        client = OpenAI(api_key=settings.OPENAI_API_KEY or 'stub', base_url=stub.base_url)
+        client.chat.completions.create(model=settings.OPENAI_MODEL, messages=MESSAGES, max_tokens=300)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_shared_client(calls):
+    from inventory import llm
+
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        llm.chat_completion(MESSAGES)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_outage(stub, calls):
+    """Time calls while the stub returns 503; returns (timings, fast_failures)."""
+    from inventory import llm
+
+    stub.status = 503
+    timings, fast = [], 0
+    for _ in range(calls):
+        breaker_open = llm.get_breaker().state == llm.CircuitBreaker.OPEN
+        start = time.perf_counter()
+        try:
+            llm.chat_completion(MESSAGES)
+        except llm.ModelUnavailable:
+            pass
+        timings.append(time.perf_counter() - start)
+        fast += breaker_open
+    stub.status = None
+    return timings, fast
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub response time (seconds)')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+    from inventory import llm
+
+    report = {'calls': args.calls, 'stub_latency_s': args.latency}
+    with StubServer(latency=args.latency) as stub:
+        settings.OPENAI_BASE_URL = stub.base_url
+        settings.OPENAI_API_KEY = settings.OPENAI_API_KEY or 'stub'
+        settings.OPENAI_RETRY_BACKOFF = 0.01
+        llm.reset()
+
+        before = stub.connections
+        report['per_call_client'] = summarize(bench_per_call_client(stub, args.calls))
+        report['per_call_client']['connections'] = stub.connections - before
+
+        before = stub.connections
+        report['shared_client'] = summarize(bench_shared_client(args.calls))
+        report['shared_client']['connections'] = stub.connections - before
+
+        timings, fast = bench_outage(stub, args.calls)
+        report['outage'] = summarize(timings)
+        report['outage']['failed_fast'] = fast
+        report['outage']['upstream_requests'] = stub.requests - 2 * args.calls
+        llm.reset()
+
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
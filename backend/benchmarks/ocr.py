@@ -0,0 +1,80 @@
+"""Compare the OCR backends on the sample images in ``captures/``.
+
+    python -m benchmarks.ocr [--images DIR] [--repeat N] [--output results.json]
+
+Images are decoded once up front so only the OCR call is timed. The first
+call of each backend is reported separately because it includes engine
+start-up (loading the language model).
+"""
+import argparse
+import time
+
+from . import sample_images, setup_django, summarize, write_report
+
+
+def bench_backend(backend, images, repeat):
+    start = time.perf_counter()
+    backend.image_to_string(images[0])
+    cold = time.perf_counter() - start
+
+    timings = []
+    total_start = time.perf_counter()
+    for _ in range(repeat):
+        for img in images:
+            start = time.perf_counter()
+            backend.image_to_string(img)
+            timings.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - total_start
+
+    result = summarize(timings)
+    result['first_call_ms'] = round(cold * 1000, 3)
+    result['images_per_sec'] = round(len(timings) / elapsed, 2) if elapsed else None
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', help='Directory of sample images (default: captures/)')
+    parser.add_argument('--repeat', type=int, default=1, help='Passes over the image set')
+    parser.add_argument('--backends', default='pytesseract,tesserocr')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from PIL import Image
+    from inventory.ocr import PytesseractBackend, TesserocrPoolBackend
+    from django.conf import settings
+
+    paths = sample_images(args.images)
+    if not paths:
+        parser.error('No readable images found')
+    images = []
+    for path in paths:
+        with Image.open(path) as img:
+            images.append(img.convert('RGB'))
+
+    report = {'benchmark': 'ocr', 'images': len(images), 'repeat': args.repeat, 'backends': {}}
+    for name in args.backends.split(','):
+        name = name.strip()
+        try:
+            if name == 'tesserocr':
+                backend = TesserocrPoolBackend(size=1, lang=settings.OCR_LANG,
+                                               path=settings.OCR_TESSDATA_PATH)
+            else:
+                backend = PytesseractBackend(lang=settings.OCR_LANG)
+        except ImportError as e:
+            report['backends'][name] = {'skipped': str(e)}
+            continue
+        report['backends'][name] = bench_backend(backend, images, args.repeat)
+        if hasattr(backend, 'close'):
+            backend.close()
+
+    subprocess_run = report['backends'].get('pytesseract', {})
+    pooled_run = report['backends'].get('tesserocr', {})
+    if 'mean_ms' in subprocess_run and 'mean_ms' in pooled_run:
+        report['tesserocr_speedup'] = round(subprocess_run['mean_ms'] / pooled_run['mean_ms'], 2)
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Report the byte and latency savings of ingest-time image normalization.
+
+    python -m benchmarks.preprocess [--images DIR] [--uplink-mbps 10] [--ocr] [--output results.json]
+
+For each sample image it compares the raw upload with the normalized
+re-encode sent to the model (and stored): encoded size, base64 payload
+size, estimated upload time to the model API at ``--uplink-mbps`` and the
+CPU time spent normalizing. With ``--ocr`` it also times Tesseract on the
+original image versus the downscaled, binarized OCR variant.
+"""
+import argparse
+import base64
+import io
+import time
+
+from . import sample_images, setup_django, summarize, write_report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', help='Directory of sample images (default: captures/)')
+    parser.add_argument('--uplink-mbps', type=float, default=10.0,
+                        help='Bandwidth used to estimate payload transfer time')
+    parser.add_argument('--ocr', action='store_true', help='Also time OCR on original vs normalized images')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from PIL import Image
+    from django.conf import settings
+    from inventory.imaging import prepare_image
+    from inventory.ocr import get_ocr_backend
+
+    paths = sample_images(args.images)
+    if not paths:
+        parser.error('No readable images found')
+
+    bytes_per_sec = args.uplink_mbps * 1_000_000 / 8
+    totals = {'original_bytes': 0, 'normalized_bytes': 0, 'original_b64': 0, 'normalized_b64': 0}
+    prepare_times, ocr_original, ocr_normalized = [], [], []
+    per_image = []
+    for path in paths:
+        data = path.read_bytes()
+        start = time.perf_counter()
+        prepared = prepare_image(data)
+        prepare_times.append(time.perf_counter() - start)
+
+        original_b64 = len(base64.b64encode(data))
+        normalized_b64 = len(base64.b64encode(prepared.model_bytes))
+        totals['original_bytes'] += len(data)
+        totals['normalized_bytes'] += len(prepared.model_bytes)
+        totals['original_b64'] += original_b64
+        totals['normalized_b64'] += normalized_b64
+        with Image.open(io.BytesIO(data)) as img:
+            original_size = img.size
+        per_image.append({
+            'image': path.name,
+            'original_px': list(original_size),
+            'normalized_px': list(prepared.image.size),
+            'original_bytes': len(data),
+            'normalized_bytes': len(prepared.model_bytes),
+        })
+
+        if args.ocr:
+            backend = get_ocr_backend()
+            with Image.open(io.BytesIO(data)) as img:
+                original = img.convert('RGB')
+            start = time.perf_counter()
+            backend.image_to_string(original)
+            ocr_original.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            backend.image_to_string(prepared.ocr_image)
+            ocr_normalized.append(time.perf_counter() - start)
+
+    n = len(paths)
+    report = {
+        'benchmark': 'preprocess',
+        'images': n,
+        'settings': {
+            'IMAGE_MAX_EDGE': settings.IMAGE_MAX_EDGE,
+            'IMAGE_FORMAT': settings.IMAGE_FORMAT,
+            'IMAGE_QUALITY': settings.IMAGE_QUALITY,
+        },
+        'bytes': {
+            **totals,
+            'saved_pct': round(100 * (1 - totals['normalized_bytes'] / totals['original_bytes']), 1),
+        },
+        'upload_ms_per_image': {
+            'uplink_mbps': args.uplink_mbps,
+            'original': round(totals['original_b64'] / n / bytes_per_sec * 1000, 1),
+            'normalized': round(totals['normalized_b64'] / n / bytes_per_sec * 1000, 1),
+        },
+        'prepare': summarize(prepare_times),
+        'per_image': per_image,
+    }
+    if args.ocr:
+        report['ocr'] = {'original': summarize(ocr_original), 'normalized': summarize(ocr_normalized)}
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Fuzzy product index: build time and match latency on a synthetic catalog.
+
+    python -m benchmarks.product_index [--products 100000] [--queries 2000] [--seed 1]
+                                       [--output results.json]
+
+Generates ``products`` distinct names (brand + product words + variant, with
+a unit), builds the index, saves and reloads a snapshot, then times two
+kinds of lookups:
+
+- ``canonical``: a known name with one or two typos (``ProductIndex.best``),
+- ``ocr``: label-like OCR text, a known name with a misread character among
+  unrelated lines (``ProductIndex.contained``), plus text about unknown
+  products to count false matches.
+"""
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+from . import setup_django, summarize, write_report
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'to', 'ne', 'su', 'pa', 'ri', 'co', 'la', 've', 'do', 'ma',
+             'ni', 'ko', 'te', 'bu', 'sa', 'fi', 'zo', 'gu', 'he', 'ja']
+# Brands of the "unknown products" labels are built from other syllables
+OTHER_SYLLABLES = ['xe', 'qui', 'wy', 'yo', 'ek', 'ux', 'ib', 'oz']
+PRODUCT_WORDS = ['milk', 'coffee', 'noodles', 'sardines', 'soap', 'shampoo', 'detergent', 'biscuits',
+                 'crackers', 'juice', 'soda', 'water', 'rice', 'sugar', 'vinegar', 'soy sauce',
+                 'corned beef', 'tuna', 'bread', 'cheese', 'butter', 'toothpaste', 'diapers',
+                 'candles', 'batteries', 'matches', 'cooking oil', 'ketchup', 'chips', 'chocolate']
+VARIANTS = ['original', 'spicy', 'classic', 'light', 'extra', 'family pack', 'lemon', 'chili',
+            'sweet', 'strawberry', 'garlic', 'cheddar', 'mild', 'double', 'mini', 'jumbo']
+UNITS = ['100g', '155g', '250g', '500g', '1kg', '330ml', '500ml', '1L', '1.5L', '2L', '12pcs', '24pcs']
+NOISE = ['ingredients', 'net weight', 'best before', 'manufactured by', 'distributed by', 'store in',
+         'a cool dry place', 'nutrition facts', 'serving size', 'calories', 'batch no', 'made in']
+
+
+def make_products(n, rng, syllables=SYLLABLES):
+    brands = set()
+    while len(brands) < max(50, n // 200):
+        brands.add(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).title())
+    brands = sorted(brands)
+    seen, products = set(), []
+    while len(products) < n:
+        name = f'{rng.choice(brands)} {rng.choice(PRODUCT_WORDS)} {rng.choice(VARIANTS)}'.title()
+        unit = rng.choice(UNITS)
+        if (name, unit) in seen:
+            continue
+        seen.add((name, unit))
+        products.append((name, unit, 'Food'))
+    return products
+
+
+def typo(text, rng, count=1):
+    chars = list(text)
+    for _ in range(count):
+        pos = rng.randrange(len(chars))
+        if chars[pos].isalpha():
+            chars[pos] = rng.choice(string.ascii_lowercase)
+    return ''.join(chars)
+
+
+def ocr_text(name, unit, rng):
+    lines = [' '.join(rng.sample(NOISE, 3)) for _ in range(3)]
+    lines.insert(rng.randrange(len(lines) + 1), typo(f'{name} {unit}'.upper(), rng))
+    return '\n'.join(lines)
+
+
+def timed(fn, queries):
+    timings, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        timings.append(time.perf_counter() - start)
+    return timings, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+    from inventory.product_index import ProductIndex, entry_text
+
+    rng = random.Random(args.seed)
+    products = make_products(args.products, rng)
+    report = {'products': args.products, 'queries': args.queries}
+
+    start = time.perf_counter()
+    index = ProductIndex.build(products)
+    report['build_s'] = round(time.perf_counter() - start, 3)
+    report['trigrams'] = len(index.postings)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'product_index.pkl')
+        index.save(path)
+        report['snapshot_mb'] = round(os.path.getsize(path) / 1e6, 2)
+        start = time.perf_counter()
+        index = ProductIndex.load(path)
+        report['load_s'] = round(time.perf_counter() - start, 3)
+
+    targets = rng.sample(products, args.queries)
+
+    queries = [(typo(name, rng, rng.randint(1, 2)), unit) for name, unit, _ in targets]
+    timings, results = timed(
+        lambda q: index.best(entry_text(*q), settings.PRODUCT_INDEX_CANONICAL_THRESHOLD), queries)
+    correct = sum(1 for r, (name, unit, _) in zip(results, targets)
+                  if r is not None and (r.product_name, r.unit) == (name, unit))
+    report['canonical'] = summarize(timings)
+    report['canonical']['matched'] = round(sum(r is not None for r in results) / len(targets), 3)
+    report['canonical']['correct'] = round(correct / len(targets), 3)
+
+    def contained(text):
+        return index.contained(text, settings.PRODUCT_INDEX_OCR_THRESHOLD, settings.PRODUCT_INDEX_MIN_TRIGRAMS)
+
+    queries = [ocr_text(name, unit, rng) for name, unit, _ in targets]
+    timings, results = timed(contained, queries)
+    correct = sum(1 for r, (name, unit, _) in zip(results, targets)
+                  if r is not None and (r.product_name, r.unit) == (name, unit))
+    report['ocr'] = summarize(timings)
+    report['ocr']['matched'] = round(sum(r is not None for r in results) / len(targets), 3)
+    report['ocr']['correct'] = round(correct / len(targets), 3)
+
+    # Labels of products that are not in the index should not match anything
+    unknown = make_products(args.queries, random.Random(args.seed), OTHER_SYLLABLES)
+    queries = [ocr_text(name, unit, rng) for name, unit, _ in unknown]
+    timings, results = timed(contained, queries)
+    report['ocr_unknown'] = summarize(timings)
+    report['ocr_unknown']['false_matches'] = round(sum(r is not None for r in results) / len(unknown), 3)
+
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Read endpoints (export, session list, session products) on synthetic datasets.
+
+    python -m benchmarks.reads [--sizes 10000,100000] [--sessions 1000] [--repeat 50]
+                               [--export-all-repeat 3] [--seed 1] [--output results.json]
+
+For each size a fresh SQLite database is filled with that many captures
+spread over ``sessions`` sessions (created over the last 90 days, mixed
+categories and confidences) and the Session summaries are rebuilt. Then
+the endpoints are requested in-process through the Django test client,
+``repeat`` times each (the whole-table export only ``--export-all-repeat``
+times):
+
+- ``sessions``: ``/api/sessions/`` (every session) and its first page,
+- ``session_products``: one session's captures, in full, as a first page
+  and as a page deep in the session (from a cursor),
+- ``export_session``: ``/api/export/csv/`` for one session, plain and
+  gzipped,
+- ``export_all``: ``/api/export/csv/?all=1``, the whole table,
+- ``*_revalidate``: the session list and a session's captures requested
+  with the ``If-None-Match`` of an earlier response (a 304).
+
+The list endpoints cache serialized payloads of up to
+``READ_CACHE_MAX_ROWS`` rows, so after the warmup request their timings
+are those of a cache hit; run with ``READ_CACHE_ENABLED=0`` to time the
+query and serialization.
+
+Each entry reports p50/p95/p99 latency and requests per second. The
+exports also report rows and megabytes per second. ``--sizes`` goes up
+to 1M rows, which takes a minute or two to generate.
+"""
+import argparse
+import logging
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from . import setup_django, summarize, use_temp_database, write_report
+
+NAMES = ['Coca Cola', 'Lucky Me Pancit Canton', 'Bear Brand', 'Nescafe Classic', 'Safeguard Soap',
+         'Palmolive Shampoo', 'Surf Powder', 'Century Tuna', 'Argentina Corned Beef', 'Skyflakes']
+UNITS = ['1L', '60g', '320g', '50g', '135g', '180ml', '1kg', '155g', '150g', '250g']
+
+
+def populate(rows, sessions, seed=1, batch_size=5000):
+    """Insert ``rows`` synthetic captures with raw batched inserts and rebuild the Session rows."""
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from inventory import session_summary
+    from inventory.categories import CATEGORIES
+    from inventory.models import ProductCapture
+
+    rng = random.Random(seed)
+    fields = ProductCapture._meta.concrete_fields
+    table = connection.ops.quote_name(ProductCapture._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(f.column) for f in fields)
+    sql = f'INSERT INTO {table} ({columns}) VALUES ({", ".join(["%s"] * len(fields))})'
+    now = timezone.now()
+    span = 90 * 24 * 3600
+
+    def row(i):
+        k = rng.randrange(len(NAMES))
+        values = {
+            'id': uuid.UUID(int=rng.getrandbits(128), version=4),
+            'image': 'captures/benchmark.jpg',
+            'product_name': f'{NAMES[k]} {i % 97}',
+            'unit': UNITS[k],
+            'description': 'synthetic benchmark capture',
+            'category': rng.choice(CATEGORIES),
+            'confidence': round(rng.uniform(0.3, 1.0), 3),
+            'created_at': now - timedelta(seconds=rng.randrange(span)),
+            'session_id': f'session-{i % sessions}',
+            'barcode': '',
+        }
+        return [f.get_db_prep_save(values[f.attname] if f.attname in values else f.get_default(), connection)
+                for f in fields]
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, rows, batch_size):
+            cursor.executemany(sql, [row(i) for i in range(start, min(rows, start + batch_size))])
+    session_summary.rebuild()
+
+
+def timed_requests(client, url, repeat, warmup=1, expect=200, **headers):
+    """GET ``url`` ``repeat`` times (after ``warmup`` untimed requests); returns the summary and size."""
+    timings = []
+    size = 0
+    for _ in range(warmup):
+        response = client.get(url, **headers)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url, **headers)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        timings.append(time.perf_counter() - start)
+        if response.status_code != expect:
+            raise RuntimeError(f'GET {url} returned {response.status_code}')
+    report = summarize(timings)
+    report['requests_per_s'] = round(len(timings) / sum(timings), 2)
+    report['bytes'] = size
+    return report
+
+
+def with_rows(report, rows):
+    seconds = report['mean_ms'] / 1000
+    report['rows'] = rows
+    report['rows_per_s'] = round(rows / seconds)
+    report['mb_per_s'] = round(report['bytes'] / 1e6 / seconds, 2)
+    return report
+
+
+def run_size(rows, sessions, repeat, export_all_repeat, seed):
+    from django.test import Client
+    from inventory.models import ProductCapture, Session
+    from inventory.pagination import encode_cursor
+
+    start = time.perf_counter()
+    populate(rows, sessions, seed)
+    result = {'rows': rows, 'sessions': sessions, 'populate_s': round(time.perf_counter() - start, 2)}
+
+    client = Client()
+    session = Session.objects.order_by('-count').first()
+    session_rows = session.count
+    base = f'/api/session/products/?session_id={session.session_id}'
+    # A cursor halfway through the session, as a client paging deep would send
+    middle = (ProductCapture.objects.filter(session_id=session.session_id)
+              .order_by('-created_at', '-id')[session_rows // 2])
+    deep = f'{base}&limit=50&cursor={encode_cursor(middle.created_at, middle.id)}'
+
+    result['sessions_all'] = timed_requests(client, '/api/sessions/', repeat)
+    result['sessions_page'] = timed_requests(client, '/api/sessions/?limit=50', repeat)
+    result['session_products'] = timed_requests(client, base, repeat)
+    result['session_products']['rows'] = session_rows
+    result['session_products_page'] = timed_requests(client, f'{base}&limit=50', repeat)
+    result['session_products_deep_page'] = timed_requests(client, deep, repeat)
+    for name, url in (('sessions_revalidate', '/api/sessions/'), ('session_products_revalidate', base)):
+        result[name] = timed_requests(client, url, repeat, expect=304,
+                                      HTTP_IF_NONE_MATCH=client.get(url)['ETag'])
+    export = f'/api/export/csv/?session_id={session.session_id}'
+    result['export_session'] = with_rows(timed_requests(client, export, repeat), session_rows)
+    result['export_session_gzip'] = with_rows(timed_requests(client, f'{export}&gzip=1', repeat), session_rows)
+    result['export_all'] = with_rows(timed_requests(client, '/api/export/csv/?all=1', export_all_repeat, warmup=0), rows)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000', help='Comma-separated capture counts (up to 1000000)')
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50, help='Requests per endpoint')
+    parser.add_argument('--export-all-repeat', type=int, default=3, help='Requests of the whole-table export')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()  # lets the test client's "testserver" host through
+    settings.DEBUG = False  # no per-query logging
+    logging.getLogger('inventory.requests').setLevel(logging.WARNING)
+    report = {'benchmark': 'reads', 'results': []}
+    for rows in [int(x) for x in args.sizes.split(',')]:
+        connection.close()
+        use_temp_database()
+        report['results'].append(run_size(rows, args.sessions, args.repeat, args.export_all_repeat, args.seed))
+
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
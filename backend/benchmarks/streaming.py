@@ -0,0 +1,81 @@
+"""Time to first item: streamed vs. buffered extraction, against the local stub API.
+
+    python -m benchmarks.streaming [--items 12] [--token-delay 0.02] [--repeat 5]
+                                   [--output results.json]
+
+The stub answers with ``items`` products, one ~4-character chunk every
+``token_delay`` seconds. For the buffered path (``run_extraction``) the
+first item is available only when the whole response is; the streamed path
+(``stream_extraction``) saves and yields each item as soon as it closes.
+"""
+import argparse
+import io
+import json
+import time
+
+from . import setup_django, summarize, use_temp_database, write_report
+from .stub_openai import StubServer
+
+
+def shelf_content(n):
+    return json.dumps([
+        {'product_name': f'Product {i}', 'unit': '500g', 'description': f'Shelf item number {i}',
+         'category': 'Food', 'confidence': 0.8}
+        for i in range(n)
+    ])
+
+
+def sample_upload(seed):
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new('RGB', (640, 480), (seed * 37 % 256, 80, 120)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=12, help='Products in the stubbed answer')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='Seconds per streamed chunk')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    use_temp_database()
+    from django.conf import settings
+    from inventory import llm
+    from inventory.extraction import run_extraction, stream_extraction
+
+    options = {'max_items': args.items, 'ocr_mode': 'off', 'use_cache': False}
+    buffered_first, buffered_total, streamed_first, streamed_total = [], [], [], []
+    with StubServer(content=shelf_content(args.items), token_delay=args.token_delay) as stub:
+        settings.OPENAI_BASE_URL = stub.base_url
+        settings.OPENAI_API_KEY = settings.OPENAI_API_KEY or 'stub'
+        llm.reset()
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            run_extraction(sample_upload(i), session_id='bench', **options)
+            elapsed = time.perf_counter() - start
+            buffered_first.append(elapsed)
+            buffered_total.append(elapsed)
+
+            start = time.perf_counter()
+            first = None
+            for event, _ in stream_extraction(sample_upload(i), session_id='bench', **options):
+                if event == 'item' and first is None:
+                    first = time.perf_counter() - start
+            streamed_first.append(first)
+            streamed_total.append(time.perf_counter() - start)
+        llm.reset()
+
+    write_report({
+        'items': args.items,
+        'token_delay_s': args.token_delay,
+        'buffered': {'first_item': summarize(buffered_first), 'total': summarize(buffered_total)},
+        'streamed': {'first_item': summarize(streamed_first), 'total': summarize(streamed_total)},
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+    python -m benchmarks.stub_openai [--port 8999] [--latency 0.3] [--fail-rate 0.2] [--items 2]
+
+Point the backend at it with ``OPENAI_BASE_URL=http://127.0.0.1:8999/v1``.
+Every ``POST /v1/chat/completions`` waits ``latency`` seconds and answers
+with a fixed extraction of ``--items`` products (default two); with
+``fail_rate`` (or while ``status`` is set) it answers with that HTTP error
+instead. Streaming requests get the
+content as server-sent chunks ``token_delay`` seconds apart; non-streamed
+answers wait for the same total generation time. ``StubServer`` can also be
+started in-process from benchmarks and test scripts::
+
+    with StubServer(latency=0.05) as stub:
+        settings.OPENAI_BASE_URL = stub.base_url
+        ...
+        stub.status = 503  # simulate an outage
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_ITEMS = [
+    {'product_name': 'Coca Cola', 'unit': '1L', 'description': 'Soft drink',
+     'category': 'Drinks', 'confidence': 0.9},
+    {'product_name': 'Lucky Me Pancit Canton', 'unit': '60g', 'description': 'Instant noodles',
+     'category': 'Food', 'confidence': 0.85},
+    {'product_name': 'Safeguard Pure White', 'unit': '135g', 'description': 'Bar soap',
+     'category': 'Hygiene', 'confidence': 0.88},
+    {'product_name': 'Century Tuna Flakes in Oil', 'unit': '155g', 'description': 'Canned tuna',
+     'category': 'Food', 'confidence': 0.82},
+    {'product_name': 'Surf Cherry Blossom', 'unit': '1kg', 'description': 'Laundry powder',
+     'category': 'Cleaning Supplies', 'confidence': 0.8},
+    {'product_name': 'Bear Brand Swak', 'unit': '33g', 'description': 'Powdered milk',
+     'category': 'Drinks', 'confidence': 0.86},
+]
+
+
+def canned_content(items=2):
+    """A model answer with ``items`` products (``CANNED_ITEMS`` repeated as needed)."""
+    return json.dumps([CANNED_ITEMS[i % len(CANNED_ITEMS)] for i in range(items)])
+
+
+DEFAULT_CONTENT = canned_content(2)
+
+USAGE = {'prompt_tokens': 100, 'completion_tokens': 50, 'total_tokens': 150}
+
+# Characters per streamed chunk, roughly one model token
+TOKEN_CHARS = 4
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        stub.record(self.client_address)
+        try:
+            self._respond(stub, body)
+        finally:
+            stub.finished()
+
+    def _respond(self, stub, body):
+        if stub.latency:
+            time.sleep(stub.latency)
+        status = stub.status
+        if not status and stub.fail_rate and random.random() < stub.fail_rate:
+            status = 503
+        if status:
+            self._send(status, {'error': {'message': 'stubbed failure', 'type': 'server_error'}})
+            return
+        if body.get('stream'):
+            self._stream(stub, body)
+            return
+        if stub.token_delay:
+            # A non-streamed answer arrives only once the whole text is generated
+            time.sleep(stub.token_delay * math.ceil(len(stub.content) / TOKEN_CHARS))
+        self._send(200, {
+            'id': 'chatcmpl-stub',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'stub'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': stub.content},
+                'finish_reason': 'stop',
+            }],
+            'usage': USAGE,
+        })
+
+    def _stream(self, stub, body):
+        """Answer as server-sent events, ``TOKEN_CHARS`` characters per chunk."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        content = stub.content
+        try:
+            for start in range(0, len(content), TOKEN_CHARS):
+                if stub.token_delay:
+                    time.sleep(stub.token_delay)
+                self._chunk(self._sse_chunk(body, {'content': content[start:start + TOKEN_CHARS]}))
+            self._chunk(self._sse_chunk(body, {}, finish_reason='stop'))
+            if (body.get('stream_options') or {}).get('include_usage'):
+                self._chunk(self._sse_chunk(body, None, usage=USAGE))
+            self._chunk(b'data: [DONE]\n\n')
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading early (e.g. it had enough items)
+            self.close_connection = True
+
+    def _sse_chunk(self, body, delta, finish_reason=None, usage=None):
+        payload = {
+            'id': 'chatcmpl-stub',
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': body.get('model', 'stub'),
+            # The final usage chunk (stream_options.include_usage) has no choices
+            'choices': [] if delta is None else [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+        }
+        if usage is not None:
+            payload['usage'] = usage
+        return f'data: {json.dumps(payload)}\n\n'.encode('utf-8')
+
+    def _chunk(self, data):
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubServer:
+    """Threaded stub API server.
+
+    Counts requests, distinct client connections and the peak number of
+    requests being served at once (``peak_active``).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, fail_rate=0.0, status=None,
+                 content=DEFAULT_CONTENT, token_delay=0.0):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.fail_rate = fail_rate
+        self.status = status
+        self.content = content
+        self.requests = 0
+        self.active = 0
+        self.peak_active = 0
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    @property
+    def connections(self):
+        with self._lock:
+            return len(self._connections)
+
+    def record(self, client_address):
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            self._connections.add(client_address)
+
+    def finished(self):
+        with self._lock:
+            self.active -= 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8999)
+    parser.add_argument('--latency', type=float, default=0.3, help='Seconds per response')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='Seconds between streamed chunks')
+    parser.add_argument('--items', type=int, default=2, help='Products in each answer')
+    args = parser.parse_args(argv)
+
+    stub = StubServer(args.host, args.port, latency=args.latency, fail_rate=args.fail_rate,
+                      content=canned_content(args.items), token_delay=args.token_delay)
+    print(f'Stub OpenAI API listening on {stub.base_url}')
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
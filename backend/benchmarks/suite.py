@@ -0,0 +1,105 @@
+"""Run a fixed set of benchmarks and collect their results in one JSON report.
+
+    python -m benchmarks.suite [--profile quick|full] [--only reads,loadtest]
+                               [--output results.json]
+
+Each benchmark runs in its own process with the arguments of the chosen
+profile. ``quick`` (the default) takes a few minutes and is meant to run
+before every deploy. ``full`` uses the large datasets (reads up to 1M
+rows) and longer load tests. The report records the git commit and Python
+version next to each benchmark's own report, so two runs can be compared
+with ``python -m benchmarks.compare``. A benchmark that fails is recorded
+with its exit code and the tail of its output, and the suite exits non-zero.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import BACKEND_DIR, write_report
+
+PROFILES = {
+    'quick': {
+        'loadtest': ['--mode', 'both', '--requests', '64', '--concurrency', '16', '--latency', '0.2',
+                     '--items', '4', '--replay'],
+        'reads': ['--sizes', '10000,100000', '--repeat', '30'],
+        'inserts': ['--sizes', '10,100,1000'],
+        'streaming': ['--repeat', '3'],
+        'preprocess': [],
+        'upload_memory': ['--concurrency', '1,4', '--rounds', '2'],
+    },
+    'full': {
+        'loadtest': ['--mode', 'both', '--requests', '256', '--concurrency', '32', '--latency', '1.0',
+                     '--items', '4', '--replay'],
+        'reads': ['--sizes', '10000,100000,1000000', '--repeat', '50'],
+        'inserts': ['--sizes', '10,100,1000,10000'],
+        'streaming': ['--repeat', '10'],
+        'preprocess': [],
+        'upload_memory': ['--concurrency', '1,4,8', '--rounds', '3'],
+    },
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(name, args, tmp):
+    """Run ``benchmarks.<name>`` in a subprocess; returns its report (or the failure)."""
+    output = Path(tmp) / f'{name}.json'
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-m', f'benchmarks.{name}', *args, '--output', str(output)],
+                          cwd=BACKEND_DIR, capture_output=True, text=True)
+    elapsed = round(time.perf_counter() - start, 1)
+    if proc.returncode != 0 or not output.exists():
+        return {'error': f'exit code {proc.returncode}', 'output': (proc.stdout + proc.stderr)[-2000:],
+                'elapsed_s': elapsed}
+    report = json.loads(output.read_text())
+    report['elapsed_s'] = elapsed
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick')
+    parser.add_argument('--only', help='Comma-separated benchmarks to run (default: all in the profile)')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    benchmarks = PROFILES[args.profile]
+    names = list(benchmarks)
+    if args.only:
+        names = [name.strip() for name in args.only.split(',') if name.strip()]
+        unknown = [name for name in names if name not in benchmarks]
+        if unknown:
+            parser.error(f"Unknown benchmarks: {', '.join(unknown)}; expected some of {', '.join(benchmarks)}")
+
+    report = {
+        'benchmark': 'suite',
+        'profile': args.profile,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='inventory-suite-') as tmp:
+        for name in names:
+            print(f'Running {name} ...', file=sys.stderr)
+            report['results'][name] = run_benchmark(name, benchmarks[name], tmp)
+
+    write_report(report, args.output)
+    if any('error' in result for result in report['results'].values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
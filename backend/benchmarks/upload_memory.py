@@ -0,0 +1,154 @@
+"""Peak server memory per in-flight capture: multipart uploads vs chunked uploads.
+
+    python -m benchmarks.upload_memory [--concurrency 1,4] [--rounds 3] [--megapixels 12]
+                                       [--chunk-kb 1024] [--latency 0.5] [--output results.json]
+
+Generates a synthetic phone photo of ``megapixels`` and, for each mode,
+starts one gunicorn worker with ``concurrency`` threads against the stub
+model API (``latency`` seconds per answer, so the captures overlap):
+
+- ``multipart``: ``POST /api/product/extract/`` with the photo as a form file,
+- ``chunked``: ``POST /api/uploads/``, ``--chunk-kb`` sized ``PATCH`` chunks
+  and ``POST /api/uploads/<id>/finalize/``.
+
+After two warmup captures of a small photo the worker's peak RSS is reset
+(``clear_refs``), then ``rounds`` times ``concurrency`` captures are sent
+at once. ``peak_mb_per_capture`` is the worker's peak RSS (``VmHWM``)
+above its resident size before the rounds, divided by ``concurrency``.
+Linux only.
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from . import summarize, write_report
+from .loadtest import start_server
+from .stub_openai import StubServer
+
+MODES = ('multipart', 'chunked')
+
+
+def synthetic_photo(megapixels):
+    """A noisy JPEG of about ``megapixels`` (4:3) that compresses like a phone photo."""
+    from PIL import Image
+
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    small = (width // 8, height // 8)
+    noise = Image.merge('RGB', [Image.effect_noise(small, 60 + 20 * i) for i in range(3)])
+    buf = io.BytesIO()
+    noise.resize((width, height), Image.Resampling.BICUBIC).save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+
+def capture_multipart(session, base_url, photo, chunk_size):
+    return session.post(f'{base_url}/api/product/extract/', data={'session_id': 'memory', 'cache': '0'},
+                        files={'image': ('photo.jpg', photo, 'image/jpeg')}, timeout=300)
+
+
+def capture_chunked(session, base_url, photo, chunk_size):
+    upload = session.post(f'{base_url}/api/uploads/', data={'size': len(photo), 'session_id': 'memory'},
+                          timeout=30).json()
+    for offset in range(0, len(photo), chunk_size):
+        session.patch(f"{base_url}{upload['upload_url']}", data=photo[offset:offset + chunk_size],
+                      headers={'Upload-Offset': str(offset), 'Content-Type': 'application/octet-stream'},
+                      timeout=60).raise_for_status()
+    return session.post(f"{base_url}{upload['finalize_url']}", data={'cache': '0'}, timeout=300)
+
+
+CAPTURES = {'multipart': capture_multipart, 'chunked': capture_chunked}
+
+
+def worker_pid(master_pid):
+    """The pid of the single gunicorn worker forked by ``master_pid``."""
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        children = Path(f'/proc/{master_pid}/task/{master_pid}/children').read_text().split()
+        if children:
+            return int(children[0])
+        time.sleep(0.1)
+    raise RuntimeError('gunicorn worker did not start')
+
+
+def memory_kb(pid, field):
+    for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+        if line.startswith(f'{field}:'):
+            return int(line.split()[1])
+    raise RuntimeError(f'{field} not found for pid {pid}')
+
+
+def run_mode(mode, base_url, pid, photo, concurrency, rounds, chunk_size):
+    capture = CAPTURES[mode]
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    # Load the code paths with a small photo, so the baseline does not already hold a big one's heap
+    warmup = synthetic_photo(0.3)
+    for _ in range(2):
+        capture(session, base_url, warmup, chunk_size).raise_for_status()
+
+    baseline = memory_kb(pid, 'VmRSS')
+    Path(f'/proc/{pid}/clear_refs').write_text('5')  # Reset VmHWM to the current RSS
+
+    def one(_):
+        start = time.perf_counter()
+        response = capture(session, base_url, photo, chunk_size)
+        return time.perf_counter() - start, response.status_code
+
+    timings, errors = [], 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(rounds):
+            for seconds, status in pool.map(one, range(concurrency)):
+                if status == 200:
+                    timings.append(seconds)
+                else:
+                    errors += 1
+    peak = memory_kb(pid, 'VmHWM')
+    report = summarize(timings)
+    report.update({
+        'concurrency': concurrency,
+        'errors': errors,
+        'baseline_rss_mb': round(baseline / 1024, 1),
+        'peak_rss_mb': round(peak / 1024, 1),
+        'peak_mb_per_capture': round((peak - baseline) / 1024 / concurrency, 2),
+    })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', default='1,4', help='Comma-separated captures in flight at once')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--megapixels', type=float, default=12.0)
+    parser.add_argument('--chunk-kb', type=int, default=1024, help='Chunk size of the chunked uploads')
+    parser.add_argument('--latency', type=float, default=0.5, help='Stub model latency (seconds)')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    photo = synthetic_photo(args.megapixels)
+    report = {'benchmark': 'upload_memory', 'megapixels': args.megapixels, 'photo_bytes': len(photo),
+              'chunk_kb': args.chunk_kb, 'results': {mode: [] for mode in MODES}}
+    tmp = Path(tempfile.mkdtemp(prefix='inventory-memory-'))
+    os.environ['UPLOAD_SPOOL_DIR'] = str(tmp / 'spool')
+    with StubServer(latency=args.latency) as stub:
+        for concurrency in [int(x) for x in args.concurrency.split(',')]:
+            for mode in MODES:
+                # A fresh worker per run, so one run's heap does not hide the next one's peak
+                proc, base_url = start_server('wsgi', 1, stub, tmp, threads=concurrency)
+                try:
+                    report['results'][mode].append(run_mode(mode, base_url, worker_pid(proc.pid), photo,
+                                                            concurrency, args.rounds, args.chunk_kb * 1024))
+                finally:
+                    proc.terminate()
+                    proc.wait(timeout=30)
+
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
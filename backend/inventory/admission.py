@@ -0,0 +1,246 @@
+"""Admission control for model API calls, shared by every worker process on the host.
+
+Without it each gunicorn worker calls the model as fast as uploads arrive:
+a burst runs into the provider's rate limits, and slow calls pile up until
+clients time out. Before every attempt ``llm`` takes a lease here:
+
+- at most ``MODEL_MAX_IN_FLIGHT`` leases exist at once, and
+- each lease takes a token from a bucket refilled at ``MODEL_RATE_LIMIT``
+  per second that holds up to ``MODEL_RATE_BURST`` tokens.
+
+The state lives in a SQLite database (``MODEL_ADMISSION_PATH``) that all
+workers open; every decision is one short ``BEGIN IMMEDIATE`` transaction.
+A lease expires after ``MODEL_LEASE_SECONDS``, so a worker killed mid-call
+does not keep its slot.
+
+A caller that is not admitted joins a first-come, first-served queue and
+polls until it is, for up to ``MODEL_ADMISSION_MAX_WAIT`` seconds
+(``waiting`` changes this for the calling context, e.g. background jobs
+wait as long as it takes). If the wait runs out, or
+``MODEL_ADMISSION_MAX_QUEUE`` callers are already waiting, ``ModelBusy``
+is raised; views answer it with a 429 and ``Retry-After``.
+"""
+import asyncio
+import contextvars
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import metrics
+
+POLL_INTERVAL = 0.02  # First wait between attempts; doubles up to POLL_MAX
+POLL_MAX = 0.1  # An attempt is one short transaction, so polling often is cheap and keeps slots busy
+WAITER_TTL = 5.0  # A queued caller that stops polling (its process died) leaves the queue after this
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS bucket (id INTEGER PRIMARY KEY CHECK (id = 1), tokens REAL, updated REAL);
+CREATE TABLE IF NOT EXISTS lease (id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER, expires REAL);
+CREATE TABLE IF NOT EXISTS waiter (id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER, expires REAL);
+'''
+
+_local = threading.local()
+_DEFAULT = object()
+_max_wait = contextvars.ContextVar('inventory_admission_max_wait', default=_DEFAULT)
+
+
+class ModelBusy(Exception):
+    """No model call could be admitted in time; try again after ``retry_after`` seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def enabled():
+    return settings.MODEL_ADMISSION_ENABLED and (settings.MODEL_MAX_IN_FLIGHT > 0 or settings.MODEL_RATE_LIMIT > 0)
+
+
+@contextmanager
+def waiting(seconds):
+    """Wait up to ``seconds`` (None: indefinitely) for admission in the enclosed block."""
+    token = _max_wait.set(seconds)
+    try:
+        yield
+    finally:
+        _max_wait.reset(token)
+
+
+def max_wait():
+    value = _max_wait.get()
+    return settings.MODEL_ADMISSION_MAX_WAIT if value is _DEFAULT else value
+
+
+def _connection():
+    """This thread's connection to the shared database (reopened after a fork or a settings change)."""
+    path = settings.MODEL_ADMISSION_PATH
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.key != (os.getpid(), path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')  # Losing the state on a power cut only resets the limits
+        conn.executescript(_SCHEMA)
+        _local.conn, _local.key = conn, (os.getpid(), path)
+    return conn
+
+
+@contextmanager
+def _transaction():
+    db = _connection()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        yield db
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    db.execute('COMMIT')
+
+
+def _refilled(db, now):
+    row = db.execute('SELECT tokens, updated FROM bucket WHERE id = 1').fetchone()
+    if row is None:
+        return float(settings.MODEL_RATE_BURST)
+    tokens, updated = row
+    return min(float(settings.MODEL_RATE_BURST), tokens + max(0.0, now - updated) * settings.MODEL_RATE_LIMIT)
+
+
+def _retry_after(tokens, ahead):
+    """Whole seconds until the caller's turn, estimated from the token bucket."""
+    rate = settings.MODEL_RATE_LIMIT
+    if rate <= 0:
+        return 1
+    return max(1, math.ceil((ahead + 1 - tokens) / rate))
+
+
+def _attempt(waiter=None, enqueue=True):
+    """One admission decision. Returns ``(lease, waiter, retry_after)``.
+
+    ``lease`` is set when admitted. Otherwise ``waiter`` is the caller's
+    place in the queue (a new one for a first attempt if ``enqueue`` and the
+    queue has room), or None if it was turned away.
+    """
+    now = time.time()
+    with _transaction() as db:
+        db.execute('DELETE FROM lease WHERE expires < ?', (now,))
+        db.execute('DELETE FROM waiter WHERE expires < ?', (now,))
+        in_flight = db.execute('SELECT COUNT(*) FROM lease').fetchone()[0]
+        if waiter is None:
+            ahead = db.execute('SELECT COUNT(*) FROM waiter').fetchone()[0]
+        else:
+            ahead = db.execute('SELECT COUNT(*) FROM waiter WHERE id < ?', (waiter,)).fetchone()[0]
+        tokens = _refilled(db, now)
+        limited = settings.MODEL_RATE_LIMIT > 0
+        if (not ahead and (settings.MODEL_MAX_IN_FLIGHT <= 0 or in_flight < settings.MODEL_MAX_IN_FLIGHT)
+                and (not limited or tokens >= 1)):
+            if limited:
+                tokens -= 1
+            lease = db.execute('INSERT INTO lease (pid, expires) VALUES (?, ?)',
+                               (os.getpid(), now + settings.MODEL_LEASE_SECONDS)).lastrowid
+            if waiter is not None:
+                db.execute('DELETE FROM waiter WHERE id = ?', (waiter,))
+            waiter, retry_after = None, 0
+        else:
+            lease = None
+            retry_after = _retry_after(tokens, ahead)
+            if waiter is not None:
+                db.execute('UPDATE waiter SET expires = ? WHERE id = ?', (now + WAITER_TTL, waiter))
+            elif enqueue and ahead < settings.MODEL_ADMISSION_MAX_QUEUE:
+                waiter = db.execute('INSERT INTO waiter (pid, expires) VALUES (?, ?)',
+                                    (os.getpid(), now + WAITER_TTL)).lastrowid
+        db.execute('INSERT OR REPLACE INTO bucket (id, tokens, updated) VALUES (1, ?, ?)', (tokens, now))
+    return lease, waiter, retry_after
+
+
+def _leave(waiter):
+    _connection().execute('DELETE FROM waiter WHERE id = ?', (waiter,))
+
+
+def _admitted(start, lease):
+    waited = time.monotonic() - start
+    metrics.MODEL_ADMISSIONS.inc(outcome='queued' if waited >= POLL_INTERVAL else 'admitted')
+    metrics.MODEL_ADMISSION_WAIT.observe(waited)
+    return lease
+
+
+def _busy(start, retry_after, queue_full):
+    metrics.MODEL_ADMISSIONS.inc(outcome='rejected')
+    metrics.MODEL_ADMISSION_WAIT.observe(time.monotonic() - start)
+    reason = 'too many requests are waiting' if queue_full else 'no model call slot became free in time'
+    return ModelBusy(f'Model API is busy ({reason}); retry in {retry_after}s', retry_after)
+
+
+def acquire():
+    """Take a lease for one model call, queueing for up to ``max_wait()`` seconds.
+
+    Returns the lease (None when admission control is off) for ``release``.
+    Raises ``ModelBusy`` if the call is not admitted. Under ``waiting(None)``
+    it never gives up: while the queue is full it keeps polling until there
+    is room to queue or a slot to take.
+    """
+    if not enabled():
+        return None
+    limit = max_wait()
+    start = time.monotonic()
+    lease, waiter, retry_after = _attempt(enqueue=limit != 0)
+    delay = POLL_INTERVAL
+    while lease is None:
+        if waiter is None and limit is not None:
+            raise _busy(start, retry_after, queue_full=limit != 0)
+        remaining = None if limit is None else start + limit - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            _leave(waiter)
+            raise _busy(start, retry_after, queue_full=False)
+        time.sleep(delay if remaining is None else min(delay, remaining))
+        delay = min(delay * 2, POLL_MAX)
+        lease, waiter, retry_after = _attempt(waiter)
+    return _admitted(start, lease)
+
+
+async def acquire_async():
+    """``acquire`` for the event loop: the database work runs on the default executor."""
+    if not enabled():
+        return None
+    loop = asyncio.get_running_loop()
+    limit = max_wait()
+    start = time.monotonic()
+    lease, waiter, retry_after = await loop.run_in_executor(None, _attempt, None, limit != 0)
+    delay = POLL_INTERVAL
+    while lease is None:
+        if waiter is None and limit is not None:
+            raise _busy(start, retry_after, queue_full=limit != 0)
+        remaining = None if limit is None else start + limit - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            await loop.run_in_executor(None, _leave, waiter)
+            raise _busy(start, retry_after, queue_full=False)
+        await asyncio.sleep(delay if remaining is None else min(delay, remaining))
+        delay = min(delay * 2, POLL_MAX)
+        lease, waiter, retry_after = await loop.run_in_executor(None, _attempt, waiter)
+    return _admitted(start, lease)
+
+
+def release(lease):
+    """Give back a lease from ``acquire``."""
+    if lease is not None:
+        _connection().execute('DELETE FROM lease WHERE id = ?', (lease,))
+
+
+async def release_async(lease):
+    """``release`` for the event loop."""
+    if lease is not None:
+        await asyncio.get_running_loop().run_in_executor(None, release, lease)
+
+
+def snapshot():
+    """``{'in_flight', 'waiting', 'tokens'}`` across all workers right now."""
+    now = time.time()
+    db = _connection()
+    return {
+        'in_flight': db.execute('SELECT COUNT(*) FROM lease WHERE expires >= ?', (now,)).fetchone()[0],
+        'waiting': db.execute('SELECT COUNT(*) FROM waiter WHERE expires >= ?', (now,)).fetchone()[0],
+        'tokens': round(_refilled(db, now), 2) if settings.MODEL_RATE_LIMIT > 0 else None,
+    }
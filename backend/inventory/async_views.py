@@ -0,0 +1,120 @@
+"""Native async views, served when the app runs under an ASGI server.
+
+DRF's ``APIView`` is synchronous, and under ASGI Django runs sync views one
+at a time per worker on a single thread, so ``ProductExtractView`` caps a
+worker at one capture in flight. ``extract_product`` accepts the same form
+fields and returns the same responses, but awaits the model API and OCR
+(see ``run_extraction_async``) so one worker can hold many captures at once.
+``inventory/urls.py`` routes ``product/extract/`` here when
+``EXTRACTION_ASYNC_VIEW`` is set, which ``backend/asgi.py`` does by default.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.renderers import JSONRenderer
+
+from . import llm, metrics
+from .extraction import InvalidImageError, run_extraction_async, stream_extraction
+from .serializers import ProductCaptureSerializer
+from .views import (busy_payload, enqueue_extraction_job, extraction_headers, is_truthy, parse_extraction_options,
+                    parse_stream_format, stream_frames, streaming_response)
+
+
+class AsyncFrames:
+    """Drive the sync streaming pipeline from the event loop, one frame at a time.
+
+    Each step runs via ``sync_to_async`` on the request's thread, so the
+    pipeline keeps a single DB connection and the loop is never blocked.
+    ``close()`` (called by the response) closes ``frames``, which an async
+    generator would not.
+    """
+    _done = object()
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        frame = await sync_to_async(next)(self.frames, self._done)
+        if frame is self._done:
+            raise StopAsyncIteration
+        return frame
+
+    def close(self):
+        self.frames.close()
+
+
+def json_response(data, status=200, headers=None):
+    # Same encoder as the DRF views, so both paths produce identical JSON
+    return HttpResponse(JSONRenderer().render(data), status=status, headers=headers,
+                        content_type='application/json')
+
+
+@csrf_exempt
+@require_POST
+async def extract_product(request):
+    with metrics.stage('upload'):
+        image_file = request.FILES.get('image')
+    session_id = request.POST.get('session_id', 'default')
+
+    if not image_file:
+        return json_response({'error': 'No image provided'}, status=400)
+
+    try:
+        max_items, ocr_mode, use_cache = parse_extraction_options(request.POST)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=400)
+
+    try:
+        stream_format = parse_stream_format(request.POST.get('stream'))
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=400)
+
+    if stream_format:
+        try:
+            events = await sync_to_async(stream_extraction)(
+                image_file, session_id=session_id, max_items=max_items,
+                ocr_mode=ocr_mode, use_cache=use_cache, barcode=request.POST.get('barcode'))
+        except InvalidImageError as e:
+            return json_response({'error': str(e)}, status=400)
+        except llm.ModelBusy as e:
+            data, headers = busy_payload(e)
+            return json_response(data, status=429, headers=headers)
+        return streaming_response(AsyncFrames(stream_frames(events, stream_format)), stream_format)
+
+    if is_truthy(request.POST.get('async', False)):
+        try:
+            payload = await sync_to_async(enqueue_extraction_job)(image_file, session_id,
+                                                                  max_items, ocr_mode)
+        except InvalidImageError as e:
+            return json_response({'error': str(e)}, status=400)
+        return json_response(payload, status=202)
+
+    try:
+        outcome = await run_extraction_async(image_file, session_id=session_id, max_items=max_items,
+                                             ocr_mode=ocr_mode, use_cache=use_cache,
+                                             barcode=request.POST.get('barcode'))
+    except InvalidImageError as e:
+        return json_response({'error': str(e)}, status=400)
+    except llm.ModelBusy as e:
+        data, headers = busy_payload(e)
+        return json_response(data, status=429, headers=headers)
+    except Exception as e:
+        return json_response({'error': str(e)}, status=500)
+
+    data = ProductCaptureSerializer(outcome['saved'], many=True).data
+    if is_truthy(request.POST.get('debug', False)):
+        data = {
+            'saved': data,
+            'parsed_items': outcome['items'],
+            'model_content': outcome['content'],
+            'cache': outcome['cache'],
+            'degraded': outcome['degraded'],
+            'barcode': outcome['barcode'],
+            'index': outcome['index'],
+            'run': str(outcome['run'].pk),
+        }
+    return json_response(data, headers=extraction_headers(outcome))
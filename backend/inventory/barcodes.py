@@ -0,0 +1,85 @@
+"""Local EAN/UPC barcode detection.
+
+Decoding uses the ``pyzbar`` package (which needs the system ``zbar``
+library, ``libzbar0`` in the Docker image); without it ``decode`` logs a
+warning once, finds nothing, and every capture goes to the model as
+before. The frontend also scans the code with the browser's
+``BarcodeDetector`` where available and sends it in the ``barcode`` form
+field.
+
+Codes are normalized to zero-padded GTIN-14 so EAN-13, EAN-8, UPC-A and
+UPC-E scans of the same product share one catalog key.
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pyzbar import pyzbar
+except Exception:  # ImportError, or the zbar shared library is missing
+    pyzbar = None
+
+SYMBOLS = ('EAN13', 'EAN8', 'UPCA', 'UPCE')
+
+
+def check_digit(digits: str) -> int:
+    """GS1 check digit for ``digits`` (the code without its last digit)."""
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits)))
+    return (10 - total % 10) % 10
+
+
+def expand_upce(code: str) -> str:
+    """Expand an 8-digit UPC-E code to its 12-digit UPC-A form."""
+    number, body, check = code[0], code[1:7], code[7]
+    last = body[5]
+    if last in '012':
+        core = body[0:2] + last + '0000' + body[2:5]
+    elif last == '3':
+        core = body[0:3] + '00000' + body[3:5]
+    elif last == '4':
+        core = body[0:4] + '00000' + body[4]
+    else:
+        core = body[0:5] + '0000' + last
+    return number + core + check
+
+
+def normalize_gtin(code, symbol=None):
+    """Return ``code`` as a valid GTIN-14 string, or None if it is not a valid EAN/UPC."""
+    code = ''.join(ch for ch in str(code or '') if not ch.isspace())
+    if not code.isdigit():
+        return None
+    if symbol == 'UPCE' and len(code) == 8:
+        code = expand_upce(code)
+    if len(code) not in (8, 12, 13, 14):
+        return None
+    if check_digit(code[:-1]) != int(code[-1]):
+        return None
+    return code.zfill(14)
+
+
+_warned = False
+
+
+def decode(pil_image):
+    """Return the distinct GTINs found in ``pil_image`` (empty without pyzbar)."""
+    global _warned
+    if not settings.BARCODE_ENABLED:
+        return []
+    if pyzbar is None:
+        if not _warned:
+            _warned = True
+            logger.warning('pyzbar or the zbar library is not installed; barcodes are not decoded locally')
+        return []
+    try:
+        results = pyzbar.decode(pil_image, symbols=[getattr(pyzbar.ZBarSymbol, s) for s in SYMBOLS])
+    except Exception:
+        logger.exception('Barcode decoding failed')
+        return []
+    gtins = []
+    for result in results:
+        gtin = normalize_gtin(result.data.decode('ascii', 'ignore'), result.type)
+        if gtin and gtin not in gtins:
+            gtins.append(gtin)
+    return gtins
@@ -0,0 +1,99 @@
+"""Perceptual-hash cache of extraction results.
+
+Re-shooting the same shelf item produces near-identical photos. Each image
+is reduced to a 64-bit difference hash (dHash) of its normalized grayscale
+thumbnail; a new capture whose hash is within
+``CAPTURE_CACHE_MAX_DISTANCE`` bits of a cached one reuses that entry's
+items instead of calling OCR and the model again. Near matches are found by
+splitting the hash into ``CAPTURE_CACHE_MAX_DISTANCE + 1`` bands: a hash
+that close differs in at most that many bits, so it equals the new one in
+at least one band, and the database only returns entries that do.
+
+Entries live in the database so they are shared by every worker and survive
+restarts. They expire ``CAPTURE_CACHE_TTL`` seconds after their last use,
+and the least recently used entries are evicted beyond
+``CAPTURE_CACHE_MAX_ENTRIES``.
+"""
+from datetime import timedelta
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.db.models import F, Q
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from .models import CaptureCacheEntry
+
+HASH_SIZE = 8
+
+
+def image_hash(pil_image) -> str:
+    """Return the 64-bit dHash of ``pil_image`` as 16 hex characters."""
+    img = ImageOps.exif_transpose(pil_image)
+    img = ImageOps.autocontrast(img.convert('L'))
+    img = img.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = img.tobytes()
+    bits = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f'{bits:016x}'
+
+
+def _live_entries():
+    cutoff = timezone.now() - timedelta(seconds=settings.CAPTURE_CACHE_TTL)
+    return CaptureCacheEntry.objects.filter(last_used_at__gte=cutoff)
+
+
+def _near(entries, hash_hex, max_distance):
+    """``entries`` that equal ``hash_hex`` in at least one of ``max_distance + 1`` bands of hex digits."""
+    bands = max_distance + 1
+    if bands > len(hash_hex):
+        # Bands narrower than a hex digit; compare against everything
+        return entries
+    width = len(hash_hex) // bands
+    match = Q()
+    for i in range(bands):
+        start = i * width
+        entries = entries.annotate(**{f'band{i}': Substr('image_hash', start + 1, width)})
+        match |= Q(**{f'band{i}': hash_hex[start:start + width]})
+    return entries.filter(match)
+
+
+def lookup(hash_hex: str):
+    """Return the cached items for the closest entry within the threshold, or None."""
+    entries = _live_entries()
+    best = entries.filter(image_hash=hash_hex).values_list('id', flat=True).first()
+    if best is None and settings.CAPTURE_CACHE_MAX_DISTANCE > 0:
+        target = int(hash_hex, 16)
+        best_distance = settings.CAPTURE_CACHE_MAX_DISTANCE + 1
+        candidates = _near(entries, hash_hex, settings.CAPTURE_CACHE_MAX_DISTANCE)
+        for entry_id, other in candidates.values_list('id', 'image_hash'):
+            distance = (target ^ int(other, 16)).bit_count()
+            if distance < best_distance:
+                best, best_distance = entry_id, distance
+    if best is None:
+        return None
+
+    CaptureCacheEntry.objects.filter(pk=best).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    return CaptureCacheEntry.objects.values_list('items', flat=True).get(pk=best)
+
+
+def store(hash_hex: str, items):
+    """Remember ``items`` for ``hash_hex`` and apply the TTL/LRU eviction policy."""
+    CaptureCacheEntry.objects.update_or_create(
+        image_hash=hash_hex,
+        defaults={'items': items, 'last_used_at': timezone.now()},
+    )
+    evict()
+
+
+def evict():
+    cutoff = timezone.now() - timedelta(seconds=settings.CAPTURE_CACHE_TTL)
+    CaptureCacheEntry.objects.filter(last_used_at__lt=cutoff).delete()
+
+    overflow = CaptureCacheEntry.objects.count() - settings.CAPTURE_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        stale = CaptureCacheEntry.objects.order_by('last_used_at').values_list('id', flat=True)[:overflow]
+        CaptureCacheEntry.objects.filter(pk__in=list(stale)).delete()
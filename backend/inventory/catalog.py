@@ -0,0 +1,120 @@
+"""Barcode (GTIN) product catalog.
+
+A capture whose barcode is in the catalog is answered from the ``Product``
+row at ``BARCODE_CATALOG_CONFIDENCE`` without OCR or a model call. Entries
+come from four sources, in increasing order of trust:
+
+- ``model``: the model's answer for an unknown barcode (written back),
+- ``capture``: agreed on by saved captures (``build_catalog`` command),
+- ``confirmed``: a capture with a barcode edited by a user,
+- ``import``: a CSV import (``import_catalog`` command).
+
+An entry is only overwritten by a source at least as trusted as its own.
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .categories import DEFAULT_CATEGORY, normalize_category
+from .models import Product, ProductCapture
+
+SOURCE_RANK = {
+    Product.SOURCE_MODEL: 0,
+    Product.SOURCE_CAPTURE: 1,
+    Product.SOURCE_CONFIRMED: 2,
+    Product.SOURCE_IMPORT: 3,
+}
+
+CATALOG_FIELDS = ('product_name', 'unit', 'description', 'category')
+
+
+def lookup(gtin):
+    """Return the catalog item dict for ``gtin`` (counting the hit), or None."""
+    product = Product.objects.filter(gtin=gtin).first()
+    if product is None:
+        return None
+    Product.objects.filter(gtin=gtin).update(hits=F('hits') + 1)
+    item = {field: getattr(product, field) for field in CATALOG_FIELDS}
+    item['confidence'] = settings.BARCODE_CATALOG_CONFIDENCE
+    return item
+
+
+def upsert(gtin, item, source):
+    """Create or update the entry for ``gtin`` unless it comes from a more trusted source.
+
+    ``item`` is a dict with at least ``product_name``; categories are
+    repaired by ``normalize_category``, falling back to Food. Returns True
+    if the row was written.
+    """
+    name = (item.get('product_name') or '').strip()
+    if not gtin or not name:
+        return False
+    values = {
+        'product_name': name[:255],
+        'unit': (item.get('unit') or '')[:50],
+        'description': item.get('description') or '',
+        'category': normalize_category(item.get('category')) or DEFAULT_CATEGORY,
+        'source': source,
+    }
+    with transaction.atomic():
+        product = Product.objects.select_for_update().filter(gtin=gtin).first()
+        if product is None:
+            Product.objects.create(gtin=gtin, **values)
+            return True
+        if SOURCE_RANK[source] < SOURCE_RANK[product.source]:
+            return False
+        for field, value in values.items():
+            setattr(product, field, value)
+        product.save()
+    return True
+
+
+def learn_from_model(gtin, items):
+    """Write the model's answer back for an unknown barcode.
+
+    Only an unambiguous answer (exactly one named item) is stored: with
+    several products in the photo there is no telling which one the barcode
+    belongs to.
+    """
+    named = [it for it in items if isinstance(it, dict) and it.get('product_name')]
+    if gtin and len(named) == 1:
+        upsert(gtin, named[0], Product.SOURCE_MODEL)
+
+
+def confirm(capture):
+    """Record a user-edited capture as the catalog entry for its barcode."""
+    if capture.barcode:
+        upsert(capture.barcode, {f: getattr(capture, f) for f in CATALOG_FIELDS}, Product.SOURCE_CONFIRMED)
+
+
+def build_from_captures(min_confidence=None):
+    """Create or refresh ``capture`` entries from saved captures that carry a barcode.
+
+    For each GTIN the most common (name, unit, category) among captures with
+    confidence >= ``min_confidence`` (default ``CATALOG_MIN_CONFIDENCE``)
+    wins. Returns the number of entries written.
+    """
+    if min_confidence is None:
+        min_confidence = settings.CATALOG_MIN_CONFIDENCE
+    votes = defaultdict(Counter)
+    descriptions = {}
+    rows = (
+        ProductCapture.objects.exclude(barcode='')
+        .filter(confidence__gte=min_confidence)
+        .values_list('barcode', 'product_name', 'unit', 'category', 'description')
+        .iterator()
+    )
+    for gtin, name, unit, category, description in rows:
+        key = (name, unit, category)
+        votes[gtin][key] += 1
+        descriptions.setdefault((gtin, key), description)
+
+    written = 0
+    for gtin, counter in votes.items():
+        (name, unit, category), _ = counter.most_common(1)[0]
+        item = {'product_name': name, 'unit': unit, 'category': category,
+                'description': descriptions[(gtin, (name, unit, category))]}
+        written += upsert(gtin, item, Product.SOURCE_CAPTURE)
+    return written
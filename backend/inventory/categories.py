@@ -0,0 +1,382 @@
+"""Product categories: the canonical list, alias repair and a local classifier.
+
+The model is asked for one of ``CATEGORIES`` (generated from
+``ProductCapture.CATEGORY_CHOICES`` so the prompt cannot drift from the
+model field), but it still answers "Cleanings", "Beverages" or
+"cleaning supplies" now and then. ``normalize_category`` maps such answers
+to a valid choice.
+
+``CategoryClassifier`` is a TF-IDF + softmax regression model over the
+name and description of a capture (word and character-trigram features).
+It is trained from saved captures and catalog entries by the
+``train_category_model`` command, saved as an ``.npz`` file
+(``CATEGORY_MODEL_PATH``) and loaded once per process. Inference is a
+gather-and-sum over the weight matrix, so one prediction takes
+microseconds. ``assign_category`` decides what is saved, depending on
+``CATEGORY_CLASSIFIER``:
+
+- ``off``: the model's category, repaired by ``normalize_category``;
+- ``validate``: the model's category, unless it is invalid or the
+  classifier disagrees with probability >= ``CATEGORY_OVERRIDE_CONFIDENCE``;
+- ``replace``: always the classifier's, and the prompt no longer asks the
+  model for a category.
+
+Without a trained model ``validate`` and ``replace`` behave like ``off``.
+"""
+import logging
+import math
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+
+from .models import ProductCapture
+from .product_index import normalize
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = [choice for choice, _ in ProductCapture.CATEGORY_CHOICES]
+DEFAULT_CATEGORY = 'Food'
+
+CLASSIFIER_MODES = ('off', 'validate', 'replace')
+
+# Answers seen from the model (and older clients) that are not choices
+ALIASES = {
+    'cleanings': 'Cleaning Supplies',
+    'cleaning': 'Cleaning Supplies',
+    'cleaning products': 'Cleaning Supplies',
+    'household': 'Cleaning Supplies',
+    'beverage': 'Drinks',
+    'beverages': 'Drinks',
+    'drink': 'Drinks',
+    'medicines': 'Medicine',
+    'pharmacy': 'Medicine',
+    'personal care': 'Hygiene',
+    'toiletries': 'Hygiene',
+    'insecticides': 'Insecticide',
+    'pest control': 'Insecticide',
+    'frozen': 'Frozen Goods',
+    'frozen food': 'Frozen Goods',
+    'bakery': 'Bread & Pastries',
+    'bread': 'Bread & Pastries',
+    'baby': 'Baby Products',
+    'pet food': 'Pet Supplies',
+    'pets': 'Pet Supplies',
+    'hardware': 'Hardware & Electrical',
+    'electrical': 'Hardware & Electrical',
+    'clothing': 'Clothing & Accessories',
+    'load': 'Mobile Load & E-Services',
+    'e-load': 'Mobile Load & E-Services',
+    'rice': 'Rice & Grains',
+    'grains': 'Rice & Grains',
+    'cigarettes': 'Tobacco',
+    'liquor': 'Alcohol',
+    'school': 'School Supplies',
+    'office': 'Office Supplies',
+    'snacks': 'Food',
+    'groceries': 'Food',
+}
+
+_LOOKUP = {normalize(c): c for c in CATEGORIES}
+_LOOKUP.update({normalize(alias): c for alias, c in ALIASES.items()})
+
+
+def normalize_category(value):
+    """The valid category ``value`` stands for (case, punctuation and aliases forgiven), or None."""
+    if not isinstance(value, str):
+        return None
+    return _LOOKUP.get(normalize(value))
+
+
+def capture_text(name, description=''):
+    return f'{name or ""} {description or ""}'
+
+
+def features(text):
+    """Feature counts for ``text``: words (``w:``) and word-padded character trigrams (``t:``)."""
+    words = normalize(text).split()
+    found = ['w:' + word for word in words]
+    for word in words:
+        padded = f'  {word} '
+        found.extend(['t:' + padded[i:i + 3] for i in range(len(padded) - 2)])
+    return Counter(found)
+
+
+def _scatter_sum(index, values, n):
+    """``out[i] = values[index == i].sum(axis=0)``; one ``bincount`` per column (much faster than ``np.add.at``)."""
+    out = np.empty((n, values.shape[1]), dtype=np.float32)
+    for k in range(values.shape[1]):
+        out[:, k] = np.bincount(index, weights=values[:, k], minlength=n)
+    return out
+
+
+class CategoryClassifier:
+    def __init__(self, vocabulary, idf, weights, bias, classes):
+        self.vocabulary = vocabulary  # feature -> column
+        self.idf = idf
+        self.weights = weights  # (n_features, n_classes)
+        self.bias = bias
+        self.classes = list(classes)
+
+    def _rows(self, counts):
+        """Sparse TF-IDF rows for a list of ``features`` counts, as flat ``(row, column, value)``
+        arrays (rows L2-normalized)."""
+        rows, cols, vals = [], [], []
+        for r, row_counts in enumerate(counts):
+            pairs = [(self.vocabulary[f], 1 + math.log(n)) for f, n in row_counts.items()
+                     if f in self.vocabulary]
+            if not pairs:
+                continue
+            idx = np.fromiter((c for c, _ in pairs), dtype=np.int64, count=len(pairs))
+            tf = np.fromiter((v for _, v in pairs), dtype=np.float32, count=len(pairs)) * self.idf[idx]
+            rows.append(np.full(len(idx), r, dtype=np.int64))
+            cols.append(idx)
+            vals.append(tf / np.linalg.norm(tf))
+        if not rows:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+        return np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+
+    def probabilities(self, texts):
+        """``(len(texts), n_classes)`` class probabilities."""
+        rows, cols, vals = self._rows([features(text) for text in texts])
+        scores = _scatter_sum(rows, self.weights[cols] * vals[:, None], len(texts)) + self.bias
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        return scores / scores.sum(axis=1, keepdims=True)
+
+    def predict(self, texts):
+        """Most likely category and its probability for each text."""
+        probs = self.probabilities(texts)
+        best = probs.argmax(axis=1)
+        return [(self.classes[i], float(p)) for i, p in zip(best, probs[np.arange(len(best)), best])]
+
+    @classmethod
+    def train(cls, texts, labels, epochs=30, learning_rate=0.05, l2=1e-5, min_df=2,
+              max_features=50000, batch_size=256, seed=0):
+        """Fit on ``texts`` / ``labels`` with minibatch Adam on the softmax cross-entropy."""
+        classes = sorted(set(labels))
+        counts = [features(text) for text in texts]
+        df = Counter()
+        for row_counts in counts:
+            df.update(row_counts.keys())
+        kept = [f for f, n in df.most_common(max_features) if n >= min_df]
+        vocabulary = {f: i for i, f in enumerate(kept)}
+        total = len(texts)
+        idf = np.array([math.log((1 + total) / (1 + df[f])) + 1 for f in kept], dtype=np.float32)
+
+        n_features, n_classes = len(kept), len(classes)
+        model = cls(vocabulary, idf, np.zeros((n_features, n_classes), dtype=np.float32),
+                    np.zeros(n_classes, dtype=np.float32), classes)
+        if not n_features:
+            return model
+
+        rows, cols, vals = model._rows(counts)
+        bounds = np.searchsorted(rows, np.arange(total + 1))
+        class_index = {c: i for i, c in enumerate(classes)}
+        y = np.array([class_index[label] for label in labels])
+
+        rng = np.random.default_rng(seed)
+        params = [model.weights, model.bias]
+        moments = [(np.zeros_like(p), np.zeros_like(p)) for p in params]
+        beta1, beta2, eps, step = 0.9, 0.999, 1e-8, 0
+        for _ in range(epochs):
+            order = rng.permutation(total)
+            for start in range(0, total, batch_size):
+                batch = order[start:start + batch_size]
+                # Non-zeros of the batch's rows, with row numbers local to the batch
+                lengths = bounds[batch + 1] - bounds[batch]
+                local = np.repeat(np.arange(len(batch)), lengths)
+                nz = np.arange(lengths.sum()) + np.repeat(bounds[batch] - (np.cumsum(lengths) - lengths), lengths)
+                scores = _scatter_sum(local, model.weights[cols[nz]] * vals[nz, None], len(batch)) + model.bias
+                scores -= scores.max(axis=1, keepdims=True)
+                probs = np.exp(scores)
+                probs /= probs.sum(axis=1, keepdims=True)
+                probs[np.arange(len(batch)), y[batch]] -= 1
+                probs /= len(batch)
+                grad_weights = _scatter_sum(cols[nz], probs[local] * vals[nz, None], n_features)
+                grad_weights += l2 * model.weights
+                grads = [grad_weights, probs.sum(axis=0)]
+
+                step += 1
+                for param, grad, (m, v) in zip(params, grads, moments):
+                    m *= beta1
+                    m += (1 - beta1) * grad
+                    v *= beta2
+                    v += (1 - beta2) * grad * grad
+                    m_hat = m / (1 - beta1 ** step)
+                    v_hat = v / (1 - beta2 ** step)
+                    param -= learning_rate * m_hat / (np.sqrt(v_hat) + eps)
+        return model
+
+    def save(self, path):
+        """Write the model as ``.npz`` (atomically, so workers never load half a file)."""
+        tmp = f'{path}.tmp.npz'
+        features_by_column = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez(tmp, features=np.array(features_by_column, dtype=object), idf=self.idf,
+                 weights=self.weights, bias=self.bias, classes=np.array(self.classes))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=True) as data:
+            vocabulary = {f: i for i, f in enumerate(data['features'].tolist())}
+            return cls(vocabulary, data['idf'], data['weights'], data['bias'], data['classes'].tolist())
+
+
+_lock = threading.Lock()
+_classifier = None
+_classifier_mtime = None
+
+
+def get_classifier():
+    """This process's trained classifier (reloaded when the file changes), or None."""
+    global _classifier, _classifier_mtime
+    path = str(settings.CATEGORY_MODEL_PATH)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    with _lock:
+        if mtime != _classifier_mtime:
+            _classifier, _classifier_mtime = None, mtime
+            if mtime is not None:
+                try:
+                    _classifier = CategoryClassifier.load(path)
+                except Exception:
+                    logger.exception('Could not load the category model %s', path)
+        return _classifier
+
+
+def classifier_mode():
+    """The active ``CATEGORY_CLASSIFIER`` mode; ``off`` while no model has been trained."""
+    mode = settings.CATEGORY_CLASSIFIER
+    if mode not in CLASSIFIER_MODES:
+        raise ValueError(f"Invalid CATEGORY_CLASSIFIER '{mode}'; expected one of {', '.join(CLASSIFIER_MODES)}")
+    if mode != 'off' and get_classifier() is None:
+        return 'off'
+    return mode
+
+
+def assign_category(category, name, description=''):
+    """The category to save for an item the model called ``category`` (see the module docstring)."""
+    valid = normalize_category(category)
+    mode = classifier_mode()
+    if mode == 'off':
+        return valid or DEFAULT_CATEGORY
+    predicted, probability = get_classifier().predict([capture_text(name, description)])[0]
+    if mode == 'replace' or valid is None:
+        return predicted
+    if predicted != valid and probability >= settings.CATEGORY_OVERRIDE_CONFIDENCE:
+        return predicted
+    return valid
+
+
+def training_data(min_confidence=None):
+    """``(texts, labels)`` from catalog entries and captures with confidence >= ``min_confidence``.
+
+    Defaults to ``CATALOG_MIN_CONFIDENCE``. Repeats of the same name and
+    category count once, so a product scanned a hundred times does not
+    outweigh the rest; invalid categories are repaired or skipped.
+    """
+    from .models import Product
+
+    if min_confidence is None:
+        min_confidence = settings.CATALOG_MIN_CONFIDENCE
+    seen = set()
+    texts, labels = [], []
+
+    def add(name, description, category):
+        category = normalize_category(category)
+        key = (normalize(name), category)
+        if category is None or not key[0] or key in seen:
+            return
+        seen.add(key)
+        texts.append(capture_text(name, description))
+        labels.append(category)
+
+    for row in Product.objects.values_list('product_name', 'description', 'category').iterator():
+        add(*row)
+    rows = (
+        ProductCapture.objects.filter(confidence__gte=min_confidence)
+        .values_list('product_name', 'description', 'category')
+        .iterator()
+    )
+    for row in rows:
+        add(*row)
+    return texts, labels
+
+
+def train(min_confidence=None, holdout=0.1, seed=0, **options):
+    """Train a classifier on ``training_data``; returns ``(model, report)``.
+
+    A random ``holdout`` share of the examples is kept out of training to
+    measure accuracy (the saved model is trained on the rest). ``options``
+    are passed to ``CategoryClassifier.train``.
+    """
+    texts, labels = training_data(min_confidence)
+    if not texts:
+        raise ValueError('No labelled captures or catalog entries to train on')
+    order = np.random.default_rng(seed).permutation(len(texts))
+    n_test = int(len(texts) * holdout) if len(texts) >= 20 else 0
+    test, fit = order[:n_test], order[n_test:]
+    model = CategoryClassifier.train([texts[i] for i in fit], [labels[i] for i in fit], seed=seed, **options)
+    report = {'examples': len(texts), 'features': len(model.vocabulary), 'classes': len(model.classes)}
+    if n_test:
+        predicted = model.predict([texts[i] for i in test])
+        report['holdout_accuracy'] = sum(p == labels[i] for (p, _), i in zip(predicted, test)) / n_test
+    return model, report
+
+
+def recategorize(queryset, min_probability=None, dry_run=False, chunk_size=2000):
+    """Re-predict the category of every capture in ``queryset``.
+
+    A capture gets the predicted category when its own is invalid or the
+    classifier disagrees with probability >= ``min_probability`` (default
+    ``CATEGORY_OVERRIDE_CONFIDENCE``); an alias is repaired either way. Rows are predicted ``chunk_size`` at
+    a time and each chunk is written with one ``bulk_update`` and one
+    Session summary update. Returns ``(examined, Counter of (old, new))``.
+    """
+    from django.db import transaction
+
+    from . import session_summary
+
+    model = get_classifier()
+    if model is None:
+        raise ValueError(f'No category model at {settings.CATEGORY_MODEL_PATH}; run train_category_model')
+    if min_probability is None:
+        min_probability = settings.CATEGORY_OVERRIDE_CONFIDENCE
+
+    examined, changes = 0, Counter()
+    rows = queryset.order_by('pk').only('id', 'product_name', 'description', 'category',
+                                        'confidence', 'session_id')
+    last_pk = None
+    while True:
+        chunk = list((rows.filter(pk__gt=last_pk) if last_pk else rows)[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+        examined += len(chunk)
+        predictions = model.predict([capture_text(c.product_name, c.description) for c in chunk])
+        changed = []
+        deltas = {}
+        for capture, (predicted, probability) in zip(chunk, predictions):
+            valid = normalize_category(capture.category)
+            if valid is None or (predicted != valid and probability >= min_probability):
+                new = predicted
+            else:
+                new = valid  # e.g. "Cleanings" -> "Cleaning Supplies"
+            if new == capture.category:
+                continue
+            changes[(capture.category, new)] += 1
+            delta = deltas.setdefault(capture.session_id, session_summary.Delta())
+            delta.add(capture.category, capture.confidence, sign=-1)
+            delta.add(new, capture.confidence)
+            capture.category = new
+            changed.append(capture)
+        if changed and not dry_run:
+            with transaction.atomic():
+                ProductCapture.objects.bulk_update(changed, ['category'])
+                session_summary.apply(deltas)
+    return examined, changes
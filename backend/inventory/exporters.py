@@ -0,0 +1,95 @@
+"""Streaming exports of saved captures.
+
+Rows are read with ``values_list(...).iterator()`` in chunks of
+``EXPORT_CHUNK_SIZE`` so memory stays flat no matter how many captures are
+exported. CSV and NDJSON are produced on the fly (optionally gzipped);
+XLSX is written with ``openpyxl`` (imported on first use) in write-only
+mode to a temporary file that is then streamed back.
+"""
+import csv
+import io
+import json
+import tempfile
+import zlib
+
+from django.conf import settings
+
+EXPORT_FIELDS = ('product_name', 'unit', 'description', 'category', 'confidence')
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def iter_rows(queryset, chunk_size=None):
+    """Yield lists of export rows (tuples), one list per DB chunk."""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    batch = []
+    for row in queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_csv(queryset):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_FIELDS)
+    yield buf.getvalue().encode('utf-8')
+    for batch in iter_rows(queryset):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(batch)
+        yield buf.getvalue().encode('utf-8')
+
+
+def stream_ndjson(queryset):
+    for batch in iter_rows(queryset):
+        yield ''.join(
+            json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n' for row in batch
+        ).encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip an iterable of byte strings on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def write_xlsx(queryset):
+    """Write the export to a temporary XLSX file and return it opened for reading.
+
+    Raises ImportError when openpyxl is not installed.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('captures')
+    sheet.append(EXPORT_FIELDS)
+    for batch in iter_rows(queryset):
+        for row in batch:
+            sheet.append(row)
+    tmp = tempfile.TemporaryFile(suffix='.xlsx')
+    workbook.save(tmp)
+    tmp.seek(0)
+    return tmp
+
+
+def iter_file(fh, block_size=64 * 1024):
+    try:
+        while True:
+            block = fh.read(block_size)
+            if not block:
+                break
+            yield block
+    finally:
+        fh.close()
@@ -0,0 +1,951 @@
+import asyncio
+import binascii
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from . import (admission, barcodes, capture_cache, catalog, categories, image_store, llm, metrics, product_index,
+               runs, session_summary)
+from .imaging import prepare_image
+from .llm import ModelUnavailable
+from .models import ProductCapture
+from .persistence import bulk_save_captures
+from .ocr import get_ocr_backend
+from .streaming import ClosingIterator, ItemStreamParser
+
+
+class InvalidImageError(ValueError):
+    """Raised when the uploaded bytes cannot be decoded as an image."""
+
+
+SYSTEM_PROMPT = (
+    "You are an assistant with strong visual reasoning. "
+    "Prioritize understanding the image contents when extracting product information. "
+    "Use OCR only as an auxiliary hint if the image text is unclear or partially occluded. "
+    "Return only a valid JSON array of objects (even if there is only one item). "
+    "Each object should contain the requested fields."
+)
+
+USER_PROMPT = """
+Analyze the following product image using vision and the provided OCR text.
+Return a JSON array of detected items (even if only one). For each item, include these fields:
+
+- product_name
+- unit (e.g., "500g", "1L", "12pcs")
+- description (short text)
+{category_field}- confidence (0 to 1, estimate based on clarity and completeness)
+
+OCR Text: {ocr_text}
+
+Use the image and OCR together. If uncertain, lower the confidence score.
+Return JSON only (an array of objects).
+"""
+
+
+def extract_json_from_text(text: str):
+    """Try several strategies to extract a JSON object/array from text.
+
+    Strategies (in order):
+    - Look for fenced code blocks labelled json (```json ... ```)
+    - Look for any triple-backtick block and attempt parse
+    - Find the first balanced JSON object {...}
+    - Find the first balanced JSON array [...]
+    - Fallback: attempt to locate first '{'..'}' span and parse
+    """
+    # 1) fenced code block with json
+    # Allow fenced blocks that contain either an object or an array
+    fenced_json = re.search(r"```(?:json)?\s*([\[\{][\s\S]*?[\]\}])\s*```", text, re.IGNORECASE)
+    if fenced_json:
+        candidate = fenced_json.group(1)
+        try:
+            return json.loads(candidate)
+        except Exception:
+            pass
+
+    # 2) any triple-backtick block
+    triple = re.search(r"```([\s\S]*?)```", text)
+    if triple:
+        c = triple.group(1).strip()
+        # try as-is
+        try:
+            return json.loads(c)
+        except Exception:
+            # maybe the block contains other text; try to find braces inside
+            pass
+
+    # 3) balanced-brace object or array scanning
+    def find_balanced(text, open_ch, close_ch):
+        start = None
+        depth = 0
+        for i, ch in enumerate(text):
+            if ch == open_ch:
+                if start is None:
+                    start = i
+                depth += 1
+            elif ch == close_ch and start is not None:
+                depth -= 1
+                if depth == 0:
+                    return text[start:i+1]
+        return None
+
+    # Prefer array first, then object (avoids capturing only first object when model returned an array)
+    arr = find_balanced(text, '[', ']')
+    if arr:
+        try:
+            return json.loads(arr)
+        except Exception:
+            pass
+
+    obj = find_balanced(text, '{', '}')
+    if obj:
+        try:
+            return json.loads(obj)
+        except Exception:
+            pass
+
+    # 4) Fallback: locate first '{'.. last '}' and attempt
+    s = text.find('{')
+    e = text.rfind('}')
+    if s != -1 and e != -1 and e > s:
+        candidate = text[s:e+1]
+        try:
+            return json.loads(candidate)
+        except Exception as exc:
+            raise ValueError(f'Failed to parse JSON from candidate substring: {exc}')
+
+    # Nothing worked
+    raise ValueError('No JSON object or array found in model response')
+
+
+def parse_items(content: str):
+    """Parse the model response into a list of item dicts."""
+    with metrics.stage('parse'):
+        return _parse_items(content)
+
+
+def _parse_items(content):
+    try:
+        parsed = extract_json_from_text(content)
+    except Exception as parse_err:
+        # include model content snippet for debugging (trim to reasonable length)
+        snippet = content[:2000] + ('...' if len(content) > 2000 else '')
+        raise ValueError(f'Failed to extract JSON from model response: {parse_err}; response snippet: {snippet}')
+
+    # Normalize to list
+    if isinstance(parsed, dict):
+        return [parsed]
+    if isinstance(parsed, list):
+        return parsed
+    raise ValueError('Parsed model response is neither object nor array')
+
+
+# Generated from the model field's choices so the two cannot drift apart
+CATEGORY_FIELD = f"- category (exactly one of: {', '.join(categories.CATEGORIES)})\n"
+
+
+def build_prompt(ocr_text: str):
+    """The user prompt; the category is left out when the local classifier replaces it."""
+    category_field = '' if categories.classifier_mode() == 'replace' else CATEGORY_FIELD
+    return USER_PROMPT.format(ocr_text=ocr_text, category_field=category_field)
+
+
+# Bytes encoded per step; a multiple of 3, so only the last chunk is padded
+BASE64_CHUNK = 3 * 64 * 1024
+
+
+def image_data_url(image_bytes: bytes, mime_type='image/jpeg') -> str:
+    """The ``data:`` URL of an image for the model request.
+
+    The base64 text is encoded in chunks straight into one buffer that
+    already holds the prefix, so besides the image only that buffer and the
+    returned string ever exist at full size (not a base64 bytes object, its
+    decoded string and the formatted URL).
+    """
+    prefix = f'data:{mime_type};base64,'.encode('ascii')
+    buf = bytearray(len(prefix) + 4 * ((len(image_bytes) + 2) // 3))
+    buf[:len(prefix)] = prefix
+    pos = len(prefix)
+    view = memoryview(image_bytes)
+    for start in range(0, len(view), BASE64_CHUNK):
+        encoded = binascii.b2a_base64(view[start:start + BASE64_CHUNK], newline=False)
+        buf[pos:pos + len(encoded)] = encoded
+        pos += len(encoded)
+    return buf.decode('ascii')
+
+
+def build_messages(image_url: str, ocr_text: str):
+    """Build the chat messages for the vision model (``image_url`` from ``image_data_url``)."""
+    return [
+        {
+            "role": "system",
+            "content": [{"type": "text", "text": SYSTEM_PROMPT}],
+        },
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": build_prompt(ocr_text)},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": image_url},
+                },
+            ],
+        },
+    ]
+
+
+OCR_MODES = ('off', 'parallel', 'blocking')
+
+_ocr_executor = None
+_ocr_executor_lock = threading.Lock()
+
+
+def get_ocr_executor():
+    """Return the shared thread pool used to run OCR alongside the model call."""
+    global _ocr_executor
+    with _ocr_executor_lock:
+        if _ocr_executor is None:
+            _ocr_executor = ThreadPoolExecutor(max_workers=settings.OCR_WORKERS,
+                                               thread_name_prefix='ocr')
+        return _ocr_executor
+
+
+def resolve_ocr_mode(value):
+    """Validate a per-request OCR mode, falling back to the configured default."""
+    if value in (None, ''):
+        return settings.EXTRACTION_OCR_MODE
+    mode = str(value).lower()
+    if mode not in OCR_MODES:
+        raise ValueError(f"Invalid ocr mode '{value}'; expected one of {', '.join(OCR_MODES)}")
+    return mode
+
+
+def run_ocr(pil_image):
+    with metrics.stage('ocr'):
+        return get_ocr_backend().image_to_string(pil_image)
+
+
+def submit_ocr(pil_image):
+    """Start ``run_ocr`` on the OCR pool; its timing counts towards the calling request."""
+    return get_ocr_executor().submit(metrics.in_context(run_ocr), pil_image)
+
+
+def call_model(image_url: str, ocr_text: str):
+    """Send the image (and OCR hint, if any) to the vision model and return its content.
+
+    Raises ``ModelUnavailable`` when the API is down or the breaker is open.
+    """
+    # Prefer the smaller vision-capable model and instruct it to prioritize
+    # visual analysis. Provide OCR text as auxiliary input.
+    with metrics.stage('model'):
+        response = llm.chat_completion(
+            build_messages(image_url, ocr_text or '(not available)'),
+            max_tokens=300,
+        )
+    return response.choices[0].message.content
+
+
+async def call_model_async(image_url: str, ocr_text: str):
+    """Async ``call_model`` using the per-loop async client."""
+    with metrics.stage('model'):
+        response = await llm.chat_completion_async(
+            build_messages(image_url, ocr_text or '(not available)'),
+            max_tokens=300,
+        )
+    return response.choices[0].message.content
+
+
+def ocr_items(ocr_text: str):
+    """Best-effort single item built from OCR text alone (used when the model is unavailable).
+
+    The first line with a few letters becomes the product name; confidence
+    is 0 so the capture stands out for review.
+    """
+    lines = [line.strip() for line in (ocr_text or '').splitlines()]
+    lines = [line for line in lines if sum(ch.isalpha() for ch in line) >= 3]
+    if not lines:
+        return []
+    return [{
+        'product_name': lines[0][:255],
+        'unit': '',
+        'description': ' '.join(lines[1:])[:500],
+        'category': 'Food',
+        'confidence': 0.0,
+    }]
+
+
+def _named_items(items):
+    return [it for it in items if isinstance(it, dict) and it.get('product_name')]
+
+
+def analyze_image(image_bytes: bytes, max_items=10, progress=None, ocr_mode=None, use_cache=None,
+                  barcode=None):
+    """Run the OCR -> vision model part of the pipeline for one uploaded image.
+
+    ``image_bytes`` may also be the path or open binary file of a spooled
+    upload (see ``imaging.prepare_image``); it is decoded once, up front.
+
+    ``ocr_mode`` selects how OCR is combined with the model call:
+
+    - ``blocking``: OCR runs first and its text is always sent as a hint.
+    - ``parallel``: the model call starts immediately with the image alone
+      while OCR runs on the OCR pool. If the response contains no usable
+      items, OCR gets up to ``EXTRACTION_OCR_BUDGET`` more seconds and its
+      text is sent in a single follow-up call.
+    - ``off``: the model sees the image alone.
+
+    Unless ``use_cache`` (default ``CAPTURE_CACHE_ENABLED``) is false, a
+    near-duplicate of a previously extracted photo reuses the cached items
+    and skips OCR and the model entirely.
+
+    If the model API is unavailable (see ``llm.chat_completion``) the
+    result is built from OCR alone and flagged ``degraded``; it is never
+    cached.
+
+    A barcode (the ``barcode`` hint, else one decoded from the image) that
+    is in the product catalog answers the capture directly, before the
+    cache, OCR or the model; an unknown one is written back to the catalog
+    with the model's answer (see ``catalog.learn_from_model``).
+
+    OCR text that names a known product (``product_index.match_ocr``) also
+    answers the capture without the model. In parallel mode OCR gets up to
+    ``PRODUCT_INDEX_OCR_WAIT`` seconds for this before the model is called.
+
+    Nothing is saved. Returns a dict with the parsed items, the raw model
+    content, the OCR text, the cache outcome (``hit``, ``miss`` or ``off``),
+    the ``degraded`` flag, the GTIN and catalog outcome (``barcode``,
+    ``catalog``), ``index`` (``hit`` when answered from the product index)
+    and the bytes to store with the captures. ``trace`` holds the image's
+    stage timings and token counts (see ``runs.build``). ``progress`` is
+    an optional callable that is told which stage the pipeline has reached.
+    """
+    ocr_mode = resolve_ocr_mode(ocr_mode)
+
+    with metrics.trace_run() as trace:
+        # Decode and normalize once up front so a bad upload fails before any OCR/model work
+        prepared, image_hash = _prepare(image_bytes, use_cache)
+        gtin, catalog_item = resolve_barcode(prepared, barcode)
+        if catalog_item is not None:
+            outcome = _catalog_outcome(prepared, gtin, catalog_item, max_items)
+        else:
+            outcome = _analyze_prepared(prepared, image_hash, max_items, progress, ocr_mode)
+            outcome = _learn_barcode(outcome, gtin)
+    outcome['trace'] = trace
+    return outcome
+
+
+def _analyze_prepared(prepared, image_hash, max_items, progress, ocr_mode):
+    def report(stage):
+        if progress is not None:
+            progress(stage)
+
+    cache = 'off' if image_hash is None else 'miss'
+    if image_hash is not None:
+        with metrics.stage('cache'):
+            cached_items = capture_cache.lookup(image_hash)
+        if cached_items is not None:
+            return _outcome(prepared, cached_items[:max_items], None, '', 'hit')
+
+    ocr_text = ''
+    ocr_future = None
+    if ocr_mode == 'blocking':
+        report('ocr')
+        ocr_text = run_ocr(prepared.ocr_image)
+    elif ocr_mode == 'parallel':
+        ocr_future = submit_ocr(prepared.ocr_image)
+
+    item, matched_text = _ocr_match(ocr_text, ocr_future)
+    if item is not None:
+        return _index_outcome(prepared, item, matched_text, cache, max_items)
+
+    # Prepare image for GPT (data URL of the bounded-size re-encode)
+    image_url = image_data_url(prepared.model_bytes, prepared.model_mime)
+
+    # Call GPT Vision API
+    report('model')
+    try:
+        content = call_model(image_url, ocr_text)
+    except ModelUnavailable:
+        return _ocr_fallback(prepared, ocr_text, ocr_future, max_items, cache)
+
+    try:
+        items = parse_items(content)
+    except ValueError:
+        items = None
+
+    if ocr_future is not None:
+        if items and _named_items(items):
+            # Keep the OCR text for the caller if it is already available
+            if ocr_future.done() and not ocr_future.exception():
+                ocr_text = ocr_future.result()
+        else:
+            # The model came back empty-handed without the OCR hint; give OCR
+            # the remaining budget and, if it produced text, retry once with it.
+            try:
+                ocr_text = ocr_future.result(timeout=settings.EXTRACTION_OCR_BUDGET)
+            except Exception:
+                # OCR timed out or failed; there is nothing to add
+                ocr_text = ''
+            if ocr_text.strip():
+                try:
+                    content = call_model(image_url, ocr_text)
+                except ModelUnavailable:
+                    return _ocr_fallback(prepared, ocr_text, None, max_items, cache)
+                items = None
+
+    # Parse GPT response
+    if items is None:
+        items = parse_items(content)
+
+    if image_hash is not None and _named_items(items):
+        capture_cache.store(image_hash, _named_items(items))
+
+    return _outcome(prepared, items[:max_items], content, ocr_text, cache)
+
+
+def _prepare(image_bytes, use_cache):
+    """Decode and normalize an upload; also return its cache hash (None when caching is off)."""
+    with metrics.stage('decode'):
+        try:
+            prepared = prepare_image(image_bytes)
+        except Exception as e:
+            raise InvalidImageError(f'Invalid image file: {e}')
+        if use_cache is None:
+            use_cache = settings.CAPTURE_CACHE_ENABLED
+        image_hash = capture_cache.image_hash(prepared.image) if use_cache else None
+    return prepared, image_hash
+
+
+def _outcome(prepared, items, content, ocr_text, cache, degraded=False):
+    return {
+        'items': items,
+        'content': content,
+        'ocr_text': ocr_text,
+        'cache': cache,
+        'stored_bytes': prepared.stored_bytes,
+        'degraded': degraded,
+        'barcode': None,
+        'catalog': None,
+        'index': None,
+    }
+
+
+def resolve_barcode(prepared, hint=None):
+    """Return ``(gtin, catalog item or None)`` for a capture.
+
+    A valid ``hint`` (the client's own scan) wins; otherwise the image is
+    decoded locally. ``gtin`` is None when no barcode was found.
+    """
+    with metrics.stage('barcode'):
+        gtin = barcodes.normalize_gtin(hint) if hint else None
+        if gtin is None:
+            found = barcodes.decode(prepared.image)
+            gtin = found[0] if found else None
+        if gtin is None:
+            return None, None
+        return gtin, catalog.lookup(gtin)
+
+
+def _catalog_outcome(prepared, gtin, item, max_items):
+    outcome = _outcome(prepared, [item][:max_items], None, '', 'off')
+    outcome['barcode'] = gtin
+    outcome['catalog'] = 'hit'
+    return outcome
+
+
+def _ocr_match(ocr_text, ocr_future=None):
+    """Return ``(item, ocr_text)`` for a known product named in the OCR text, else ``(None, '')``.
+
+    In parallel mode (``ocr_future``) OCR is given up to
+    ``PRODUCT_INDEX_OCR_WAIT`` seconds; if it is not done by then the model
+    call goes ahead as usual.
+    """
+    if not settings.PRODUCT_INDEX_ENABLED or not len(product_index.get_index()):
+        return None, ''
+    if ocr_future is not None:
+        if settings.PRODUCT_INDEX_OCR_WAIT <= 0:
+            return None, ''
+        try:
+            ocr_text = ocr_future.result(timeout=settings.PRODUCT_INDEX_OCR_WAIT)
+        except Exception:
+            return None, ''
+    with metrics.stage('index'):
+        item = product_index.match_ocr(ocr_text)
+    return (item, ocr_text) if item is not None else (None, '')
+
+
+def _index_outcome(prepared, item, ocr_text, cache, max_items):
+    outcome = _outcome(prepared, [item][:max_items], None, ocr_text, cache)
+    outcome['index'] = 'hit'
+    return outcome
+
+
+def _learn_barcode(outcome, gtin):
+    """Record an unknown barcode's answer in the catalog and annotate the outcome."""
+    if gtin is None:
+        return outcome
+    outcome['barcode'] = gtin
+    outcome['catalog'] = 'miss'
+    if not outcome['degraded'] and outcome['cache'] != 'hit' and outcome['index'] != 'hit':
+        catalog.learn_from_model(gtin, outcome['items'])
+    return outcome
+
+
+def _ocr_fallback(prepared, ocr_text, ocr_future, max_items, cache):
+    """Build an OCR-only outcome when the model API is unavailable."""
+    if not ocr_text:
+        try:
+            if ocr_future is not None:
+                ocr_text = ocr_future.result(timeout=settings.EXTRACTION_OCR_BUDGET)
+            else:
+                ocr_text = run_ocr(prepared.ocr_image)
+        except Exception:
+            ocr_text = ''
+    return _outcome(prepared, ocr_items(ocr_text)[:max_items], None, ocr_text, cache, degraded=True)
+
+
+async def analyze_image_async(image_bytes: bytes, max_items=10, ocr_mode=None, use_cache=None,
+                              barcode=None):
+    """Async ``analyze_image`` for ASGI views; same options and result.
+
+    The event loop only awaits: image decoding runs on the default executor,
+    OCR on the OCR pool, the model call uses the async client and cache and
+    catalog reads/writes go through ``sync_to_async``. A single worker can
+    therefore keep many captures in flight while they wait on the model API.
+    """
+    ocr_mode = resolve_ocr_mode(ocr_mode)
+    loop = asyncio.get_running_loop()
+
+    with metrics.trace_run() as trace:
+        prepared, image_hash = await loop.run_in_executor(None, metrics.in_context(_prepare),
+                                                          image_bytes, use_cache)
+        gtin, catalog_item = await sync_to_async(resolve_barcode)(prepared, barcode)
+        if catalog_item is not None:
+            outcome = _catalog_outcome(prepared, gtin, catalog_item, max_items)
+        else:
+            outcome = await _analyze_prepared_async(prepared, image_hash, max_items, ocr_mode)
+            outcome = await sync_to_async(_learn_barcode)(outcome, gtin)
+    outcome['trace'] = trace
+    return outcome
+
+
+async def _analyze_prepared_async(prepared, image_hash, max_items, ocr_mode):
+    loop = asyncio.get_running_loop()
+    cache = 'off' if image_hash is None else 'miss'
+    if image_hash is not None:
+        with metrics.stage('cache'):
+            cached_items = await sync_to_async(capture_cache.lookup)(image_hash)
+        if cached_items is not None:
+            return _outcome(prepared, cached_items[:max_items], None, '', 'hit')
+
+    ocr_text = ''
+    ocr_future = None
+    if ocr_mode == 'blocking':
+        ocr_text = await loop.run_in_executor(get_ocr_executor(), metrics.in_context(run_ocr),
+                                              prepared.ocr_image)
+    elif ocr_mode == 'parallel':
+        ocr_future = loop.run_in_executor(get_ocr_executor(), metrics.in_context(run_ocr),
+                                          prepared.ocr_image)
+        # Mark a late OCR failure as retrieved so asyncio does not log it
+        ocr_future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    item, matched_text = await _ocr_match_async(ocr_text, ocr_future)
+    if item is not None:
+        return _index_outcome(prepared, item, matched_text, cache, max_items)
+
+    image_url = image_data_url(prepared.model_bytes, prepared.model_mime)
+    try:
+        content = await call_model_async(image_url, ocr_text)
+    except ModelUnavailable:
+        return await _ocr_fallback_async(prepared, ocr_text, ocr_future, max_items, cache)
+
+    try:
+        items = parse_items(content)
+    except ValueError:
+        items = None
+
+    if ocr_future is not None:
+        if items and _named_items(items):
+            if ocr_future.done() and not ocr_future.cancelled() and not ocr_future.exception():
+                ocr_text = ocr_future.result()
+        else:
+            try:
+                ocr_text = await asyncio.wait_for(asyncio.shield(ocr_future), settings.EXTRACTION_OCR_BUDGET)
+            except Exception:
+                ocr_text = ''
+            if ocr_text.strip():
+                try:
+                    content = await call_model_async(image_url, ocr_text)
+                except ModelUnavailable:
+                    return await _ocr_fallback_async(prepared, ocr_text, None, max_items, cache)
+                items = None
+
+    if items is None:
+        items = parse_items(content)
+
+    if image_hash is not None and _named_items(items):
+        await sync_to_async(capture_cache.store)(image_hash, _named_items(items))
+
+    return _outcome(prepared, items[:max_items], content, ocr_text, cache)
+
+
+async def _ocr_match_async(ocr_text, ocr_future=None):
+    """Async ``_ocr_match``; the index lookup itself is a few ms of numpy and runs inline."""
+    if not settings.PRODUCT_INDEX_ENABLED or not len(product_index.get_index()):
+        return None, ''
+    if ocr_future is not None:
+        if settings.PRODUCT_INDEX_OCR_WAIT <= 0:
+            return None, ''
+        try:
+            ocr_text = await asyncio.wait_for(asyncio.shield(ocr_future), settings.PRODUCT_INDEX_OCR_WAIT)
+        except Exception:
+            return None, ''
+    with metrics.stage('index'):
+        item = product_index.match_ocr(ocr_text)
+    return (item, ocr_text) if item is not None else (None, '')
+
+
+async def _ocr_fallback_async(prepared, ocr_text, ocr_future, max_items, cache):
+    if not ocr_text:
+        try:
+            if ocr_future is not None:
+                ocr_text = await asyncio.wait_for(asyncio.shield(ocr_future), settings.EXTRACTION_OCR_BUDGET)
+            else:
+                ocr_text = await asyncio.get_running_loop().run_in_executor(
+                    get_ocr_executor(), metrics.in_context(run_ocr), prepared.ocr_image)
+        except Exception:
+            ocr_text = ''
+    return _outcome(prepared, ocr_items(ocr_text)[:max_items], None, ocr_text, cache, degraded=True)
+
+
+def run_extraction(image_bytes: bytes, session_id='default', max_items=10, progress=None,
+                   ocr_mode=None, use_cache=None, barcode=None):
+    """Run the full OCR -> vision model -> save pipeline for one uploaded image.
+
+    See ``analyze_image`` for the options. The returned dict additionally
+    holds the saved ``ProductCapture`` objects under ``saved`` and their
+    ``ExtractionRun`` under ``run``.
+    """
+    outcome = analyze_image(image_bytes, max_items=max_items, progress=progress,
+                            ocr_mode=ocr_mode, use_cache=use_cache, barcode=barcode)
+    if progress is not None:
+        progress('saving')
+    outcome['run'] = runs.build(outcome, session_id, max_items)
+    outcome['saved'] = save_items(outcome['items'], outcome['stored_bytes'], session_id,
+                                  barcode=outcome['barcode'], run=outcome['run'])
+    metrics.record_outcome(outcome, len(outcome['saved']))
+    return outcome
+
+
+async def run_extraction_async(image_bytes: bytes, session_id='default', max_items=10,
+                               ocr_mode=None, use_cache=None, barcode=None):
+    """Async ``run_extraction``: ``analyze_image_async`` and then save the rows."""
+    outcome = await analyze_image_async(image_bytes, max_items=max_items, ocr_mode=ocr_mode,
+                                        use_cache=use_cache, barcode=barcode)
+    outcome['run'] = runs.build(outcome, session_id, max_items)
+    outcome['saved'] = await sync_to_async(save_items)(outcome['items'], outcome['stored_bytes'],
+                                                       session_id, barcode=outcome['barcode'],
+                                                       run=outcome['run'])
+    metrics.record_outcome(outcome, len(outcome['saved']))
+    return outcome
+
+
+def stream_extraction(image_bytes: bytes, session_id='default', max_items=10, ocr_mode=None,
+                      use_cache=None, barcode=None):
+    """Streaming variant of ``run_extraction``.
+
+    The upload is decoded right away (so ``InvalidImageError`` is raised
+    before anything is streamed) and a generator of ``(event, data)`` pairs
+    is returned: ``('item', capture)`` for each ``ProductCapture`` as soon as
+    the model has closed its JSON object and the row is saved, then
+    ``('done', summary)`` with ``cache``, ``degraded``, ``barcode``,
+    ``catalog``, ``index`` and ``saved_count``. OCR, the cache, the barcode
+    catalog and the product index behave as in ``analyze_image``.
+
+    The cache, OCR and product index lookups also run before returning, and
+    only when none of them answers is the admission lease for the model call
+    taken, so ``llm.ModelBusy`` is raised here (and answered with a 429)
+    rather than in the middle of the stream. The returned iterator's
+    ``close()`` gives the lease back if the model call never took it, even
+    when the response is closed without being iterated.
+    """
+    ocr_mode = resolve_ocr_mode(ocr_mode)
+    with metrics.trace_run() as trace:
+        prepared, image_hash = _prepare(image_bytes, use_cache)
+        gtin, catalog_item = resolve_barcode(prepared, barcode)
+        found = None if catalog_item is not None else _stream_lookup(prepared, image_hash, ocr_mode)
+        reserved = [None]
+        if (found is not None and found['cached_items'] is None and found['item'] is None
+                and llm.get_breaker().state != llm.CircuitBreaker.OPEN):
+            reserved[0] = admission.acquire()
+
+    def release():
+        lease, reserved[0] = reserved[0], None
+        admission.release(lease)
+
+    events = _stream_captures(prepared, image_hash, session_id, max_items, gtin, catalog_item, found, trace,
+                              reserved)
+    return ClosingIterator(_traced(events, trace), release)
+
+
+def _stream_lookup(prepared, image_hash, ocr_mode):
+    """Try the capture cache, then OCR and the product index, for ``stream_extraction``.
+
+    Returns a dict with ``cache`` ('off', 'miss' or 'hit'), the
+    ``cached_items``, the ``ocr_text`` or ``ocr_future`` and the index match
+    as ``item`` and ``matched_text``. The model is only needed when neither
+    ``cached_items`` nor ``item`` is set.
+    """
+    found = {'cache': 'off' if image_hash is None else 'miss', 'cached_items': None, 'ocr_text': '',
+             'ocr_future': None, 'item': None, 'matched_text': ''}
+    if image_hash is not None:
+        with metrics.stage('cache'):
+            found['cached_items'] = capture_cache.lookup(image_hash)
+        if found['cached_items'] is not None:
+            found['cache'] = 'hit'
+            return found
+
+    if ocr_mode == 'blocking':
+        found['ocr_text'] = run_ocr(prepared.ocr_image)
+    elif ocr_mode == 'parallel':
+        found['ocr_future'] = submit_ocr(prepared.ocr_image)
+    found['item'], found['matched_text'] = _ocr_match(found['ocr_text'], found['ocr_future'])
+    return found
+
+
+def _traced(events, trace):
+    """Run each step of the ``events`` generator inside ``trace`` (it is resumed by the response)."""
+    with closing(events):
+        while True:
+            with metrics.trace_run(trace):
+                try:
+                    event = next(events)
+                except StopIteration:
+                    return
+            yield event
+
+
+def _stream_captures(prepared, image_hash, session_id, max_items, gtin, catalog_item, found, trace, reserved):
+    saved_items = []
+    saved = []
+    contents = []
+    # Inserted with the first capture (or on its own at the end); completed once the stream is done
+    run = runs.build({'stored_bytes': prepared.stored_bytes}, session_id, max_items)
+
+    def save(item, barcode=None):
+        rows = build_captures([item], session_id, barcode)
+        if not rows or len(saved_items) >= max_items:
+            return None
+        bulk_save_captures(runs.attach(run, rows), [prepared.stored_bytes], runs=None if saved else [run])
+        saved_items.append(item)
+        saved.append(rows[0])
+        return rows[0]
+
+    def summary(cache, degraded, catalog_outcome, index=None, ocr_text=''):
+        done = {'cache': cache, 'degraded': degraded, 'barcode': gtin, 'catalog': catalog_outcome,
+                'index': index, 'saved_count': len(saved_items)}
+        metrics.record_outcome(done, len(saved_items))
+        runs.update(run, dict(done, content=contents[-1] if contents else '', ocr_text=ocr_text, trace=trace))
+        run.save()
+        return done
+
+    if catalog_item is not None:
+        capture = save(catalog_item, gtin)
+        if capture is not None:
+            yield 'item', capture
+        yield 'done', summary('off', False, 'hit')
+        return
+
+    def save_all(items):
+        for item in items:
+            capture = save(item)
+            if capture is not None:
+                yield capture
+
+    def model_captures(image_url, ocr_text):
+        parser = ItemStreamParser()
+        content = []
+        found = False
+        # The first model call uses the lease taken by stream_extraction
+        lease, reserved[0] = reserved[0], None
+        deltas = llm.chat_completion_stream(
+            build_messages(image_url, ocr_text or '(not available)'),
+            max_tokens=300,
+            lease=lease,
+        )
+        try:
+            with closing(deltas):
+                for delta in metrics.timed_iter('model', deltas):
+                    content.append(delta)
+                    for item in parser.feed(delta):
+                        found = True
+                        yield from save_all([item])
+                        if len(saved_items) >= max_items:
+                            return
+        finally:
+            contents.append(''.join(content))
+        if not found:
+            # Not a well-formed array; fall back to the forgiving whole-text parser
+            try:
+                items = parse_items(contents[-1])
+            except ValueError:
+                items = []
+            yield from save_all(items)
+
+    cache = found['cache']
+    if found['cached_items'] is not None:
+        for capture in save_all(found['cached_items']):
+            yield 'item', capture
+        yield 'done', summary(cache, False, gtin and 'miss')
+        return
+
+    ocr_text = found['ocr_text']
+    ocr_future = found['ocr_future']
+    if found['item'] is not None:
+        capture = save(found['item'], gtin)
+        if capture is not None:
+            yield 'item', capture
+        yield 'done', summary(cache, False, gtin and 'miss', 'hit', found['matched_text'])
+        return
+
+    image_url = image_data_url(prepared.model_bytes, prepared.model_mime)
+    degraded = False
+    try:
+        for capture in model_captures(image_url, ocr_text):
+            yield 'item', capture
+        if not saved_items and ocr_future is not None:
+            # Nothing usable without the hint: retry once with the OCR text, as analyze_image does
+            try:
+                ocr_text = ocr_future.result(timeout=settings.EXTRACTION_OCR_BUDGET)
+            except Exception:
+                ocr_text = ''
+            if ocr_text.strip():
+                for capture in model_captures(image_url, ocr_text):
+                    yield 'item', capture
+    except ModelUnavailable:
+        if saved_items:
+            # Part of the answer is already saved and sent; report the failure
+            raise
+        degraded = True
+        outcome = _ocr_fallback(prepared, ocr_text, ocr_future, max_items, cache)
+        ocr_text = outcome['ocr_text']
+        for capture in save_all(outcome['items']):
+            yield 'item', capture
+
+    if image_hash is not None and not degraded and saved_items:
+        capture_cache.store(image_hash, saved_items)
+    if gtin is not None and not degraded:
+        catalog.learn_from_model(gtin, saved_items)
+        if len(saved) == 1:
+            # Items were saved as they streamed in; only now is it known the barcode is unambiguous
+            ProductCapture.objects.filter(pk=saved[0].pk).update(barcode=gtin)
+            session_summary.touch([saved[0].session_id])
+            saved[0].barcode = gtin
+    if not ocr_text and ocr_future is not None and ocr_future.done() and not ocr_future.exception():
+        ocr_text = ocr_future.result()
+    yield 'done', summary(cache, degraded, gtin and 'miss', ocr_text=ocr_text)
+
+
+def analyze_in_worker(image_bytes, **kwargs):
+    """``analyze_image`` for pool threads: closes the thread's DB connection afterwards."""
+    try:
+        return analyze_image(image_bytes, **kwargs)
+    finally:
+        # Worker threads get their own DB connection (cache lookups); don't leak it
+        close_old_connections()
+        connection.close()
+
+
+def run_batch_extraction(images, session_id='default', max_items=10, ocr_mode=None,
+                         use_cache=None, concurrency=None):
+    """Extract many images concurrently and save all resulting rows in one transaction.
+
+    ``images`` is a list of ``(filename, bytes)`` pairs. At most
+    ``concurrency`` (default ``EXTRACTION_BATCH_CONCURRENCY``) images are
+    analyzed at once. Returns one dict per image, in input order, holding
+    either ``outcome`` (the ``analyze_image`` result plus ``saved``) or
+    ``error``.
+    """
+    concurrency = max(1, concurrency or settings.EXTRACTION_BATCH_CONCURRENCY)
+    results = [{'index': idx, 'filename': name} for idx, (name, _) in enumerate(images)]
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(images) or 1),
+                            thread_name_prefix='batch-extract') as pool:
+        futures = [
+            pool.submit(metrics.in_context(analyze_in_worker), data, max_items=max_items,
+                        ocr_mode=ocr_mode, use_cache=use_cache)
+            for _, data in images
+        ]
+        for result, future in zip(results, futures):
+            try:
+                result['outcome'] = future.result()
+            except Exception as e:
+                result['error'] = str(e)
+
+    captures, images, records = [], [], []
+    for result in results:
+        outcome = result.get('outcome')
+        if outcome is not None:
+            outcome['run'] = runs.build(outcome, session_id, max_items)
+            outcome['saved'] = runs.attach(outcome['run'],
+                                           build_captures(outcome['items'], session_id, outcome['barcode']))
+            metrics.record_outcome(outcome, len(outcome['saved']))
+            captures.extend(outcome['saved'])
+            images.extend([outcome['stored_bytes']] * len(outcome['saved']))
+            records.append(outcome['run'])
+    bulk_save_captures(captures, images, runs=records)
+    return results
+
+
+def build_captures(items, session_id='default', barcode=None):
+    """Turn parsed model items into unsaved ProductCapture objects.
+
+    Names close to a known product are replaced by its spelling (see
+    ``product_index.canonicalize``) and the category is checked or predicted
+    locally (see ``categories.assign_category``). ``barcode`` is attached
+    only when there is exactly one capture, since it cannot be matched to
+    one of several products in the same photo.
+    """
+    rows = []
+    for it in items:
+        it = product_index.canonicalize(it)
+        # Basic validation and defaults
+        name = it.get('product_name') if isinstance(it, dict) else None
+        unit = it.get('unit') if isinstance(it, dict) else ''
+        desc = it.get('description') if isinstance(it, dict) else ''
+        cat = it.get('category') if isinstance(it, dict) else 'Food'
+        conf = it.get('confidence') if isinstance(it, dict) else 0.0
+
+        if not name:
+            # skip items without a product_name
+            continue
+
+        rows.append(ProductCapture(
+            product_name=name,
+            unit=unit or '',
+            description=desc or '',
+            category=categories.assign_category(cat, name, desc),
+            confidence=float(conf) if conf is not None else 0.0,
+            session_id=session_id
+        ))
+    if barcode and len(rows) == 1:
+        rows[0].barcode = barcode
+    return rows
+
+
+def save_items(items, image_bytes: bytes, session_id='default', barcode=None, run=None):
+    """Save each detected item as a ProductCapture sharing one stored image file.
+
+    All rows are inserted with one bulk INSERT in a single transaction,
+    together with their unsaved ``ExtractionRun`` (``run``), if given.
+    """
+    rows = build_captures(items, session_id, barcode)
+    if run is not None:
+        runs.attach(run, rows)
+    # The image is written once (content-addressed) and referenced by every row
+    return bulk_save_captures(rows, [image_bytes] * len(rows), runs=[run] if run else None)
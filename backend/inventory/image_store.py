@@ -0,0 +1,128 @@
+"""Content-addressed storage for captured images.
+
+Every image is stored once under ``captures/<sha256><ext>`` and tracked by
+an ``ImageBlob`` row holding the number of ``ProductCapture`` rows that
+reference it. ``acquire`` adds references (writing the file only the first
+time those bytes are seen) and ``release`` drops them, deleting the file
+once the last reference is gone and the transaction has committed.
+Thumbnails (``inventory/thumbnails.py``) are rendered for every new file
+after commit and deleted with it.
+"""
+import hashlib
+import io
+
+from PIL import Image
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+
+from .models import ImageBlob
+
+UPLOAD_DIR = 'captures/'
+
+EXTENSIONS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'WEBP': '.webp',
+    'GIF': '.gif',
+}
+
+
+def extension_for(image_bytes: bytes) -> str:
+    """Guess the file extension from the image header (defaults to .jpg)."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            return EXTENSIONS.get(img.format, '.jpg')
+    except Exception:
+        return '.jpg'
+
+
+def blob_name(digest: str, ext: str) -> str:
+    return f'{UPLOAD_DIR}{digest}{ext}'
+
+
+def write_file(name: str, image_bytes: bytes) -> bool:
+    """Write ``image_bytes`` to exactly ``name`` unless it already exists.
+
+    Returns True if this call created the file.
+    """
+    if default_storage.exists(name):
+        return False
+    written = default_storage.save(name, ContentFile(image_bytes))
+    if written != name:
+        # Another worker wrote the same content first; keep theirs
+        default_storage.delete(written)
+        return False
+    return True
+
+
+def acquire(image_bytes: bytes, refs=1, ext=None, written=None) -> str:
+    """Store ``image_bytes`` (once) and add ``refs`` references. Returns the storage name.
+
+    If ``written`` is a list, the name is appended to it when this call
+    created the file, so a caller can remove it again if its transaction
+    rolls back (see ``discard_unreferenced``).
+    """
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    name = blob_name(digest, ext or extension_for(image_bytes))
+    with transaction.atomic():
+        blob, _ = ImageBlob.objects.get_or_create(
+            sha256=digest, defaults={'name': name, 'size': len(image_bytes)}
+        )
+        if write_file(blob.name, image_bytes):
+            if written is not None:
+                written.append(blob.name)
+            transaction.on_commit(lambda name=blob.name: _schedule_thumbnails(name))
+        ImageBlob.objects.filter(pk=digest).update(ref_count=F('ref_count') + refs)
+    return blob.name
+
+
+def retain_many(refs):
+    """Add references given as ``{name: count}`` to images that are already stored."""
+    for name, count in refs.items():
+        if name and count:
+            ImageBlob.objects.filter(name=name).update(ref_count=F('ref_count') + count)
+
+
+def release(name: str, refs=1):
+    release_many({name: refs})
+
+
+def release_many(refs):
+    """Drop references given as ``{name: count}``.
+
+    Names without an ``ImageBlob`` (files saved before the store existed)
+    are left alone. Files whose count reaches zero are deleted after commit.
+    """
+    for name, count in refs.items():
+        if not name or not count:
+            continue
+        with transaction.atomic():
+            updated = ImageBlob.objects.filter(name=name).update(ref_count=F('ref_count') - count)
+            if not updated:
+                continue
+            deleted, _ = ImageBlob.objects.filter(name=name, ref_count__lte=0).delete()
+            if deleted:
+                transaction.on_commit(lambda name=name: _delete_if_unreferenced(name))
+
+
+def discard_unreferenced(names):
+    """Delete files written during a rolled-back transaction that no blob references."""
+    for name in names:
+        _delete_if_unreferenced(name)
+
+
+def _delete_if_unreferenced(name: str):
+    from . import thumbnails  # imports this module
+
+    # The same content may have been acquired again since the blob was dropped
+    if not ImageBlob.objects.filter(name=name).exists():
+        default_storage.delete(name)
+        thumbnails.delete(name)
+
+
+def _schedule_thumbnails(name):
+    from . import thumbnails
+
+    thumbnails.schedule(name)
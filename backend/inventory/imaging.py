@@ -0,0 +1,165 @@
+"""Ingest-time image normalization.
+
+Phone uploads are decoded once, rotated according to their EXIF orientation
+and downscaled so the long edge is at most ``IMAGE_MAX_EDGE`` pixels. From
+that image we derive:
+
+- a bounded-size JPEG/WebP (``IMAGE_FORMAT``/``IMAGE_QUALITY``) that is sent
+  to the vision model and stored with the captures,
+- a grayscale, binarized copy for OCR.
+
+The original upload is only stored when ``IMAGE_KEEP_ORIGINAL`` is set.
+
+The upload can be passed as bytes or, for spooled uploads (see
+``inventory.uploads``), as a path or an open binary file, in which case it
+is only read into memory when its bytes are kept. Large JPEGs are decoded
+at a reduced scale (``Image.draft``), so a 12 MP photo never exists as a
+full-size bitmap.
+"""
+import io
+import os
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from django.conf import settings
+
+ORIENTATION_TAG = 0x0112
+
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+    'PNG': 'image/png',
+}
+
+
+class PreparedImage:
+    """The derived forms of one uploaded image used by the extraction pipeline."""
+
+    def __init__(self, image, ocr_image, model_bytes, model_mime, stored_bytes, original_bytes=None):
+        self.image = image
+        self.ocr_image = ocr_image
+        self.model_bytes = model_bytes
+        self.model_mime = model_mime
+        self.stored_bytes = stored_bytes
+        self.original_bytes = original_bytes
+
+
+def otsu_threshold(gray_image) -> int:
+    """Pick the global threshold that best separates the gray-level histogram."""
+    hist = gray_image.histogram()
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    sum_bg = 0
+    weight_bg = 0
+    best_threshold, best_variance = 127, -1.0
+    for t in range(256):
+        weight_bg += hist[t]
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += t * hist[t]
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = t, variance
+    return best_threshold
+
+
+def ocr_variant(image, binarize=True):
+    """Grayscale (and optionally binarize) an image for Tesseract."""
+    gray = ImageOps.autocontrast(image.convert('L'))
+    if not binarize:
+        return gray
+    threshold = otsu_threshold(gray)
+    return gray.point(lambda p: 255 if p > threshold else 0)
+
+
+def encode(image, fmt=None, quality=None) -> bytes:
+    fmt = (fmt or settings.IMAGE_FORMAT).upper()
+    quality = quality or settings.IMAGE_QUALITY
+    buf = io.BytesIO()
+    if fmt == 'JPEG':
+        image.save(buf, 'JPEG', quality=quality, optimize=True)
+    else:
+        image.save(buf, fmt, quality=quality)
+    return buf.getvalue()
+
+
+def _open(source):
+    if isinstance(source, (bytes, bytearray)):
+        return Image.open(io.BytesIO(source))
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    try:
+        return Image.open(source)
+    except UnidentifiedImageError:
+        # PIL names the file; don't echo a spool path back to the client
+        raise UnidentifiedImageError('cannot identify image file') from None
+
+
+def _read(source) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        return source
+    if hasattr(source, 'read'):
+        source.seek(0)
+        return source.read()
+    with open(source, 'rb') as fh:
+        return fh.read()
+
+
+def _size(source) -> int:
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    if hasattr(source, 'seek'):
+        return source.seek(0, io.SEEK_END)
+    return os.path.getsize(source)
+
+
+def prepare_image(source, max_edge=None, keep_original=None) -> PreparedImage:
+    """Decode and normalize an upload (bytes, a path or a binary file).
+
+    Raises whatever PIL raises for bad data.
+    """
+    if max_edge is None:
+        max_edge = settings.IMAGE_MAX_EDGE
+    if keep_original is None:
+        keep_original = settings.IMAGE_KEEP_ORIGINAL
+
+    with _open(source) as src:
+        changed = False
+        if max_edge and max(src.size) > max_edge:
+            # Let the JPEG decoder downscale by up to 8x while decoding (no-op for other formats)
+            scale = max_edge / max(src.size)
+            if src.draft(None, (round(src.width * scale), round(src.height * scale))):
+                changed = True
+        src.load()
+        source_format = src.format
+        changed = changed or src.getexif().get(ORIENTATION_TAG, 1) != 1
+        image = src
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+            changed = True
+        # Shrink, then rotate, both in place: the decoded bitmap is never copied at full size
+        if max_edge and max(image.size) > max_edge:
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+            changed = True
+        ImageOps.exif_transpose(image, in_place=True)
+
+    fmt = settings.IMAGE_FORMAT.upper()
+    model_bytes = encode(image, fmt)
+    model_mime = MIME_TYPES.get(fmt, 'image/jpeg')
+    if not changed and source_format in ('JPEG', 'WEBP') and _size(source) <= len(model_bytes):
+        # Already upright, small enough and compact: re-encoding would only add bytes
+        model_bytes = _read(source)
+        model_mime = MIME_TYPES[source_format]
+
+    return PreparedImage(
+        image=image,
+        ocr_image=ocr_variant(image, settings.IMAGE_OCR_BINARIZE),
+        model_bytes=model_bytes,
+        model_mime=model_mime,
+        stored_bytes=_read(source) if keep_original else model_bytes,
+        original_bytes=source if isinstance(source, (bytes, bytearray)) else None,
+    )
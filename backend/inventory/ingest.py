@@ -0,0 +1,180 @@
+"""Bulk extraction of a directory of photos (``manage.py ingest_images``).
+
+Onboarding a store means thousands of shelf photos taken before the app was
+used. They go through the same pipeline as an upload (``analyze_image``:
+decode, OCR, capture cache, model call, barcode catalog) on a pool of
+``workers`` threads, while at most ``model_concurrency`` model calls run at
+once (see ``llm.limit_concurrency``), so the pool keeps decoding and OCRing
+the next photos while earlier ones wait on the model.
+
+Results are bulk-inserted ``batch_size`` images at a time. After each batch
+is committed, one line per image is appended to a JSON Lines manifest
+(``<dir>/.ingest-manifest.jsonl`` by default)::
+
+    {"file": "aisle3/IMG_0042.jpg", "size": 2811404, "mtime_ns": ..., "session_id": "store-12",
+     "status": "done", "captures": 3, "run": "<ExtractionRun id>"}
+
+A later run with the same session skips every file whose last manifest
+line is ``done`` and whose size and modification time are unchanged, so an
+interrupted run resumes without paying for finished images again. Failed
+images, including those answered from OCR alone because the model API was
+unavailable, are recorded with their error and retried by the next run. On
+Ctrl-C the images already being analyzed are finished and saved before the
+run stops.
+"""
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from . import admission, llm, metrics, runs
+from .extraction import analyze_in_worker, build_captures
+from .persistence import bulk_save_captures
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = '.ingest-manifest.jsonl'
+
+
+def find_images(directory, pattern='*', recursive=False):
+    """Files under ``directory`` matching ``pattern``, sorted; hidden files are skipped."""
+    root = Path(directory)
+    paths = root.rglob(pattern) if recursive else root.glob(pattern)
+    return sorted(
+        path for path in paths
+        if path.is_file() and not any(part.startswith('.') for part in path.relative_to(root).parts)
+    )
+
+
+def load_manifest(path):
+    """The last manifest entry of every file, keyed by its relative path."""
+    entries = {}
+    try:
+        with open(path) as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                entries[entry['file']] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def _is_done(entry, stat, session_id):
+    return (entry is not None and entry.get('status') == 'done' and entry.get('session_id') == session_id
+            and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns)
+
+
+def ingest_directory(directory, session_id='default', workers=8, model_concurrency=4, batch_size=50,
+                     manifest=None, pattern='*', recursive=False, max_items=10, ocr_mode=None,
+                     use_cache=None, progress=None):
+    """Extract every image under ``directory`` into ``session_id``.
+
+    ``progress`` is called with the report after every saved batch. Returns
+    the report: counts of ``images`` found, ``skipped`` (done in an earlier
+    run), ``done``, ``failed`` and ``captures`` saved, ``seconds``,
+    ``images_per_s``, ``failures`` (``[(file, error)]``) and whether the
+    run was ``interrupted``.
+    """
+    root = Path(directory)
+    if not root.is_dir():
+        raise ValueError(f'Not a directory: {directory}')
+    manifest = Path(manifest) if manifest else root / MANIFEST_NAME
+    finished = load_manifest(manifest)
+
+    todo = []
+    report = {'images': 0, 'skipped': 0, 'done': 0, 'failed': 0, 'captures': 0, 'seconds': 0.0,
+              'images_per_s': 0.0, 'failures': [], 'interrupted': False, 'manifest': str(manifest)}
+    for path in find_images(root, pattern, recursive):
+        report['images'] += 1
+        name = path.relative_to(root).as_posix()
+        stat = path.stat()
+        if _is_done(finished.get(name), stat, session_id):
+            report['skipped'] += 1
+        else:
+            todo.append((path, {'file': name, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                'session_id': session_id}))
+
+    start = time.perf_counter()
+    batch = []  # (manifest entry, outcome or None)
+
+    def flush():
+        if not batch:
+            return
+        captures, images, records = [], [], []
+        for entry, outcome in batch:
+            if outcome is not None:
+                run = runs.build(outcome, session_id, max_items)
+                saved = runs.attach(run, build_captures(outcome['items'], session_id, outcome['barcode']))
+                metrics.record_outcome(outcome, len(saved))
+                captures.extend(saved)
+                images.extend([outcome['stored_bytes']] * len(saved))
+                records.append(run)
+                entry.update(status='done', captures=len(saved), run=str(run.pk))
+        bulk_save_captures(captures, images, runs=records)
+        # Only record images as done once their rows are committed
+        manifest.parent.mkdir(parents=True, exist_ok=True)
+        with open(manifest, 'a') as fh:
+            for entry, _ in batch:
+                fh.write(json.dumps(entry) + '\n')
+            fh.flush()
+            os.fsync(fh.fileno())
+        report['done'] += sum(1 for entry, _ in batch if entry['status'] == 'done')
+        report['captures'] += len(captures)
+        batch.clear()
+        report['seconds'] = round(time.perf_counter() - start, 3)
+        report['images_per_s'] = round(report['done'] / report['seconds'], 3) if report['seconds'] else 0.0
+        if progress is not None:
+            progress(report)
+
+    def collect(future, entry):
+        try:
+            outcome = future.result()
+            if outcome['degraded']:
+                # OCR-only rows are worse than a retry once the model is back
+                raise llm.ModelUnavailable('Model API unavailable; not saved')
+            batch.append((entry, outcome))
+        except Exception as e:
+            logger.warning('Could not extract %s: %s', entry['file'], e)
+            entry.update(status='failed', error=str(e))
+            report['failed'] += 1
+            report['failures'].append((entry['file'], str(e)))
+            batch.append((entry, None))
+        if len(batch) >= batch_size:
+            flush()
+
+    options = {'max_items': max_items, 'ocr_mode': ocr_mode, 'use_cache': use_cache}
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='ingest')
+    pending = {}
+    try:
+        # Wait for admission as long as it takes instead of failing the image
+        with llm.limit_concurrency(model_concurrency), admission.waiting(None):
+            # Keep a couple of images queued per worker rather than the whole directory
+            queue = iter(todo)
+            try:
+                while True:
+                    for path, entry in queue:
+                        pending[pool.submit(metrics.in_context(analyze_in_worker), path, **options)] = entry
+                        if len(pending) >= 2 * max(1, workers):
+                            break
+                    if not pending:
+                        break
+                    completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        collect(future, pending.pop(future))
+            except KeyboardInterrupt:
+                report['interrupted'] = True
+                for future in list(pending):
+                    if future.cancel():
+                        del pending[future]
+                # Images already being analyzed have been paid for; save them
+                for future in wait(pending).done:
+                    collect(future, pending.pop(future))
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        flush()
+    return report
@@ -0,0 +1,147 @@
+"""In-process background worker pool for extraction jobs.
+
+Jobs are persisted as ``ExtractionJob`` rows so any gunicorn worker can
+report their status; each process runs its own pool of threads fed by a
+local queue, so no outside broker is required. Several processes may queue
+the same job id; a worker only runs a job after claiming its row with an
+atomic update. A job left ``running`` by a crashed worker is queued again
+once it is older than ``EXTRACTION_JOB_TIMEOUT``.
+"""
+import logging
+import queue
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import admission
+from .models import ExtractionJob
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """A local queue of job ids drained by a fixed number of worker threads."""
+
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f'extraction-worker-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+        self.pick_up()
+
+    def pick_up(self):
+        """Queue jobs waiting in the database: queued before this process started, or stale."""
+        requeue_stale_jobs()
+        for job_id in ExtractionJob.objects.filter(status=ExtractionJob.STATUS_QUEUED).values_list('id', flat=True):
+            self._queue.put(job_id)
+
+    def submit(self, job_id):
+        self.start()
+        self._queue.put(job_id)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            try:
+                job_id = self._queue.get(timeout=settings.EXTRACTION_JOB_TIMEOUT)
+            except queue.Empty:
+                # Idle: look for jobs abandoned by workers that died since
+                try:
+                    close_old_connections()
+                    self.pick_up()
+                except Exception:
+                    logger.exception('Could not pick up stale extraction jobs')
+                continue
+            try:
+                close_old_connections()
+                process_job(job_id)
+            except Exception:
+                logger.exception('Extraction job %s crashed', job_id)
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+
+def requeue_stale_jobs():
+    """Queue again the jobs ``running`` for longer than ``EXTRACTION_JOB_TIMEOUT``. Returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=settings.EXTRACTION_JOB_TIMEOUT)
+    stale = ExtractionJob.objects.filter(status=ExtractionJob.STATUS_RUNNING, started_at__lt=cutoff).update(
+        status=ExtractionJob.STATUS_QUEUED, started_at=None, progress=''
+    )
+    if stale:
+        logger.warning('Queued %d stale extraction jobs again', stale)
+    return stale
+
+
+def process_job(job_id):
+    """Claim and run a single queued job. Returns False if it was already claimed."""
+    from .extraction import run_extraction
+    from .serializers import ProductCaptureSerializer
+
+    # Atomically claim the job so that only one worker (in any process) runs it
+    started_at = timezone.now()
+    claimed = ExtractionJob.objects.filter(pk=job_id, status=ExtractionJob.STATUS_QUEUED).update(
+        status=ExtractionJob.STATUS_RUNNING, started_at=started_at
+    )
+    if not claimed:
+        return False
+
+    job = ExtractionJob.objects.get(pk=job_id)
+
+    def progress(stage):
+        ExtractionJob.objects.filter(pk=job_id).update(progress=stage)
+
+    try:
+        # Hand extraction the file; only the decoded image is kept in memory. Nobody is waiting on
+        # the response, so wait for a model call slot for as long as it takes rather than failing.
+        with job.image.open('rb') as fh, admission.waiting(None):
+            outcome = run_extraction(fh, session_id=job.session_id, max_items=job.max_items,
+                                     progress=progress, ocr_mode=job.ocr_mode or None)
+    except Exception as e:
+        job.status = ExtractionJob.STATUS_FAILED
+        job.error = str(e)
+    else:
+        job.status = ExtractionJob.STATUS_SUCCEEDED
+        job.result = ProductCaptureSerializer(outcome['saved'], many=True).data
+    job.progress = 'done'
+    job.finished_at = timezone.now()
+    # Only record the result if the job is still ours (it was not requeued as stale meanwhile)
+    succeeded = job.status == ExtractionJob.STATUS_SUCCEEDED
+    updated = ExtractionJob.objects.filter(pk=job_id, status=ExtractionJob.STATUS_RUNNING,
+                                           started_at=started_at).update(
+        status=job.status, progress=job.progress, result=job.result, error=job.error,
+        image='' if succeeded else job.image.name, finished_at=job.finished_at,
+    )
+    if not updated:
+        logger.warning('Extraction job %s was requeued while running; its result is dropped', job_id)
+    elif succeeded:
+        # The captures keep their own copy of the image; the upload is no longer needed
+        job.image.delete(save=False)
+    return True
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return this process's job queue, creating it on first use."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(settings.EXTRACTION_WORKERS)
+        return _job_queue
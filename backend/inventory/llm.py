@@ -0,0 +1,371 @@
+"""Process-wide client for the vision model API.
+
+Creating an ``OpenAI`` client per request means a new connection pool and
+TLS handshake every time and no bound on how long a slow upstream can hold
+a worker. This module keeps one client per process with keep-alive
+connections and explicit connect/read timeouts, retries transient failures
+(connection errors, timeouts, 408/409/429/5xx) a bounded number of times
+with jittered exponential backoff, and wraps everything in a circuit
+breaker: after ``OPENAI_BREAKER_THRESHOLD`` consecutive failures calls fail
+fast with ``ModelUnavailable`` for ``OPENAI_BREAKER_RESET`` seconds, after
+which a single trial call is let through.
+
+Every attempt first takes a lease from ``admission``, which bounds the
+calls in flight and their rate across all worker processes; a call that is
+not admitted in time raises ``admission.ModelBusy``.
+
+``OPENAI_BASE_URL`` points the client at a different endpoint, e.g. the
+stub server in ``benchmarks/stub_openai.py``.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager, nullcontext
+
+import httpx
+import openai
+from django.conf import settings
+from openai import AsyncOpenAI, OpenAI
+
+from . import admission, metrics
+from .admission import ModelBusy
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+class ModelUnavailable(Exception):
+    """The model API is failing or the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    ``closed``: calls pass. ``open``: calls are rejected until
+    ``reset_timeout`` seconds have passed since the breaker opened.
+    ``half_open``: one trial call is allowed; its outcome closes or re-opens
+    the breaker.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed now."""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                if self._opened_at is None or self._trial_running:
+                    logger.warning('Model API circuit breaker opened after %d failures', self._failures)
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+    def cancel(self):
+        """Forget a call let through by ``allow`` that was never made."""
+        with self._lock:
+            self._trial_running = False
+
+
+_client = None
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncOpenAI
+_breaker = None
+_lock = threading.Lock()
+_slots = None  # BoundedSemaphore while limit_concurrency is active
+
+
+def _http_options():
+    return {
+        'timeout': httpx.Timeout(settings.OPENAI_READ_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+        'limits': httpx.Limits(max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                               max_keepalive_connections=settings.OPENAI_MAX_CONNECTIONS),
+    }
+
+
+def get_client():
+    """Return the process-wide OpenAI client (created on first use)."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = OpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                http_client=httpx.Client(**_http_options()),
+                max_retries=0,  # Retried below; the breaker only hears each call's final outcome
+            )
+        return _client
+
+
+def get_async_client():
+    """Return the ``AsyncOpenAI`` client for the running event loop.
+
+    Async connections belong to the loop that opened them, so there is one
+    client per loop (in practice one per ASGI worker).
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                http_client=httpx.AsyncClient(**_http_options()),
+                max_retries=0,
+            )
+            _async_clients[loop] = client
+        return client
+
+
+def get_breaker():
+    global _breaker
+    with _lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(settings.OPENAI_BREAKER_THRESHOLD, settings.OPENAI_BREAKER_RESET)
+        return _breaker
+
+
+def reset():
+    """Drop the shared client and breaker (after settings changes, in benchmarks)."""
+    global _client, _breaker
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _async_clients.clear()
+        _breaker = None
+
+
+@contextmanager
+def limit_concurrency(limit):
+    """Allow at most ``limit`` ``chat_completion`` calls at once while the block runs.
+
+    For bulk jobs (see ``inventory.ingest``) whose workers also decode and
+    OCR images: more images can be prepared than are sent to the model at a
+    time. A slot is held per attempt, not during the backoff between them.
+    """
+    global _slots
+    previous, _slots = _slots, threading.BoundedSemaphore(max(1, limit))
+    try:
+        yield
+    finally:
+        _slots = previous
+
+
+def is_retryable(exc) -> bool:
+    if isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS or exc.status_code >= 500
+    return False
+
+
+def backoff_delay(attempt: int, exc=None) -> float:
+    """Full-jitter exponential backoff for retry ``attempt`` (0-based).
+
+    A ``Retry-After`` header on ``exc`` raises the delay, up to
+    ``OPENAI_RETRY_BACKOFF_MAX``.
+    """
+    cap = settings.OPENAI_RETRY_BACKOFF_MAX
+    delay = random.uniform(0, min(cap, settings.OPENAI_RETRY_BACKOFF * (2 ** attempt)))
+    response = getattr(exc, 'response', None)
+    if response is not None:
+        try:
+            delay = max(delay, float(response.headers.get('retry-after', 0)))
+        except ValueError:
+            pass
+    return min(delay, cap)
+
+
+def _after_failure(breaker, exc, attempt, attempts) -> float:
+    """Book-keeping for a failed attempt: re-raise, or return the delay before the next one."""
+    if not is_retryable(exc):
+        if isinstance(exc, openai.APIStatusError):
+            # The provider answered; it is the request that is wrong
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        raise exc
+    if attempt + 1 >= attempts:
+        breaker.record_failure()
+        raise ModelUnavailable(f'Model API unavailable after {attempts} attempts: {exc}') from exc
+    delay = backoff_delay(attempt, exc)
+    logger.info('Model API call failed (%s); retrying in %.2fs', exc, delay)
+    return delay
+
+
+def _admit(breaker):
+    """An admission lease for the next attempt; a rejected call does not count against the breaker."""
+    try:
+        return admission.acquire()
+    except ModelBusy:
+        breaker.cancel()
+        raise
+
+
+async def _admit_async(breaker):
+    try:
+        return await admission.acquire_async()
+    except ModelBusy:
+        breaker.cancel()
+        raise
+
+
+def chat_completion(messages, max_tokens=300, model=None):
+    """Create a chat completion with retries and the circuit breaker.
+
+    Raises ``ModelUnavailable`` if the breaker is open or every attempt
+    failed with a transient error, and ``ModelBusy`` if an attempt was not
+    admitted. Other API errors (bad request, authentication) are raised
+    unchanged and do not count as failures.
+    """
+    breaker = get_breaker()
+    if not breaker.allow():
+        raise ModelUnavailable('Model API circuit breaker is open')
+
+    client = get_client()
+    attempts = settings.OPENAI_MAX_RETRIES + 1
+    for attempt in range(attempts):
+        with _slots or nullcontext():
+            lease = _admit(breaker)
+            try:
+                response = client.chat.completions.create(
+                    model=model or settings.OPENAI_MODEL,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                )
+            except Exception as e:
+                delay = _after_failure(breaker, e, attempt, attempts)
+            else:
+                breaker.record_success()
+                metrics.record_tokens(getattr(response, 'usage', None))
+                return response
+            finally:
+                admission.release(lease)
+        # Back off without holding a slot
+        time.sleep(delay)
+
+
+def chat_completion_stream(messages, max_tokens=300, model=None, lease=None):
+    """Stream a chat completion, yielding content deltas as they arrive.
+
+    Opening the stream is retried like ``chat_completion``; once text has
+    been yielded a failure cannot be retried transparently and is raised as
+    ``ModelUnavailable`` (after counting against the breaker). ``lease`` is
+    an admission lease the caller already holds, used for the first attempt
+    (so a streaming view can answer ``ModelBusy`` before it starts its
+    response); it is released in any case.
+    """
+    breaker = get_breaker()
+    if not breaker.allow():
+        admission.release(lease)
+        raise ModelUnavailable('Model API circuit breaker is open')
+
+    client = get_client()
+    attempts = settings.OPENAI_MAX_RETRIES + 1
+    for attempt in range(attempts):
+        if lease is None:
+            lease = _admit(breaker)
+        try:
+            stream = client.chat.completions.create(
+                model=model or settings.OPENAI_MODEL,
+                messages=messages,
+                max_tokens=max_tokens,
+                stream=True,
+                # The last chunk then carries the token counts
+                stream_options={'include_usage': True},
+            )
+        except Exception as e:
+            admission.release(lease)
+            lease = None
+            time.sleep(_after_failure(breaker, e, attempt, attempts))
+        else:
+            break
+
+    # The lease is held until the stream is finished or abandoned
+    try:
+        with stream:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if getattr(chunk, 'usage', None) is not None:
+                    metrics.record_tokens(chunk.usage)
+    except GeneratorExit:
+        # The caller stopped reading (e.g. max_items reached); the API was fine
+        breaker.record_success()
+        raise
+    except Exception as e:
+        breaker.record_failure()
+        if is_retryable(e):
+            raise ModelUnavailable(f'Model API stream failed: {e}') from e
+        raise
+    else:
+        breaker.record_success()
+    finally:
+        admission.release(lease)
+
+
+async def chat_completion_async(messages, max_tokens=300, model=None):
+    """Async ``chat_completion``; shares the process-wide circuit breaker."""
+    breaker = get_breaker()
+    if not breaker.allow():
+        raise ModelUnavailable('Model API circuit breaker is open')
+
+    client = get_async_client()
+    attempts = settings.OPENAI_MAX_RETRIES + 1
+    for attempt in range(attempts):
+        lease = await _admit_async(breaker)
+        try:
+            response = await client.chat.completions.create(
+                model=model or settings.OPENAI_MODEL,
+                messages=messages,
+                max_tokens=max_tokens,
+            )
+        except Exception as e:
+            delay = _after_failure(breaker, e, attempt, attempts)
+        else:
+            breaker.record_success()
+            metrics.record_tokens(getattr(response, 'usage', None))
+            return response
+        finally:
+            await admission.release_async(lease)
+        await asyncio.sleep(delay)
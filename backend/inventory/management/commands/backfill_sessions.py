@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventory import session_summary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Session summary table from all saved ProductCapture rows.'
+
+    def handle(self, *args, **options):
+        count = session_summary.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt summaries for {count} sessions'))
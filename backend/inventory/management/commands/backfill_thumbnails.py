@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from inventory import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Render missing thumbnails for stored capture images (moving pre-store uploads into the store first).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Re-render existing thumbnails (e.g. after changing THUMBNAIL_* settings)')
+        parser.add_argument('--workers', type=int, default=4, help='Images rendered in parallel')
+        parser.add_argument('--no-adopt', action='store_true',
+                            help='Leave uploads saved before the content-addressed store where they are')
+
+    def handle(self, *args, **options):
+        if not options['no_adopt']:
+            adopted, missing = thumbnails.adopt_legacy()
+            if adopted or missing:
+                self.stdout.write(f'Moved {adopted} older images into the store ({missing} files missing)')
+        images, rendered, failed = thumbnails.backfill(options['force'], options['workers'])
+        message = f'Rendered {rendered} thumbnails for {images} images'
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{message}; {failed} images failed (see the log)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from inventory import catalog
+
+
+class Command(BaseCommand):
+    help = 'Build or refresh the barcode catalog from saved captures that carry a barcode.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-confidence', type=float, default=None,
+                            help='Ignore captures below this confidence (default CATALOG_MIN_CONFIDENCE)')
+
+    def handle(self, *args, **options):
+        written = catalog.build_from_captures(options['min_confidence'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} catalog entries'))
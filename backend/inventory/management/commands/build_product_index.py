@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from inventory import product_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the fuzzy product index snapshot from the catalog and saved captures.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-confidence', type=float, default=None,
+                            help='Ignore captures below this confidence (default CATALOG_MIN_CONFIDENCE)')
+
+    def handle(self, *args, **options):
+        count = product_index.rebuild(options['min_confidence'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} products in {product_index.snapshot_path()}'))
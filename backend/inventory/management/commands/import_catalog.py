@@ -0,0 +1,37 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from inventory import catalog
+from inventory.barcodes import normalize_gtin
+from inventory.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Import barcode catalog entries from a CSV file with columns gtin (or barcode), '
+            'product_name, unit, description and category.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import')
+        parser.add_argument('--delimiter', default=',')
+
+    def handle(self, *args, **options):
+        try:
+            fh = open(options['path'], newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(str(e))
+
+        imported = skipped = 0
+        with fh, transaction.atomic():
+            reader = csv.DictReader(fh, delimiter=options['delimiter'])
+            if not reader.fieldnames or not {'gtin', 'barcode'} & set(reader.fieldnames):
+                raise CommandError('CSV needs a gtin or barcode column')
+            for row in reader:
+                gtin = normalize_gtin(row.get('gtin') or row.get('barcode'))
+                if gtin and catalog.upsert(gtin, row, Product.SOURCE_IMPORT):
+                    imported += 1
+                else:
+                    skipped += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} products ({skipped} rows skipped)'))
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import ingest
+from inventory.extraction import OCR_MODES
+
+
+class Command(BaseCommand):
+    help = ('Extract every photo in a directory into a session, resuming from the checkpoint manifest '
+            'of an interrupted run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--session', default='default', help='Session the captures are saved to')
+        parser.add_argument('--workers', type=int, default=8, help='Images decoded and OCRed in parallel')
+        parser.add_argument('--model-concurrency', type=int, default=settings.EXTRACTION_BATCH_CONCURRENCY,
+                            help='Model API calls in flight at once')
+        parser.add_argument('--batch-size', type=int, default=50, help='Images saved per transaction')
+        parser.add_argument('--manifest', help=f'Checkpoint file (default <directory>/{ingest.MANIFEST_NAME})')
+        parser.add_argument('--pattern', default='*', help='Glob of the files to ingest')
+        parser.add_argument('--recursive', action='store_true', help='Include subdirectories')
+        parser.add_argument('--max-items', type=int, default=10, help='Products kept per photo')
+        parser.add_argument('--ocr', choices=OCR_MODES, help='OCR mode (default EXTRACTION_OCR_MODE)')
+        parser.add_argument('--no-cache', action='store_true', help='Do not reuse near-duplicate captures')
+
+    def handle(self, *args, **options):
+        def progress(report):
+            self.stdout.write(f"{report['done'] + report['failed']} images, {report['captures']} captures, "
+                              f"{report['failed']} failed ({report['images_per_s']:.2f} images/s)")
+
+        try:
+            report = ingest.ingest_directory(
+                options['directory'], session_id=options['session'], workers=options['workers'],
+                model_concurrency=options['model_concurrency'], batch_size=max(1, options['batch_size']),
+                manifest=options['manifest'], pattern=options['pattern'], recursive=options['recursive'],
+                max_items=options['max_items'], ocr_mode=options['ocr'],
+                use_cache=False if options['no_cache'] else None, progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if report['skipped']:
+            self.stdout.write(f"Skipped {report['skipped']} images finished by an earlier run")
+        for name, error in report['failures']:
+            self.stdout.write(f'  {name}: {error}')
+        message = (f"Ingested {report['done']} of {report['images']} images into {report['captures']} captures "
+                   f"in {report['seconds']:.1f}s ({report['images_per_s']:.2f} images/s)")
+        if report['interrupted']:
+            self.stdout.write(self.style.WARNING(f'Interrupted. {message}; run again to resume'))
+        elif report['failed']:
+            self.stdout.write(self.style.WARNING(
+                f"{message}; {report['failed']} images failed (run again to retry them)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
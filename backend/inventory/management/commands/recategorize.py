@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import categories
+from inventory.models import ProductCapture
+
+
+class Command(BaseCommand):
+    help = 'Re-predict capture categories with the local classifier (whole sessions or everything).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', action='append', dest='sessions', default=[],
+                            help='Session id to recategorize (repeatable)')
+        parser.add_argument('--all', action='store_true', help='Recategorize every capture')
+        parser.add_argument('--min-probability', type=float, default=None,
+                            help='Override a valid category only above this probability '
+                                 '(default CATEGORY_OVERRIDE_CONFIDENCE)')
+        parser.add_argument('--dry-run', action='store_true', help='Report the changes without saving them')
+
+    def handle(self, *args, **options):
+        if not options['sessions'] and not options['all']:
+            raise CommandError('Pass --session <id> (repeatable) or --all')
+        queryset = ProductCapture.objects.all()
+        if options['sessions']:
+            queryset = queryset.filter(session_id__in=options['sessions'])
+        try:
+            examined, changes = categories.recategorize(queryset, options['min_probability'],
+                                                        dry_run=options['dry_run'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        for (old, new), n in changes.most_common():
+            self.stdout.write(f'  {old} -> {new}: {n}')
+        verb = 'Would change' if options['dry_run'] else 'Changed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {sum(changes.values())} of {examined} captures'))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import runs
+from inventory.models import ExtractionRun
+
+
+class Command(BaseCommand):
+    help = ('Re-derive captures from the stored OCR text and model output of extraction runs '
+            '(after a parsing or category mapping fix), without calling the model.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', action='append', dest='sessions', default=[],
+                            help='Session id to reprocess (repeatable)')
+        parser.add_argument('--all', action='store_true', help='Reprocess every stored run')
+        parser.add_argument('--max-items', type=int, default=None,
+                            help='Products kept per image (default: the limit of the original request)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Runs read and written per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Report the changes without saving them')
+        parser.add_argument('--force', action='store_true',
+                            help='Also replace captures that were edited by hand (the edits are lost)')
+
+    def handle(self, *args, **options):
+        if not options['sessions'] and not options['all']:
+            raise CommandError('Pass --session <id> (repeatable) or --all')
+        queryset = ExtractionRun.objects.all()
+        if options['sessions']:
+            queryset = queryset.filter(session_id__in=options['sessions'])
+        start = time.perf_counter()
+        examined, changed, removed, added, skipped = runs.reprocess(
+            queryset, options['max_items'], dry_run=options['dry_run'], chunk_size=max(1, options['batch_size']),
+            force=options['force'])
+        seconds = time.perf_counter() - start
+        verb = 'Would replace' if options['dry_run'] else 'Replaced'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} the captures of {changed} of {examined} runs ({removed} removed, {added} added) '
+            f'in {seconds:.1f}s ({examined / seconds if seconds else 0:.0f} runs/s)'))
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f'Skipped {skipped} runs with captures edited by hand (pass --force to replace them)'))
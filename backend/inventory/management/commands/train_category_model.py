@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import categories
+
+
+class Command(BaseCommand):
+    help = 'Train the local category classifier from saved captures and catalog entries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-confidence', type=float, default=None,
+                            help='Ignore captures below this confidence (default CATALOG_MIN_CONFIDENCE)')
+        parser.add_argument('--holdout', type=float, default=0.1,
+                            help='Share of examples kept out of training to measure accuracy')
+        parser.add_argument('--epochs', type=int, default=30)
+        parser.add_argument('--output', default=None, help='Model file (default CATEGORY_MODEL_PATH)')
+
+    def handle(self, *args, **options):
+        try:
+            model, report = categories.train(options['min_confidence'], holdout=options['holdout'],
+                                             epochs=options['epochs'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        path = options['output'] or str(settings.CATEGORY_MODEL_PATH)
+        model.save(path)
+        summary = (f"Trained on {report['examples']} examples ({report['features']} features, "
+                   f"{report['classes']} categories)")
+        if 'holdout_accuracy' in report:
+            summary += f", holdout accuracy {report['holdout_accuracy']:.1%}"
+        self.stdout.write(self.style.SUCCESS(f'{summary}; saved to {path}'))
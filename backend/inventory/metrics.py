@@ -0,0 +1,478 @@
+"""Pipeline timings, Server-Timing data and Prometheus metrics.
+
+``stage(name)`` times one step of a request (upload, decode, OCR, model
+call, parsing, file writes, saving). Each timing goes into the
+``inventory_stage_seconds`` histogram and into the current request's
+``RequestTimings``, which ``inventory.middleware.ServerTimingMiddleware``
+turns into a ``Server-Timing`` header and a structured log line. Database
+queries are timed by a wrapper installed on every connection (see
+``InventoryConfig.ready``).
+
+Every process keeps its own counters and histograms and writes them to
+``METRICS_DIR/<pid>.json`` at most every ``METRICS_FLUSH_INTERVAL``
+seconds (and at exit). ``/api/metrics/`` sums the files of all processes,
+so with several gunicorn workers one scrape sees the whole server. Files
+left by workers that have exited are folded into ``archived.json`` so
+their counts are kept without being read twice. That needs ``fcntl`` and
+POSIX signals; elsewhere (Windows) each process reports only its own
+values and nothing is written to ``METRICS_DIR``.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+    def key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labelnames)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if settings.METRICS_ENABLED:
+            _store.add(self.name, self.key(labels), [amount])
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not settings.METRICS_ENABLED:
+            return
+        # Per-bucket (non-cumulative) counts, then sum and count
+        values = [0] * (len(self.buckets) + 3)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                values[i] = 1
+                break
+        else:
+            values[len(self.buckets)] = 1  # +Inf
+        values[-2] = value
+        values[-1] = 1
+        _store.add(self.name, self.key(labels), values)
+
+
+class Gauge(Metric):
+    """A value read when metrics are rendered (``sample()``), e.g. state shared by all workers."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, sample):
+        super().__init__(name, documentation)
+        self.sample = sample
+
+
+REGISTRY = {}
+
+REQUEST_SECONDS = Histogram('inventory_request_seconds', 'HTTP request latency',
+                            ('method', 'route', 'status'))
+STAGE_SECONDS = Histogram('inventory_stage_seconds', 'Latency of one pipeline stage', ('stage',))
+STAGE_ERRORS = Counter('inventory_stage_errors_total', 'Pipeline stages that raised', ('stage', 'error'))
+DB_QUERY_SECONDS = Histogram('inventory_db_query_seconds', 'Database query latency', ('vendor',))
+MODEL_TOKENS = Counter('inventory_model_tokens_total', 'Tokens used by model API calls', ('kind',))
+ITEMS_PER_IMAGE = Histogram('inventory_items_per_image', 'Captures saved per extracted image', (),
+                            buckets=COUNT_BUCKETS)
+EXTRACTIONS = Counter('inventory_extractions_total', 'Extracted images by how they were answered',
+                      ('source',))
+CAPTURE_CACHE = Counter('inventory_capture_cache_total', 'Capture cache lookups', ('outcome',))
+MODEL_ADMISSIONS = Counter('inventory_model_admissions_total',
+                           'Model call admissions: admitted at once, queued first, or rejected', ('outcome',))
+MODEL_ADMISSION_WAIT = Histogram('inventory_model_admission_wait_seconds', 'Time model calls waited for admission')
+
+
+def _admission_sample(key):
+    def sample():
+        from . import admission  # imports this module
+
+        return admission.snapshot()[key] if admission.enabled() else None
+    return sample
+
+
+MODEL_IN_FLIGHT = Gauge('inventory_model_in_flight', 'Model calls in flight (all workers)',
+                        _admission_sample('in_flight'))
+MODEL_QUEUE_DEPTH = Gauge('inventory_model_queue_depth', 'Requests waiting for a model call slot (all workers)',
+                          _admission_sample('waiting'))
+MODEL_RATE_TOKENS = Gauge('inventory_model_rate_tokens', 'Model calls the rate limit would admit right now',
+                          _admission_sample('tokens'))
+
+
+class _Store:
+    """This process's metric values, flushed to its file in ``METRICS_DIR``."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(dict)  # metric name -> label key -> list of numbers
+        self.last_flush = 0.0
+
+    def add(self, name, key, values):
+        with self.lock:
+            current = self.values[name].get(key)
+            if current is None:
+                self.values[name][key] = list(values)
+            else:
+                for i, v in enumerate(values):
+                    current[i] += v
+            due = time.monotonic() - self.last_flush >= settings.METRICS_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {name: [[list(key), list(vals)] for key, vals in series.items()]
+                    for name, series in self.values.items()}
+
+    def flush(self):
+        """Write this process's values to ``<pid>.json`` (atomically)."""
+        with self.lock:
+            self.last_flush = time.monotonic()
+        if not self.values or fcntl is None:
+            return
+        try:
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            path = os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json')
+            tmp = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp, 'w') as fh:
+                json.dump(self.snapshot(), fh)
+            os.replace(tmp, path)
+        except OSError:
+            logger.exception('Could not write metrics to %s', settings.METRICS_DIR)
+
+    def reset(self):
+        with self.lock:
+            self.values.clear()
+            self.last_flush = 0.0
+
+
+_store = _Store()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        _store.flush()
+    except Exception:
+        pass
+
+
+def _pid_alive(pid):
+    # Signal 0 only checks the pid on POSIX; on Windows os.kill would terminate the process
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(into, snapshot):
+    for name, series in snapshot.items():
+        target = into.setdefault(name, {})
+        for key, values in series:
+            key = tuple(key)
+            current = target.get(key)
+            if current is None:
+                target[key] = list(values)
+            else:
+                for i, v in enumerate(values):
+                    current[i] += v
+
+
+def _read(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def collect():
+    """Values summed over every process that has written to ``METRICS_DIR`` (this one included)."""
+    if fcntl is None:
+        merged = {}
+        _merge(merged, _store.snapshot())
+        return merged
+
+    _store.flush()
+    directory = settings.METRICS_DIR
+    os.makedirs(directory, exist_ok=True)
+    merged = {}
+    # One collector at a time, so an exited worker's file is archived exactly once
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, 'archived.json')
+        archived = {}
+        _merge(archived, _read(archive_path))
+        dead = []
+        for entry in os.listdir(directory):
+            stem, ext = os.path.splitext(entry)
+            if ext != '.json' or not stem.isdigit():
+                continue
+            path = os.path.join(directory, entry)
+            snapshot = _read(path)
+            if int(stem) != os.getpid() and not _pid_alive(int(stem)):
+                _merge(archived, snapshot)
+                dead.append(path)
+            else:
+                _merge(merged, snapshot)
+        archived = {name: [[list(key), values] for key, values in series.items()]
+                    for name, series in archived.items()}
+        if dead:
+            tmp = f'{archive_path}.tmp'
+            with open(tmp, 'w') as fh:
+                json.dump(archived, fh)
+            os.replace(tmp, archive_path)
+            for path in dead:
+                os.remove(path)
+    _merge(merged, archived)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    values = collect()
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        if metric.kind == 'gauge':
+            try:
+                value = metric.sample()
+            except Exception:
+                logger.exception('Could not sample %s', name)
+                value = None
+            if value is not None:
+                lines.append(f'{name} {_number(value)}')
+            continue
+        for key, vals in sorted(values.get(name, {}).items()):
+            pairs = list(zip(metric.labelnames, key))
+            if metric.kind == 'counter':
+                lines.append(f'{name}{_labels(pairs)} {_number(vals[0])}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), vals):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(pairs + [("le", _number(float(bound)))])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(pairs)} {_number(float(vals[-2]))}')
+            lines.append(f'{name}_count{_labels(pairs)} {_number(vals[-1])}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestTimings:
+    """Stage and database timings of one request (shared with the threads it hands work to)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = defaultdict(float)
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+    def add_stage(self, name, seconds):
+        with self.lock:
+            self.stages[name] += seconds
+
+    def add_query(self, seconds):
+        with self.lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+
+
+class RunTrace:
+    """Stage timings and model token counts of one extracted image (stored by ``inventory.runs``)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add_stage(self, name, seconds):
+        with self.lock:
+            self.stages[name] += seconds
+
+    def add_tokens(self, usage):
+        with self.lock:
+            self.prompt_tokens += getattr(usage, 'prompt_tokens', 0) or 0
+            self.completion_tokens += getattr(usage, 'completion_tokens', 0) or 0
+
+    def timings_ms(self):
+        """``{stage: milliseconds}`` plus ``total`` since the trace started."""
+        with self.lock:
+            timings = {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+        timings['total'] = round((time.perf_counter() - self.started) * 1000, 2)
+        return timings
+
+
+_current = contextvars.ContextVar('inventory_request_timings', default=None)
+_run = contextvars.ContextVar('inventory_run_trace', default=None)
+
+
+def start_request():
+    """Begin collecting timings for the current request; returns ``(timings, token)``."""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def trace_run(trace=None):
+    """Collect the stages and tokens of the enclosed block into ``trace`` (a new ``RunTrace``)."""
+    trace = trace or RunTrace()
+    token = _run.set(trace)
+    try:
+        yield trace
+    finally:
+        _run.reset(token)
+
+
+def _add_stage(name, elapsed):
+    STAGE_SECONDS.observe(elapsed, stage=name)
+    for timings in (_current.get(), _run.get()):
+        if timings is not None:
+            timings.add_stage(name, elapsed)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as pipeline stage ``name``; exceptions are counted per stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            STAGE_ERRORS.inc(stage=name, error=type(e).__name__)
+        raise
+    finally:
+        _add_stage(name, time.perf_counter() - start)
+
+
+def timed_iter(name, iterable):
+    """Yield from ``iterable``, timing only the waits for its items as stage ``name``.
+
+    Used for the streamed model call, whose consumer saves each item before
+    asking for the next one.
+    """
+    elapsed = 0.0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                value = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                return
+            except Exception as e:
+                elapsed += time.perf_counter() - start
+                STAGE_ERRORS.inc(stage=name, error=type(e).__name__)
+                raise
+            elapsed += time.perf_counter() - start
+            yield value
+    finally:
+        _add_stage(name, elapsed)
+
+
+def in_context(fn):
+    """Wrap ``fn`` to run in a copy of the caller's context (for thread pools that do not copy it)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """``execute_wrapper`` installed on every DB connection: times each query."""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        DB_QUERY_SECONDS.observe(elapsed, vendor=context['connection'].vendor)
+        timings = _current.get()
+        if timings is not None:
+            timings.add_query(elapsed)
+
+
+def record_tokens(usage):
+    """Count the tokens of a model response's ``usage`` (None when the API sent none)."""
+    if usage is None:
+        return
+    trace = _run.get()
+    if trace is not None:
+        trace.add_tokens(usage)
+    MODEL_TOKENS.inc(getattr(usage, 'prompt_tokens', 0) or 0, kind='prompt')
+    MODEL_TOKENS.inc(getattr(usage, 'completion_tokens', 0) or 0, kind='completion')
+
+
+def outcome_source(outcome):
+    """How ``outcome`` was answered: ``degraded``, ``catalog``, ``index``, ``cache`` or ``model``."""
+    if outcome.get('degraded'):
+        return 'degraded'
+    if outcome.get('catalog') == 'hit':
+        return 'catalog'
+    if outcome.get('index') == 'hit':
+        return 'index'
+    if outcome.get('cache') == 'hit':
+        return 'cache'
+    return 'model'
+
+
+def record_outcome(outcome, saved_count):
+    """Count one extracted image: how it was answered, cache outcome and captures saved."""
+    EXTRACTIONS.inc(source=outcome_source(outcome))
+    CAPTURE_CACHE.inc(outcome=outcome.get('cache') or 'off')
+    ITEMS_PER_IMAGE.observe(saved_count)
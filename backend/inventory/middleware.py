@@ -0,0 +1,81 @@
+"""Per-request timing: ``Server-Timing`` header, structured log line, latency histogram."""
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger('inventory.requests')
+
+
+class ServerTimingMiddleware:
+    """Collect the stage and database timings of each request (see ``inventory.metrics``).
+
+    The response gets a ``Server-Timing`` header (one entry per pipeline
+    stage, plus ``db`` and ``total``), one JSON line is logged to the
+    ``inventory.requests`` logger and the request latency is recorded per
+    route. Streaming responses are timed up to the first byte: stages that
+    run while the body is being sent are still counted in the histograms
+    but are not in the header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self._acall(request)
+        start = time.perf_counter()
+        timings, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self._finish(request, response, timings, start)
+
+    async def _acall(self, request):
+        start = time.perf_counter()
+        timings, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self._finish(request, response, timings, start)
+
+    def _finish(self, request, response, timings, start):
+        total = time.perf_counter() - start
+        if not settings.METRICS_ENABLED:
+            return response
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(total, method=request.method, route=route, status=response.status_code)
+
+        with timings.lock:
+            stages = dict(timings.stages)
+            queries, db_seconds = timings.db_queries, timings.db_seconds
+        entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in stages.items()]
+        if queries:
+            entries.append(f'db;dur={db_seconds * 1000:.1f};desc="{queries} queries"')
+        entries.append(f'total;dur={total * 1000:.1f}')
+        response['Server-Timing'] = ', '.join(entries)
+
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'duration_ms': round(total * 1000, 1),
+            'stages_ms': {name: round(seconds * 1000, 1) for name, seconds in stages.items()},
+            'db_queries': queries,
+            'db_ms': round(db_seconds * 1000, 1),
+            'streaming': response.streaming,
+        }))
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_extractionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionjob',
+            name='ocr_mode',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+    ]
@@ -0,0 +1,67 @@
+import hashlib
+import io
+from collections import Counter
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import migrations
+
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+
+
+def dedupe_capture_images(apps, schema_editor):
+    """Move every referenced capture image to captures/<sha256><ext>, once per content."""
+    from PIL import Image
+
+    ProductCapture = apps.get_model('inventory', 'ProductCapture')
+    ImageBlob = apps.get_model('inventory', 'ImageBlob')
+
+    names = (
+        ProductCapture.objects.exclude(image='')
+        .order_by().values_list('image', flat=True).distinct()
+    )
+    renamed = {}
+    sizes = {}
+    for old_name in list(names):
+        try:
+            with default_storage.open(old_name, 'rb') as fh:
+                data = fh.read()
+        except (FileNotFoundError, OSError):
+            continue
+        digest = hashlib.sha256(data).hexdigest()
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                ext = EXTENSIONS.get(img.format, '.jpg')
+        except Exception:
+            ext = '.jpg'
+        new_name = f'captures/{digest}{ext}'
+        if not default_storage.exists(new_name):
+            default_storage.save(new_name, ContentFile(data))
+        renamed[old_name] = new_name
+        sizes[new_name] = len(data)
+
+    refs = Counter()
+    for old_name, new_name in renamed.items():
+        refs[new_name] += ProductCapture.objects.filter(image=old_name).update(image=new_name)
+
+    for name, count in refs.items():
+        digest = name.rsplit('/', 1)[-1].split('.', 1)[0]
+        ImageBlob.objects.update_or_create(
+            sha256=digest, defaults={'name': name, 'size': sizes[name], 'ref_count': count}
+        )
+
+    # Only remove the old copies once every row points at the shared file
+    for old_name, new_name in renamed.items():
+        if old_name != new_name:
+            default_storage.delete(old_name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_imageblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_capture_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 6.0 on 2026-10-17 03:04
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def backfill_sessions(apps, schema_editor):
+    """Populate Session from existing captures (same as `manage.py backfill_sessions`)."""
+    ProductCapture = apps.get_model('inventory', 'ProductCapture')
+    Session = apps.get_model('inventory', 'Session')
+
+    categories = defaultdict(dict)
+    for row in ProductCapture.objects.order_by().values('session_id', 'category').annotate(n=Count('id')):
+        categories[row['session_id']][row['category']] = row['n']
+
+    totals = ProductCapture.objects.order_by().values('session_id').annotate(
+        count=Count('id'), last_seen=Max('created_at'), conf=Sum('confidence')
+    )
+    Session.objects.bulk_create([
+        Session(
+            session_id=row['session_id'],
+            count=row['count'],
+            last_seen=row['last_seen'],
+            confidence_sum=row['conf'] or 0.0,
+            category_counts=categories[row['session_id']],
+        )
+        for row in totals
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_dedupe_capture_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Session',
+            fields=[
+                ('session_id', models.CharField(blank=True, max_length=100, primary_key=True, serialize=False)),
+                ('count', models.IntegerField(default=0)),
+                ('last_seen', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('category_counts', models.JSONField(default=dict)),
+                ('confidence_sum', models.FloatField(default=0.0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productcapture',
+            index=models.Index(fields=['session_id', 'created_at'], name='capture_session_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcapture',
+            index=models.Index(fields=['created_at', 'id'], name='capture_created_id_idx'),
+        ),
+        migrations.RunPython(backfill_sessions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-17 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_session_summary_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('gtin', models.CharField(max_length=14, primary_key=True, serialize=False)),
+                ('product_name', models.CharField(max_length=255)),
+                ('unit', models.CharField(blank=True, max_length=50)),
+                ('description', models.TextField(blank=True)),
+                ('category', models.CharField(choices=[('Food', 'Food'), ('Drinks', 'Drinks'), ('Medicine', 'Medicine'), ('Hygiene', 'Hygiene'), ('Cleaning Supplies', 'Cleaning Supplies'), ('Insecticide', 'Insecticide'), ('School Supplies', 'School Supplies'), ('Office Supplies', 'Office Supplies'), ('Tobacco', 'Tobacco'), ('Alcohol', 'Alcohol'), ('Frozen Goods', 'Frozen Goods'), ('Bread & Pastries', 'Bread & Pastries'), ('Baby Products', 'Baby Products'), ('Pet Supplies', 'Pet Supplies'), ('Hardware & Electrical', 'Hardware & Electrical'), ('Clothing & Accessories', 'Clothing & Accessories'), ('Mobile Load & E-Services', 'Mobile Load & E-Services'), ('Rice & Grains', 'Rice & Grains')], max_length=30)),
+                ('source', models.CharField(choices=[('model', 'Model'), ('capture', 'Capture'), ('confirmed', 'Confirmed'), ('import', 'Import')], default='model', max_length=10)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='productcapture',
+            name='barcode',
+            field=models.CharField(blank=True, db_index=True, max_length=14),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_product_catalog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
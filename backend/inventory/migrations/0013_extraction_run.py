@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-17 04:07
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('session_id', models.CharField(blank=True, max_length=100)),
+                ('image_sha256', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('source', models.CharField(choices=[('model', 'Model'), ('cache', 'Capture cache'), ('catalog', 'Barcode catalog'), ('index', 'Product index'), ('degraded', 'OCR only')], default='model', max_length=10)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('ocr_text', models.TextField(blank=True)),
+                ('content', models.TextField(blank=True)),
+                ('barcode', models.CharField(blank=True, max_length=14)),
+                ('max_items', models.PositiveIntegerField(default=10)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('timings', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='productcapture',
+            name='run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='captures', to='inventory.extractionrun'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_extraction_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productcapture',
+            name='edited_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
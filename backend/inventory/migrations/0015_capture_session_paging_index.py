@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-17 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_capture_edited_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='productcapture',
+            name='capture_session_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productcapture',
+            name='capture_created_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='productcapture',
+            index=models.Index(fields=['session_id', 'created_at', 'id'], name='capture_session_created_id_idx'),
+        ),
+    ]
@@ -1,6 +1,27 @@
-from django.db import models
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import Count
 import uuid
 
+
+class ProductCaptureQuerySet(models.QuerySet):
+    def delete(self):
+        # Release the shared image files and update the session summaries
+        from . import session_summary
+        from .image_store import release_many
+
+        with transaction.atomic():
+            refs = Counter(dict(
+                self.order_by().values('image').annotate(n=Count('id')).values_list('image', 'n')
+            ))
+            deltas = session_summary.removal_deltas(self)
+            result = super().delete()
+            release_many(refs)
+            session_summary.apply(deltas, recompute_last_seen=True)
+        return result
+
+
 class ProductCapture(models.Model):
     CATEGORY_CHOICES = [
         ('Food', 'Food'),
@@ -32,6 +53,202 @@ class ProductCapture(models.Model):
     confidence = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
     session_id = models.CharField(max_length=100, blank=True)  # For session grouping
-    
+    barcode = models.CharField(max_length=14, blank=True, db_index=True)  # GTIN-14, zero padded
+    # The extraction that produced this row (None for captures saved by hand)
+    run = models.ForeignKey('ExtractionRun', null=True, blank=True, on_delete=models.SET_NULL,
+                            related_name='captures')
+    # Last edit through the API; ``reprocess`` leaves the runs of edited captures alone
+    edited_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ProductCaptureQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves a session's captures newest first, and its keyset pages on (created_at, id)
+            models.Index(fields=['session_id', 'created_at', 'id'], name='capture_session_created_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_name} ({self.confidence*100:.1f}%)"
+
+    def save(self, *args, **kwargs):
+        # Keep the Session summary in step with inserts and updates
+        from . import session_summary
+
+        with transaction.atomic():
+            old = None
+            if not self._state.adding:
+                old = (
+                    ProductCapture.objects.filter(pk=self.pk)
+                    .only('session_id', 'category', 'confidence').first()
+                )
+            super().save(*args, **kwargs)
+            if old is None:
+                session_summary.record_added([self])
+            elif (old.session_id, old.category, old.confidence) != (self.session_id, self.category, self.confidence):
+                session_summary.record_changed(old, self)
+            else:
+                session_summary.touch([self.session_id])
+
+    def delete(self, *args, **kwargs):
+        from . import session_summary
+        from .image_store import release
+
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            release(self.image.name)
+            session_summary.record_removed([self])
+        return result
+
+
+class ExtractionJob(models.Model):
+    """A queued extraction request processed by the background worker pool."""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    image = models.FileField(upload_to='jobs/', blank=True)
+    session_id = models.CharField(max_length=100, blank=True)
+    max_items = models.PositiveIntegerField(default=10)
+    ocr_mode = models.CharField(max_length=10, blank=True)  # Empty means the configured default
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    progress = models.CharField(max_length=20, blank=True)  # Current pipeline stage
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
+
+
+class ExtractionRun(models.Model):
+    """OCR text and raw model output of one extracted image (see ``inventory.runs``).
+
+    Kept so its captures can be re-derived (``manage.py reprocess``) after a
+    parsing or mapping fix without calling the model again.
+    """
+    SOURCE_MODEL = 'model'
+    SOURCE_DEGRADED = 'degraded'
+    SOURCE_CHOICES = [
+        (SOURCE_MODEL, 'Model'),
+        ('cache', 'Capture cache'),
+        ('catalog', 'Barcode catalog'),
+        ('index', 'Product index'),
+        (SOURCE_DEGRADED, 'OCR only'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    session_id = models.CharField(max_length=100, blank=True)
+    image_sha256 = models.CharField(max_length=64, blank=True, db_index=True)  # See ImageBlob
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default=SOURCE_MODEL)
+    model = models.CharField(max_length=100, blank=True)
+    ocr_text = models.TextField(blank=True)
+    content = models.TextField(blank=True)  # Raw model response
+    barcode = models.CharField(max_length=14, blank=True)
+    max_items = models.PositiveIntegerField(default=10)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    timings = models.JSONField(default=dict, blank=True)  # Stage -> milliseconds
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Run {self.id} ({self.source})"
+
+
+class Upload(models.Model):
+    """A resumable upload whose bytes are spooled to ``UPLOAD_SPOOL_DIR`` (see ``inventory.uploads``)."""
+    STATUS_OPEN = 'open'
+    STATUS_FINALIZED = 'finalized'
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Open'),
+        (STATUS_FINALIZED, 'Finalized'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    session_id = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()  # Total bytes the client announced
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.size} bytes, {self.status})"
+
+
+class CaptureCacheEntry(models.Model):
+    """Extraction result remembered for a perceptual hash of the captured image."""
+    image_hash = models.CharField(max_length=16, unique=True)  # 64-bit dHash, hex encoded
+    items = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.image_hash} ({len(self.items)} items, {self.hits} hits)"
+
+
+class ImageBlob(models.Model):
+    """A stored image file shared by every capture made from the same bytes."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255, unique=True)  # Storage path, e.g. captures/<sha256>.jpg
+    size = models.PositiveIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class Session(models.Model):
+    """Summary of one capture session, maintained incrementally on every write."""
+    session_id = models.CharField(max_length=100, primary_key=True, blank=True)
+    count = models.IntegerField(default=0)
+    last_seen = models.DateTimeField(null=True, blank=True, db_index=True)
+    category_counts = models.JSONField(default=dict)
+    confidence_sum = models.FloatField(default=0.0)
+    # Bumped on every change to the session's captures; read endpoints derive their ETags from it
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    @property
+    def mean_confidence(self):
+        return self.confidence_sum / self.count if self.count else None
+
+    def __str__(self):
+        return f"{self.session_id or 'default'} ({self.count} captures)"
+
+
+class Product(models.Model):
+    """Catalog entry for one barcode (GTIN), used to resolve captures without the model."""
+    SOURCE_MODEL = 'model'
+    SOURCE_CAPTURE = 'capture'
+    SOURCE_CONFIRMED = 'confirmed'
+    SOURCE_IMPORT = 'import'
+    SOURCE_CHOICES = [
+        (SOURCE_MODEL, 'Model'),
+        (SOURCE_CAPTURE, 'Capture'),
+        (SOURCE_CONFIRMED, 'Confirmed'),
+        (SOURCE_IMPORT, 'Import'),
+    ]
+
+    gtin = models.CharField(max_length=14, primary_key=True)  # GTIN-14, zero padded
+    product_name = models.CharField(max_length=255)
+    unit = models.CharField(max_length=50, blank=True)
+    description = models.TextField(blank=True)
+    category = models.CharField(max_length=30, choices=ProductCapture.CATEGORY_CHOICES)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default=SOURCE_MODEL)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"{self.product_name} ({self.confidence*100:.1f}%)"
\ No newline at end of file
+        return f"{self.gtin} {self.product_name}"
@@ -0,0 +1,137 @@
+"""OCR backends used by the extraction pipeline.
+
+``PytesseractBackend`` shells out to the ``tesseract`` binary for every call
+(fork, temp file, language model reload). ``TesserocrPoolBackend`` keeps a
+bounded pool of initialized Tesseract API handles alive in the process and
+feeds them the in-memory PIL image directly. It needs the optional
+``tesserocr`` package; without it the pytesseract backend is used.
+"""
+import logging
+import queue
+import threading
+
+import pytesseract
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OCRBackend:
+    name = 'base'
+
+    def image_to_string(self, pil_image) -> str:
+        raise NotImplementedError
+
+
+class PytesseractBackend(OCRBackend):
+    """Run the ``tesseract`` binary in a subprocess for each image."""
+    name = 'pytesseract'
+
+    def __init__(self, lang='eng'):
+        self.lang = lang
+
+    def image_to_string(self, pil_image) -> str:
+        return pytesseract.image_to_string(pil_image, lang=self.lang)
+
+
+class TesserocrPoolBackend(OCRBackend):
+    """Reuse up to ``size`` long-lived ``tesserocr.PyTessBaseAPI`` handles.
+
+    Handles are created lazily and each one is used by a single thread at a
+    time; callers block when all ``size`` handles are busy.
+    """
+    name = 'tesserocr'
+
+    def __init__(self, size=4, lang='eng', path=None):
+        import tesserocr  # Optional dependency; ImportError means "not available"
+
+        self._tesserocr = tesserocr
+        self.size = max(1, size)
+        self.lang = lang
+        self.path = path
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _new_api(self):
+        kwargs = {'lang': self.lang}
+        if self.path:
+            kwargs['path'] = self.path
+        return self._tesserocr.PyTessBaseAPI(**kwargs)
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            api = self._new_api()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._created += 1
+        return api
+
+    def _release(self, api):
+        self._idle.put(api)
+        self._slots.release()
+
+    def image_to_string(self, pil_image) -> str:
+        api = self._acquire()
+        try:
+            api.SetImage(pil_image)
+            text = api.GetUTF8Text()
+            api.Clear()
+        except Exception:
+            # Don't hand a handle in an unknown state back to the pool
+            with self._lock:
+                self._created -= 1
+            self._slots.release()
+            api.End()
+            raise
+        self._release(api)
+        return text
+
+    def close(self):
+        while True:
+            try:
+                api = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            api.End()
+
+
+def create_backend(name=None):
+    """Build the OCR backend named by ``name`` (or the ``OCR_BACKEND`` setting).
+
+    ``auto`` prefers the pooled tesserocr engine and falls back to
+    pytesseract when tesserocr is not installed.
+    """
+    name = (name or settings.OCR_BACKEND).lower()
+    lang = settings.OCR_LANG
+    if name in ('auto', 'tesserocr'):
+        try:
+            return TesserocrPoolBackend(size=settings.OCR_POOL_SIZE, lang=lang,
+                                        path=settings.OCR_TESSDATA_PATH)
+        except ImportError:
+            if name == 'tesserocr':
+                logger.warning('tesserocr is not installed; falling back to pytesseract')
+    elif name != 'pytesseract':
+        raise ValueError(f"Unknown OCR backend '{name}'")
+    return PytesseractBackend(lang=lang)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_ocr_backend():
+    """Return the process-wide OCR backend, creating it on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+        return _backend
@@ -0,0 +1,76 @@
+"""Keyset (cursor) pagination for list endpoints.
+
+Pages are ordered by ``(timestamp, key)`` descending. The opaque cursor
+encodes the last row's values, and the next page is fetched with
+``WHERE (ts, key) < (cursor_ts, cursor_key)`` so every page costs one
+indexed range scan however deep the client pages.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(ts, key) -> str:
+    raw = json.dumps([ts.isoformat(), str(key)]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str, parse_key=str):
+    """Return the ``(ts, key)`` of a cursor; ``parse_key`` converts (and validates) the key.
+
+    Raises ``InvalidCursor`` for a malformed or tampered cursor.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        ts, key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        parsed = parse_datetime(ts)
+        if not isinstance(key, str):
+            raise TypeError(key)
+        key = parse_key(key)
+    except Exception:
+        raise InvalidCursor('Invalid cursor')
+    if parsed is None:
+        raise InvalidCursor('Invalid cursor')
+    return parsed, key
+
+
+def page_size(params):
+    """Read ``limit`` from query params, clamped to ``MAX_PAGE_SIZE``."""
+    try:
+        limit = int(params.get('limit', settings.DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise InvalidCursor('limit must be an integer')
+    return max(1, min(limit, settings.MAX_PAGE_SIZE))
+
+
+def is_paginated(params):
+    return 'cursor' in params or 'limit' in params
+
+
+def paginate(queryset, params, ts_field, key_field):
+    """Return ``(rows, next_cursor)`` for one page of ``queryset``.
+
+    Raises ``InvalidCursor`` for a malformed ``cursor`` or ``limit``.
+    """
+    limit = page_size(params)
+    queryset = queryset.order_by(f'-{ts_field}', f'-{key_field}')
+    if params.get('cursor'):
+        # e.g. uuid.UUID for a UUIDField key, so a bad key is a 400 rather than a failed query
+        ts, key = decode_cursor(params['cursor'], queryset.model._meta.get_field(key_field).to_python)
+        queryset = queryset.filter(
+            Q(**{f'{ts_field}__lt': ts}) | Q(**{ts_field: ts, f'{key_field}__lt': key})
+        )
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, ts_field), getattr(last, key_field))
+    return rows, next_cursor
@@ -0,0 +1,56 @@
+"""Bulk, transactional persistence of captures.
+
+All rows of a save are validated first, then written with a single
+``bulk_create`` inside one transaction together with their image
+references. Files written for a save that fails are removed again.
+"""
+import hashlib
+from collections import defaultdict
+
+from django.db import transaction
+
+from . import image_store, metrics, session_summary
+from .models import ExtractionRun, ProductCapture
+
+
+def bulk_save_captures(captures, images=None, batch_size=None, runs=None):
+    """Insert unsaved ``ProductCapture`` objects in one transaction.
+
+    ``images`` optionally maps each capture (by position) to the image bytes
+    it should reference; identical bytes are stored once and referenced by
+    every capture that uses them. Captures without an entry keep whatever
+    ``image.name`` they already have. ``runs`` are unsaved ``ExtractionRun``
+    rows inserted first, in the same transaction (also those that produced
+    no captures). Returns the list of saved captures.
+    """
+    captures = list(captures)
+    if not captures and not runs:
+        return captures
+
+    # Group captures by image content so each distinct file is acquired once
+    groups = defaultdict(list)
+    blobs = {}
+    for capture, data in zip(captures, images or []):
+        if data is None:
+            continue
+        digest = hashlib.sha256(data).hexdigest()
+        groups[digest].append(capture)
+        blobs[digest] = data
+
+    written = []
+    try:
+        with transaction.atomic():
+            with metrics.stage('store'):
+                for digest, members in groups.items():
+                    name = image_store.acquire(blobs[digest], refs=len(members), written=written)
+                    for capture in members:
+                        capture.image.name = name
+            with metrics.stage('save'):
+                if runs:
+                    ExtractionRun.objects.bulk_create(runs, batch_size=batch_size)
+                ProductCapture.objects.bulk_create(captures, batch_size=batch_size)
+                session_summary.record_added(captures)
+    except Exception:
+        image_store.discard_unreferenced(written)
+        raise
+    return captures
@@ -0,0 +1,395 @@
+"""Fuzzy name index over known products.
+
+Each entry is a (product name, unit, category) the inventory already knows,
+from the barcode catalog and from high-confidence or user-edited captures.
+Entries are matched by trigram similarity, the same word-padded trigrams as
+PostgreSQL's ``pg_trgm``, through an inverted index (trigram -> numpy array
+of entry ids). A lookup sums the posting lists of the query's trigrams with
+``np.bincount``, so its cost depends on how common the query's trigrams
+are rather than on comparing against every product name. The pipeline uses it in two ways:
+
+- ``match_ocr``: the OCR text contains (almost) all trigrams of a known
+  product's name and unit, so the capture is answered without the model;
+- ``canonical``: the model's name is close to a known one, so the known
+  spelling is saved instead of a new variant.
+
+The index is persisted as a snapshot (``PRODUCT_INDEX_PATH``, written by
+the ``build_product_index`` command) plus an append-only journal of
+user-confirmed entries (``<path>.journal``) replayed on top of it. Each
+process loads the snapshot once and applies new journal lines on its next
+lookup, so an edit made in one worker reaches the others without a rebuild.
+"""
+import json
+import logging
+import os
+import pickle
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict, namedtuple
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+Match = namedtuple('Match', 'product_name unit category score')
+
+_NON_WORD = re.compile(r'[\W_]+')
+_EMPTY = np.empty(0, dtype=np.int32)
+
+SNAPSHOT_VERSION = 1
+
+
+def normalize(text):
+    """Lowercase, strip accents and punctuation, collapse whitespace."""
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(_NON_WORD.sub(' ', text.lower()).split())
+
+
+def trigrams(text):
+    """Set of word trigrams of ``text`` (each word padded with two leading and one trailing space)."""
+    grams = set()
+    for word in normalize(text).split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def entry_text(name, unit):
+    return f'{name} {unit or ""}'
+
+
+class ProductIndex:
+    def __init__(self):
+        self.names = []
+        self.units = []
+        self.categories = []
+        self.keys = {}  # normalized "name unit" -> entry id
+        self.postings = {}  # trigram -> int32 array of entry ids
+        self._sizes = np.zeros(1024, dtype=np.float32)  # trigrams per entry (grown by doubling)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def sizes(self):
+        return self._sizes[:len(self.names)]
+
+    def _new_entry(self, key, name, unit, category):
+        entry_id = len(self.names)
+        self.keys[key] = entry_id
+        self.names.append(name)
+        self.units.append(unit)
+        self.categories.append(category)
+        return entry_id
+
+    def add(self, name, unit='', category='Food'):
+        """Add an entry, or update the category of an existing one. Returns its id."""
+        name = (name or '').strip()
+        unit = (unit or '').strip()
+        key = normalize(entry_text(name, unit))
+        if not key:
+            return None
+        entry_id = self.keys.get(key)
+        if entry_id is not None:
+            self.names[entry_id], self.units[entry_id] = name, unit
+            self.categories[entry_id] = category
+            return entry_id
+
+        entry_id = self._new_entry(key, name, unit, category)
+        grams = trigrams(key)
+        if entry_id >= len(self._sizes):
+            self._sizes = np.concatenate([self._sizes, np.zeros_like(self._sizes)])
+        self._sizes[entry_id] = len(grams)
+        ids = np.array([entry_id], dtype=np.int32)
+        for gram in grams:
+            self.postings[gram] = np.concatenate([self.postings.get(gram, _EMPTY), ids])
+        return entry_id
+
+    @classmethod
+    def build(cls, entries):
+        """Build an index from ``(name, unit, category)`` tuples in one pass."""
+        index = cls()
+        lists = defaultdict(list)
+        sizes = []
+        for name, unit, category in entries:
+            name, unit = (name or '').strip(), (unit or '').strip()
+            key = normalize(entry_text(name, unit))
+            if not key:
+                continue
+            if key in index.keys:
+                index.categories[index.keys[key]] = category
+                continue
+            entry_id = index._new_entry(key, name, unit, category)
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                lists[gram].append(entry_id)
+        index.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in lists.items()}
+        index._sizes = np.array(sizes or [0], dtype=np.float32)
+        return index
+
+    def _overlap(self, grams):
+        """Number of ``grams`` each entry shares with the query (None if no entry shares any)."""
+        lists = [self.postings[g] for g in grams if g in self.postings]
+        if not lists:
+            return None
+        return np.bincount(np.concatenate(lists), minlength=len(self.names))
+
+    def _match(self, entry_id, score):
+        return Match(self.names[entry_id], self.units[entry_id], self.categories[entry_id],
+                     round(float(score), 3))
+
+    def best(self, text, threshold=0.0):
+        """Entry most similar to ``text`` (Dice coefficient over trigrams), if >= ``threshold``."""
+        grams = trigrams(text)
+        overlap = self._overlap(grams)
+        if overlap is None:
+            return None
+        scores = 2 * overlap / (len(grams) + self.sizes)
+        entry_id = int(np.argmax(scores))
+        if scores[entry_id] < threshold:
+            return None
+        return self._match(entry_id, scores[entry_id])
+
+    def contained(self, text, threshold, min_trigrams=1):
+        """Entry whose trigrams are best covered by ``text`` (e.g. OCR of a whole label).
+
+        Only entries with at least ``min_trigrams`` trigrams count, so a
+        short generic name ("milk") is not matched by any text containing
+        it. Since the trigrams of a long text can cover a name that is not
+        in it ("ibu" from "distributed"), a candidate must also have all of
+        its words, give or take a misread character, on one line (or two
+        adjacent lines) and its unit somewhere in full, so "1L" is never
+        answered with the 500ml size. Among entries covered at >=
+        ``threshold`` the one sharing most trigrams wins, i.e. the most
+        specific product.
+        """
+        grams = trigrams(text)
+        overlap = self._overlap(grams)
+        if overlap is None:
+            return None
+        sizes = self.sizes
+        coverage = np.where(sizes >= min_trigrams, overlap / np.maximum(sizes, 1), 0)
+        candidates = np.flatnonzero(coverage >= threshold)
+        if not len(candidates):
+            return None
+        lines = [line for line in (normalize(line) for line in text.splitlines()) if line]
+        windows = lines + [f'{a} {b}' for a, b in zip(lines, lines[1:])]
+        windows = [set(window.split()) for window in windows]
+        for entry_id in candidates[np.argsort(-overlap[candidates], kind='stable')]:
+            if not trigrams(self.units[entry_id]) <= grams:
+                continue
+            name_words = normalize(self.names[entry_id]).split()
+            if any(all(word in words or any(_close(word, w) for w in words) for word in name_words)
+                   for words in windows):
+                return self._match(entry_id, coverage[entry_id])
+        return None
+
+    def save(self, path):
+        """Write a snapshot atomically (readers never see a half-written file)."""
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'names': self.names,
+            'units': self.units,
+            'categories': self.categories,
+            'sizes': self.sizes.copy(),
+            'postings': self.postings,
+        }
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as fh:
+            pickle.dump(data, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as fh:
+            data = pickle.load(fh)
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f'Unsupported product index snapshot version {data.get("version")}')
+        index = cls()
+        index.names, index.units, index.categories = data['names'], data['units'], data['categories']
+        index.keys = {normalize(entry_text(n, u)): i for i, (n, u) in enumerate(zip(index.names, index.units))}
+        index.postings = data['postings']
+        if len(data['sizes']):
+            index._sizes = data['sizes']
+        return index
+
+
+def _close(word, other):
+    """Equal, or one misread character apart: a substitution (4+ letters) or a dropped/extra one (6+)."""
+    if word == other:
+        return True
+    if len(word) == len(other):
+        return len(word) >= 4 and sum(a != b for a, b in zip(word, other)) == 1
+    if abs(len(word) - len(other)) != 1 or min(len(word), len(other)) < 6:
+        return False
+    short, long_ = sorted((word, other), key=len)
+    return any(long_[:i] + long_[i + 1:] == short for i in range(len(long_)))
+
+
+_lock = threading.Lock()
+_index = None
+_snapshot_mtime = None
+_journal_offset = 0
+
+
+def snapshot_path():
+    return str(settings.PRODUCT_INDEX_PATH)
+
+
+def journal_path():
+    return f'{snapshot_path()}.journal'
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _refresh():
+    """Reload the snapshot if it changed and apply journal lines not seen yet (caller holds _lock)."""
+    global _index, _snapshot_mtime, _journal_offset
+    mtime = _mtime(snapshot_path())
+    if _index is None or mtime != _snapshot_mtime:
+        index = ProductIndex()
+        if mtime is not None:
+            try:
+                index = ProductIndex.load(snapshot_path())
+            except Exception:
+                logger.exception('Could not load the product index snapshot; starting empty')
+        _index, _snapshot_mtime, _journal_offset = index, mtime, 0
+
+    try:
+        size = os.stat(journal_path()).st_size
+    except FileNotFoundError:
+        return
+    if size <= _journal_offset:
+        return
+    with open(journal_path(), 'rb') as fh:
+        fh.seek(_journal_offset)
+        chunk = fh.read(size - _journal_offset)
+    # Only complete lines; a line still being appended is picked up next time
+    complete = chunk[:chunk.rfind(b'\n') + 1]
+    for line in complete.splitlines():
+        try:
+            entry = json.loads(line)
+            _index.add(entry['product_name'], entry.get('unit', ''), entry.get('category', 'Food'))
+        except (ValueError, KeyError):
+            continue
+    _journal_offset += len(complete)
+
+
+def get_index():
+    """This process's index, brought up to date with the snapshot and journal."""
+    with _lock:
+        _refresh()
+        return _index
+
+
+def reset():
+    """Forget the loaded index (it is reloaded on the next lookup)."""
+    global _index, _snapshot_mtime, _journal_offset
+    with _lock:
+        _index, _snapshot_mtime, _journal_offset = None, None, 0
+
+
+def match_ocr(ocr_text):
+    """Known product whose name and unit appear in ``ocr_text``, as an item dict, or None."""
+    if not settings.PRODUCT_INDEX_ENABLED or not (ocr_text or '').strip():
+        return None
+    with _lock:
+        _refresh()
+        match = _index.contained(ocr_text, settings.PRODUCT_INDEX_OCR_THRESHOLD,
+                                 settings.PRODUCT_INDEX_MIN_TRIGRAMS)
+    if match is None:
+        return None
+    return {
+        'product_name': match.product_name,
+        'unit': match.unit,
+        'description': '',
+        'category': match.category,
+        'confidence': match.score,
+    }
+
+
+def canonical(name, unit=''):
+    """The known entry closest to a model-produced name (and unit), or None."""
+    if not settings.PRODUCT_INDEX_ENABLED or not (name or '').strip():
+        return None
+    with _lock:
+        _refresh()
+        return _index.best(entry_text(name, unit), settings.PRODUCT_INDEX_CANONICAL_THRESHOLD)
+
+
+def canonicalize(item):
+    """Copy of a model item with its name (and missing unit) replaced by the closest known entry."""
+    if not isinstance(item, dict):
+        return item
+    match = canonical(item.get('product_name'), item.get('unit'))
+    if match is None:
+        return item
+    item = dict(item, product_name=match.product_name)
+    if not item.get('unit'):
+        item['unit'] = match.unit
+    return item
+
+
+def record(name, unit='', category='Food'):
+    """Append a confirmed product to the journal; every process picks it up on its next lookup."""
+    if not settings.PRODUCT_INDEX_ENABLED or not (name or '').strip():
+        return
+    line = json.dumps({'product_name': name, 'unit': unit or '', 'category': category}) + '\n'
+    with _lock:
+        # O_APPEND keeps concurrent writers' lines whole
+        with open(journal_path(), 'a', encoding='utf-8') as fh:
+            fh.write(line)
+
+
+def confirm(capture):
+    """Record a user-edited capture as a known product."""
+    record(capture.product_name, capture.unit, capture.category)
+
+
+def known_products(min_confidence=None):
+    """``(name, unit, category)`` for every catalog entry and agreed-on capture.
+
+    Captures count when their confidence is >= ``min_confidence`` (default
+    ``CATALOG_MIN_CONFIDENCE``); the most common category per name and unit
+    wins. Catalog entries come last so their category overrides the captures'.
+    """
+    from .models import Product, ProductCapture
+
+    if min_confidence is None:
+        min_confidence = settings.CATALOG_MIN_CONFIDENCE
+    entries = []
+    votes = defaultdict(Counter)
+    rows = (
+        ProductCapture.objects.filter(confidence__gte=min_confidence)
+        .values_list('product_name', 'unit', 'category')
+        .iterator()
+    )
+    for name, unit, category in rows:
+        votes[(name, unit)][category] += 1
+    for (name, unit), counter in votes.items():
+        entries.append((name, unit, counter.most_common(1)[0][0]))
+    entries.extend(Product.objects.values_list('product_name', 'unit', 'category').iterator())
+    return entries
+
+
+def rebuild(min_confidence=None):
+    """Write a fresh snapshot from the database and return its entry count.
+
+    The journal is kept: edits of low-confidence captures are only recorded
+    there, and it is replayed on top of every snapshot.
+    """
+    index = ProductIndex.build(known_products(min_confidence))
+    with _lock:
+        index.save(snapshot_path())
+    return len(index)
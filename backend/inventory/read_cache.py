@@ -0,0 +1,102 @@
+"""Conditional GET and payload caching for the list endpoints.
+
+``/api/session/products/`` and ``/api/sessions/`` are polled by the
+frontend to refresh its lists. Their responses only change when a
+session's ``version`` is bumped (see ``inventory.session_summary``), so:
+
+- the ETag is that version stamp plus a hash of the full URL and the
+  negotiated format, and ``Last-Modified`` is the session's ``updated_at``;
+- a request whose ``If-None-Match`` matches gets a 304 after one indexed
+  lookup of the stamp. ``If-Modified-Since`` alone is not honoured: its
+  one-second resolution would hide a second write within the same second;
+- otherwise the rendered JSON body is looked up in Django's cache under
+  the ETag, so another client asking for the same unchanged list skips the
+  query, serialization and rendering too.
+
+A bumped version changes the ETag, so cached bodies are never invalidated
+explicitly; stale ones age out (``READ_CACHE_TIMEOUT``) or are evicted by
+the cache's size bound. Payloads with more than
+``READ_CACHE_MAX_ROWS`` rows are not cached, which keeps a few huge
+sessions from filling the process memory.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .models import Session
+
+KEY_PREFIX = 'inventory:reads:'
+
+
+def session_stamp(session_id):
+    """``(stamp, updated_at)`` of one session; one primary-key lookup."""
+    row = Session.objects.filter(session_id=session_id).values_list('version', 'updated_at').first()
+    if row is None:
+        return 'empty', None
+    version, updated_at = row
+    return f'{version}.{_micros(updated_at)}', updated_at
+
+
+def sessions_stamp():
+    """``(stamp, updated_at)`` of the sessions list; one aggregate over the Session table.
+
+    Every write bumps one session's version (so the sum grows) or drops a
+    session (so the count changes), and ``updated_at`` tells apart a session
+    that was deleted and recreated.
+    """
+    row = Session.objects.aggregate(n=Count('session_id'), versions=Sum('version'), last=Max('updated_at'))
+    return f"{row['n']}.{row['versions'] or 0}.{_micros(row['last'])}", row['last']
+
+
+def _micros(value):
+    return int(value.timestamp() * 1_000_000) if value is not None else 0
+
+
+def etag(request, stamp):
+    """Strong ETag of the representation of ``request`` at version ``stamp``."""
+    variant = f'{request.build_absolute_uri()}|{request.accepted_renderer.format}'
+    return f'"{stamp}-{hashlib.sha1(variant.encode()).hexdigest()[:16]}"'
+
+
+def _rows(data):
+    return len(data['results']) if isinstance(data, dict) and 'results' in data else len(data)
+
+
+def _cacheable(request, data):
+    # The browsable API renders per request; only JSON bodies are worth keeping
+    return (settings.READ_CACHE_ENABLED and request.accepted_renderer.format == 'json'
+            and _rows(data) <= settings.READ_CACHE_MAX_ROWS)
+
+
+def conditional(request, stamp, updated_at, build):
+    """Answer a GET from the stamp: 304, a cached body or ``build()``'s response.
+
+    ``build`` returns a DRF ``Response``; only 200s are cached.
+    """
+    tag = etag(request, stamp)
+    response = get_conditional_response(request, etag=tag)
+    if response is None:
+        key = KEY_PREFIX + tag
+        content = cache.get(key) if settings.READ_CACHE_ENABLED else None
+        if content is None:
+            response = build()
+            if response.status_code != 200:
+                return response
+            if _cacheable(request, response.data):
+                content = request.accepted_renderer.render(response.data, request.accepted_media_type,
+                                                           {'request': request, 'response': response})
+                cache.set(key, content, settings.READ_CACHE_TIMEOUT)
+        if content is not None:
+            response = HttpResponse(content, content_type=request.accepted_media_type)
+    response['ETag'] = tag
+    if updated_at is not None:
+        response['Last-Modified'] = http_date(updated_at.timestamp())
+    # Let browsers keep the list but revalidate it on every refresh
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Accept',))
+    return response
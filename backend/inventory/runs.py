@@ -0,0 +1,153 @@
+"""Extraction runs: what the pipeline saw and answered for each image.
+
+Every image extracted through ``run_extraction`` (and its async, batch,
+streaming and ``ingest_images`` variants) is recorded as an
+``ExtractionRun``: the OCR text, the raw model response, the model name,
+token counts and stage timings (collected by ``metrics.trace_run``). The
+captures it produced point at it (``ProductCapture.run``); a run that
+produced none is kept too.
+
+After a fix to ``parse_items``, a different ``max_items`` or a new category
+mapping or product index, ``reprocess`` re-derives the captures of stored
+runs from those artifacts alone, without calling the model. Runs with a
+capture a user has edited (``ProductCapture.edited_at``) are skipped unless
+``force`` is passed, so manual corrections are not overwritten. Only runs
+answered by the model (``content``) or from OCR alone (``ocr_text``) can be
+re-derived; catalog, product index and capture cache answers were not
+produced from the run's own artifacts.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from . import image_store, metrics, session_summary
+from .models import ExtractionRun, ImageBlob, ProductCapture
+
+REPROCESSABLE = (ExtractionRun.SOURCE_MODEL, ExtractionRun.SOURCE_DEGRADED)
+
+# Fields compared to decide whether a run's captures changed
+CAPTURE_FIELDS = ('product_name', 'unit', 'description', 'category', 'confidence', 'barcode')
+
+
+def build(outcome, session_id='default', max_items=10):
+    """An unsaved ``ExtractionRun`` for an ``analyze_image`` outcome."""
+    stored = outcome.get('stored_bytes')
+    run = ExtractionRun(session_id=session_id, max_items=max_items,
+                        image_sha256=hashlib.sha256(stored).hexdigest() if stored else '')
+    return update(run, outcome)
+
+
+def update(run, outcome):
+    """Copy the artifacts of ``outcome`` (and of its ``trace``, if any) onto ``run``."""
+    trace = outcome.get('trace')
+    run.source = metrics.outcome_source(outcome)
+    run.content = outcome.get('content') or ''
+    run.ocr_text = outcome.get('ocr_text') or ''
+    run.model = settings.OPENAI_MODEL if run.content else ''
+    run.barcode = outcome.get('barcode') or ''
+    if trace is not None:
+        run.prompt_tokens = trace.prompt_tokens
+        run.completion_tokens = trace.completion_tokens
+        run.timings = trace.timings_ms()
+    return run
+
+
+def attach(run, captures):
+    """Point ``captures`` at ``run``; returns them."""
+    for capture in captures:
+        capture.run = run
+    return captures
+
+
+def derive_items(run, max_items=None):
+    """The items ``run``'s stored artifacts parse to today."""
+    from .extraction import ocr_items, parse_items  # imports this module
+
+    if run.source == ExtractionRun.SOURCE_DEGRADED:
+        items = ocr_items(run.ocr_text)
+    else:
+        try:
+            items = parse_items(run.content)
+        except ValueError:
+            items = []
+    return items[:max_items or run.max_items]
+
+
+def reprocess(queryset, max_items=None, dry_run=False, chunk_size=2000, force=False):
+    """Re-derive the captures of the runs in ``queryset`` from their stored artifacts.
+
+    Runs are read ``chunk_size`` at a time. A run whose derived captures
+    differ from its current ones (see ``CAPTURE_FIELDS``) has them replaced
+    in the chunk's transaction; the new rows reference the same image and
+    keep the run's ``created_at``. A run with an edited capture is left as
+    it is (and counted in ``skipped``) unless ``force`` is set. Returns
+    ``(examined, changed, removed, added, skipped)``.
+    """
+    from .extraction import build_captures  # imports this module
+
+    examined = changed = removed = added = skipped = 0
+    runs = queryset.filter(source__in=REPROCESSABLE).order_by('pk').only(
+        'id', 'session_id', 'image_sha256', 'source', 'ocr_text', 'content', 'barcode', 'max_items',
+        'created_at')
+    last_pk = None
+    while True:
+        chunk = list((runs.filter(pk__gt=last_pk) if last_pk else runs)[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+        examined += len(chunk)
+
+        current = {run.pk: [] for run in chunk}
+        images = {}
+        edited = set()
+        for row in ProductCapture.objects.filter(run__in=chunk).values('run_id', 'image', 'edited_at',
+                                                                       *CAPTURE_FIELDS):
+            current[row['run_id']].append(tuple(row[f] for f in CAPTURE_FIELDS))
+            images[row['run_id']] = row['image']
+            if row['edited_at'] is not None:
+                edited.add(row['run_id'])
+        # Runs whose captures are all gone still have their image if another capture shares it
+        blobs = dict(ImageBlob.objects.filter(sha256__in={r.image_sha256 for r in chunk if r.image_sha256})
+                     .values_list('sha256', 'name'))
+
+        stale, captures = [], []
+        for run in chunk:
+            rows = build_captures(derive_items(run, max_items), run.session_id, run.barcode or None)
+            if sorted(tuple(getattr(c, f) for f in CAPTURE_FIELDS) for c in rows) == sorted(current[run.pk]):
+                continue
+            if run.pk in edited and not force:
+                skipped += 1
+                continue
+            image = images.get(run.pk) or blobs.get(run.image_sha256, '')
+            for capture in attach(run, rows):
+                capture.image.name = image
+            stale.append(run.pk)
+            captures.extend(rows)
+            removed += len(current[run.pk])
+        changed += len(stale)
+        added += len(captures)
+        if stale and not dry_run:
+            _replace(stale, captures)
+    return examined, changed, removed, added, skipped
+
+
+def _replace(run_ids, captures):
+    refs = {}
+    for capture in captures:
+        if capture.image.name:
+            refs[capture.image.name] = refs.get(capture.image.name, 0) + 1
+    with transaction.atomic():
+        # Take the new references first, so no shared image drops to zero in between
+        image_store.retain_many(refs)
+        ProductCapture.objects.filter(run__in=run_ids).delete()
+        ProductCapture.objects.bulk_create(captures)
+        # bulk_create stamps created_at with now; keep each capture at its run's time
+        ProductCapture.objects.filter(run__in=run_ids).update(
+            created_at=Subquery(ExtractionRun.objects.filter(pk=OuterRef('run_id')).values('created_at')[:1])
+        )
+        for capture in captures:
+            capture.created_at = capture.run.created_at
+        session_summary.apply(session_summary.deltas_for(captures), recompute_last_seen=True)
+
@@ -1,8 +1,92 @@
 from rest_framework import serializers
-from .models import ProductCapture
+from . import image_store, thumbnails
+from .models import ExtractionJob, ProductCapture
+from .persistence import bulk_save_captures
+
+
+class ProductCaptureListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        # Insert the whole (already validated) batch in one transaction
+        captures, images = [], []
+        for attrs in validated_data:
+            attrs = dict(attrs)
+            upload = attrs.pop('image', None)
+            captures.append(ProductCapture(**attrs))
+            images.append(upload.read() if upload is not None else None)
+        return bulk_save_captures(captures, images)
+
 
 class ProductCaptureSerializer(serializers.ModelSerializer):
+    """Serializer for captures. Pass ``fields=[...]`` to emit only those fields (plus ``id``).
+
+    ``image_url``, ``medium_url`` and ``thumbnail_url`` are the immutable
+    ``/api/media/`` URLs of the stored image and its derivatives (see
+    ``inventory/thumbnails.py``); list screens should use the thumbnail.
+    """
+    # Serializer field -> media variant
+    URL_FIELDS = {'image_url': 'original', 'medium_url': 'medium', 'thumbnail_url': 'small'}
+
+    image_url = serializers.SerializerMethodField()
+    medium_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    # The ExtractionRun the row came from, as a plain UUID string
+    run = serializers.PrimaryKeyRelatedField(read_only=True, pk_field=serializers.UUIDField())
+
     class Meta:
         model = ProductCapture
         fields = '__all__'
-        read_only_fields = ('id', 'created_at')
\ No newline at end of file
+        read_only_fields = ('id', 'created_at', 'edited_at')
+        list_serializer_class = ProductCaptureListSerializer
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            keep = set(fields) | {'id'}
+            for name in list(self.fields):
+                if name not in keep:
+                    self.fields.pop(name)
+
+    def media_url(self, obj, variant):
+        request = self.context.get('request')
+        url = thumbnails.media_url(obj.image.name, variant, request)
+        if url is None and variant == 'original' and obj.image.name:
+            # Uploads from before the content-addressed store (until backfill_thumbnails adopts them)
+            url = request.build_absolute_uri(obj.image.url) if request is not None else obj.image.url
+        return url
+
+    def get_image_url(self, obj):
+        return self.media_url(obj, 'original')
+
+    def get_medium_url(self, obj):
+        return self.media_url(obj, 'medium')
+
+    def get_thumbnail_url(self, obj):
+        return self.media_url(obj, 'small')
+
+    def create(self, validated_data):
+        upload = validated_data.pop('image', None)
+        instance = ProductCapture(**validated_data)
+        if upload is not None:
+            # Store uploads content-addressed so identical images share one file
+            instance.image.name = image_store.acquire(upload.read())
+        instance.save()
+        return instance
+
+    def update(self, instance, validated_data):
+        upload = validated_data.pop('image', None)
+        old_name = instance.image.name
+        if upload is not None:
+            instance.image.name = image_store.acquire(upload.read())
+        instance = super().update(instance, validated_data)
+        if upload is not None:
+            image_store.release(old_name)
+        return instance
+
+
+class ExtractionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExtractionJob
+        fields = ('id', 'session_id', 'status', 'progress', 'result', 'error',
+                  'created_at', 'started_at', 'finished_at')
+        read_only_fields = fields
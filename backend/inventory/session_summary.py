@@ -0,0 +1,143 @@
+"""Incremental maintenance of the per-session ``Session`` summary rows.
+
+Every write path for ``ProductCapture`` reports what it added or removed
+here, inside its own transaction: ``bulk_save_captures`` and
+``ProductCapture.save`` for inserts, ``ProductCapture.save`` for updates and
+``ProductCapture.delete`` / ``ProductCaptureQuerySet.delete`` for deletes.
+``rebuild`` recomputes everything from scratch (see the
+``backfill_sessions`` management command).
+
+Every change also bumps the session's ``version`` and ``updated_at``,
+which the read endpoints turn into ETags (see ``inventory.read_cache``).
+Writes that leave the counters alone (a renamed product, a barcode or
+image set with a queryset ``update``) call ``touch`` instead.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.utils import timezone
+
+from .models import ProductCapture, Session
+
+
+class Delta:
+    """Change to one session's counters."""
+
+    def __init__(self):
+        self.count = 0
+        self.categories = Counter()
+        self.confidence = 0.0
+        self.last_seen = None
+
+    def add(self, category, confidence, created_at=None, sign=1, n=1):
+        self.count += sign * n
+        self.categories[category] += sign * n
+        self.confidence += sign * (confidence or 0.0)
+        if sign > 0 and created_at is not None and (self.last_seen is None or created_at > self.last_seen):
+            self.last_seen = created_at
+
+
+def deltas_for(captures, sign=1):
+    deltas = defaultdict(Delta)
+    for capture in captures:
+        deltas[capture.session_id].add(capture.category, capture.confidence, capture.created_at, sign)
+    return deltas
+
+
+def apply(deltas, recompute_last_seen=False):
+    """Apply ``{session_id: Delta}``; drop sessions that become empty.
+
+    Deletes pass ``recompute_last_seen`` because removing the newest row
+    moves ``last_seen`` back; that is one indexed ``Max`` per session.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        for session_id, delta in deltas.items():
+            session, _ = Session.objects.select_for_update().get_or_create(session_id=session_id)
+            session.count += delta.count
+            counts = session.category_counts
+            for category, n in delta.categories.items():
+                counts[category] = counts.get(category, 0) + n
+                if counts[category] <= 0:
+                    del counts[category]
+            session.confidence_sum += delta.confidence
+            if session.count <= 0:
+                session.delete()
+                continue
+            if recompute_last_seen:
+                session.last_seen = (
+                    ProductCapture.objects.filter(session_id=session_id)
+                    .aggregate(last=Max('created_at'))['last']
+                )
+            elif delta.last_seen and (session.last_seen is None or delta.last_seen > session.last_seen):
+                session.last_seen = delta.last_seen
+            session.version += 1
+            session.updated_at = now
+            session.save()
+
+
+def touch(session_ids):
+    """Bump the version of sessions whose captures changed without moving their counters."""
+    Session.objects.filter(session_id__in=set(session_ids)).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+
+
+def record_added(captures):
+    apply(deltas_for(captures))
+
+
+def record_removed(captures):
+    apply(deltas_for(captures, sign=-1), recompute_last_seen=True)
+
+
+def record_changed(old, new):
+    """Account for an update of one capture from ``old`` to ``new`` field values."""
+    deltas = defaultdict(Delta)
+    deltas[old.session_id].add(old.category, old.confidence, sign=-1)
+    deltas[new.session_id].add(new.category, new.confidence, new.created_at)
+    apply(deltas, recompute_last_seen=old.session_id != new.session_id)
+
+
+def removal_deltas(queryset):
+    """Aggregate the rows of ``queryset`` into removal deltas (before deleting them)."""
+    deltas = defaultdict(Delta)
+    rows = (
+        queryset.order_by().values('session_id', 'category')
+        .annotate(n=Count('id'), conf=Sum('confidence'))
+    )
+    for row in rows:
+        delta = deltas[row['session_id']]
+        delta.count -= row['n']
+        delta.categories[row['category']] -= row['n']
+        delta.confidence -= row['conf'] or 0.0
+    return deltas
+
+
+def rebuild():
+    """Recompute every Session row from ProductCapture. Returns the number of sessions."""
+    with transaction.atomic():
+        totals = {
+            row['session_id']: row
+            for row in ProductCapture.objects.order_by().values('session_id').annotate(
+                count=Count('id'), last_seen=Max('created_at'), conf=Sum('confidence')
+            )
+        }
+        categories = defaultdict(dict)
+        for row in ProductCapture.objects.order_by().values('session_id', 'category').annotate(n=Count('id')):
+            categories[row['session_id']][row['category']] = row['n']
+
+        Session.objects.exclude(session_id__in=list(totals)).delete()
+        for session_id, row in totals.items():
+            Session.objects.update_or_create(
+                session_id=session_id,
+                defaults={
+                    'count': row['count'],
+                    'last_seen': row['last_seen'],
+                    'confidence_sum': row['conf'] or 0.0,
+                    'category_counts': categories[session_id],
+                },
+            )
+        Session.objects.update(version=F('version') + 1, updated_at=timezone.now())
+    return len(totals)
@@ -0,0 +1,112 @@
+"""Incremental parsing of streamed model output and streaming response framing.
+
+``ItemStreamParser`` is fed the model's text as it arrives and returns each
+item of the top-level JSON array as soon as its closing brace is seen, so
+an item can be saved and sent to the client while the model is still
+generating the rest. Text before the array (a ```json fence, a sentence)
+is skipped; a bare top-level object counts as a single item.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class ItemStreamParser:
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+        self.finished = False
+        self._item = []
+        self._item_depth = None
+
+    def feed(self, text: str):
+        """Consume a chunk of model output; return the items it completed."""
+        items = []
+        for ch in text:
+            if self.finished:
+                break
+            if self._item_depth is not None:
+                self._item.append(ch)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if not self.started:
+                if ch == '[':
+                    self.started = True
+                    self.depth = 1
+                elif ch == '{':
+                    self.started = True
+                    self._open_item(ch)
+                continue
+            if ch == '"':
+                self.in_string = True
+            elif ch in '[{':
+                if ch == '{' and self.depth == 1 and self._item_depth is None:
+                    self._open_item(ch)
+                else:
+                    self.depth += 1
+            elif ch in ']}':
+                self.depth -= 1
+                if self._item_depth is not None and self.depth == self._item_depth:
+                    item = self._close_item()
+                    if item is not None:
+                        items.append(item)
+                if self.depth <= 0:
+                    self.finished = True
+        return items
+
+    def _open_item(self, ch):
+        self._item = [ch]
+        self._item_depth = self.depth
+        self.depth += 1
+
+    def _close_item(self):
+        raw = ''.join(self._item)
+        self._item = []
+        self._item_depth = None
+        try:
+            item = json.loads(raw)
+        except ValueError:
+            return None
+        return item if isinstance(item, dict) else None
+
+
+def ndjson_event(event: str, data) -> bytes:
+    return (json.dumps({'event': event, 'data': data}, cls=DjangoJSONEncoder) + '\n').encode('utf-8')
+
+
+def sse_event(event: str, data) -> bytes:
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'.encode('utf-8')
+
+
+class ClosingIterator:
+    """Iterate ``iterator``; ``close()`` closes it and then calls ``on_close``.
+
+    ``StreamingHttpResponse`` closes its content when the response is closed,
+    iterated or not, but a generator that never started skips its
+    ``finally``. Wrapping it in this runs ``on_close`` either way.
+    """
+
+    def __init__(self, iterator, on_close):
+        self._iterator = iterator
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        try:
+            if hasattr(self._iterator, 'close'):
+                self._iterator.close()
+        finally:
+            self._on_close()
@@ -1,3 +1,748 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import types
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import openai
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from openpyxl import load_workbook
+from PIL import Image
+
+from . import (admission, barcodes, capture_cache, catalog, categories, extraction, image_store, jobs, llm,
+               product_index, session_summary, uploads)
+from .models import (CaptureCacheEntry, ExtractionJob, ExtractionRun, ImageBlob, Product, ProductCapture,
+                     Session, Upload)
+
+MODEL_CONTENT = json.dumps([
+    {'product_name': 'Coca Cola', 'unit': '1L', 'description': 'soda', 'category': 'Drinks', 'confidence': 0.9},
+    {'product_name': 'Sprite', 'unit': '1.5L', 'description': 'soda', 'category': 'Drinks', 'confidence': 0.8},
+])
+
+
+def jpeg(color=(200, 10, 10), size=(320, 240)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+class StubStream:
+    """A streamed completion: ``content`` in 16-character deltas."""
+
+    def __init__(self, content):
+        self.content = content
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        for i in range(0, len(self.content), 16):
+            delta = types.SimpleNamespace(content=self.content[i:i + 16])
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=None)
+
+
+class StubModel:
+    """Stands in for the OpenAI client: answers ``content`` (streamed if asked), or raises ``error``."""
+
+    def __init__(self, content=MODEL_CONTENT):
+        self.content = content
+        self.error = None
+        self.calls = 0
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    def create(self, stream=False, **kwargs):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        if stream:
+            return StubStream(self.content)
+        message = types.SimpleNamespace(content=self.content)
+        usage = types.SimpleNamespace(prompt_tokens=10, completion_tokens=20, total_tokens=30)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+
+class PipelineTestCase(TestCase):
+    """Runs the real pipeline with the model API stubbed, OCR and barcodes off and files in a temp dir."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        overrides = override_settings(
+            MEDIA_ROOT=self.tmp, UPLOAD_SPOOL_DIR=f'{self.tmp}/uploads', METRICS_DIR=f'{self.tmp}/metrics',
+            MODEL_ADMISSION_PATH=f'{self.tmp}/admission.sqlite3', PRODUCT_INDEX_PATH=f'{self.tmp}/index.pkl',
+            CATEGORY_MODEL_PATH=f'{self.tmp}/category_model.npz',
+            EXTRACTION_OCR_MODE='off', CAPTURE_CACHE_ENABLED=False, BARCODE_ENABLED=False,
+            OPENAI_API_KEY='test', OPENAI_MAX_RETRIES=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        llm.reset()
+        product_index.reset()
+        self.addCleanup(product_index.reset)
+        self.model = StubModel()
+        patcher = mock.patch.object(llm, 'get_client', return_value=self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def extract(self, image=None, **data):
+        data.setdefault('session_id', 's1')
+        return self.client.post('/api/product/extract/', {'image': io.BytesIO(image or jpeg()), **data})
+
+    def hold_model_slots(self):
+        """Take the only model call slot, so the next call is not admitted."""
+        overrides = override_settings(MODEL_MAX_IN_FLIGHT=1, MODEL_RATE_LIMIT=0, MODEL_ADMISSION_MAX_WAIT=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        lease = admission.acquire()
+        self.addCleanup(admission.release, lease)
+        return lease
+
+
+class ExtractionTests(PipelineTestCase):
+    def test_extract_saves_the_model_items_with_their_run(self):
+        response = self.extract()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['product_name'] for p in response.json()], ['Coca Cola', 'Sprite'])
+        self.assertEqual(self.model.calls, 1)
+
+        run = ExtractionRun.objects.get()
+        self.assertEqual(run.source, ExtractionRun.SOURCE_MODEL)
+        self.assertEqual(run.content, MODEL_CONTENT)
+        self.assertEqual(run.prompt_tokens, 10)
+        self.assertEqual(set(run.captures.values_list('session_id', flat=True)), {'s1'})
+        self.assertEqual({p['run'] for p in response.json()}, {str(run.pk)})
+
+    def test_max_items_limits_the_saved_captures(self):
+        response = self.extract(max_items=1)
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(ProductCapture.objects.count(), 1)
+
+    def test_model_outage_falls_back_to_ocr(self):
+        self.model.error = openai.APIConnectionError(request=httpx.Request('POST', 'http://model.test'))
+        response = self.extract()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Extraction-Degraded'], 'ocr-only')
+
+    def test_busy_model_answers_429_with_retry_after(self):
+        self.hold_model_slots()
+        response = self.extract()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(response.json()['retry_after']))
+        self.assertEqual(self.model.calls, 0)
+        self.assertEqual(ProductCapture.objects.count(), 0)
+
+    def test_busy_model_answers_429_before_streaming(self):
+        self.hold_model_slots()
+        response = self.extract(stream='ndjson')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_cached_stream_is_served_while_the_model_is_busy(self):
+        with override_settings(CAPTURE_CACHE_ENABLED=True):
+            self.extract()
+            self.hold_model_slots()
+            response = self.extract(stream='ndjson')
+            self.assertEqual(response.status_code, 200)
+            events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(events[-1]['data']['cache'], 'hit')
+        self.assertEqual(self.model.calls, 1)
+
+    def test_closing_an_unread_stream_gives_its_lease_back(self):
+        response = self.extract(stream='ndjson')
+        self.assertEqual(admission.snapshot()['in_flight'], 1)
+        response.close()
+        self.assertEqual(admission.snapshot()['in_flight'], 0)
+        self.assertEqual(self.model.calls, 0)
+
+    def test_stream_sends_items_then_done(self):
+        response = self.extract(stream='ndjson')
+        self.assertEqual(response.status_code, 200)
+        events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([e['event'] for e in events], ['item', 'item', 'done'])
+        self.assertEqual(events[-1]['data']['saved_count'], 2)
+        self.assertEqual(ProductCapture.objects.filter(run__isnull=False).count(), 2)
+
+    def test_repeat_capture_is_answered_from_the_cache(self):
+        with override_settings(CAPTURE_CACHE_ENABLED=True):
+            self.assertEqual(self.extract()['X-Capture-Cache'], 'miss')
+            response = self.extract()
+        self.assertEqual(response['X-Capture-Cache'], 'hit')
+        self.assertEqual([c['product_name'] for c in response.json()], ['Coca Cola', 'Sprite'])
+        self.assertEqual(self.model.calls, 1)
+        self.assertEqual(CaptureCacheEntry.objects.get().hits, 1)
+
+    def test_invalid_image_is_a_400(self):
+        response = self.client.post('/api/product/extract/', {'image': io.BytesIO(b'not an image')})
+        self.assertEqual(response.status_code, 400)
+
+
+class AdmissionTests(PipelineTestCase):
+    def test_waiting_indefinitely_outlasts_a_full_queue(self):
+        lease = self.hold_model_slots()
+        timer = threading.Timer(0.2, admission.release, [lease])
+        with override_settings(MODEL_ADMISSION_MAX_QUEUE=0), admission.waiting(None):
+            timer.start()
+            admitted = admission.acquire()
+        timer.join()
+        self.assertIsNotNone(admitted)
+        admission.release(admitted)
+
+
+@override_settings(CAPTURE_CACHE_MAX_DISTANCE=4)
+class CaptureCacheTests(TestCase):
+    def test_near_lookup_finds_what_a_full_scan_finds(self):
+        rng = random.Random(4)
+        hashes = [rng.getrandbits(64) for _ in range(300)]
+        CaptureCacheEntry.objects.bulk_create(
+            CaptureCacheEntry(image_hash=f'{h:016x}', items=[i], last_used_at=timezone.now())
+            for i, h in enumerate(hashes))
+        for _ in range(200):
+            target = rng.choice(hashes)
+            for bit in rng.sample(range(64), rng.randint(1, 6)):
+                target ^= 1 << bit
+            near = [i for i, h in enumerate(hashes) if (target ^ h).bit_count() <= 4]
+            self.assertEqual(capture_cache.lookup(f'{target:016x}'), [near[0]] if near else None)
+
+    def test_expired_entries_miss_and_are_evicted(self):
+        capture_cache.store('00000000000000ff', ['old'])
+        CaptureCacheEntry.objects.update(last_used_at=timezone.now() - timedelta(days=30))
+        self.assertIsNone(capture_cache.lookup('00000000000000ff'))
+        capture_cache.store('ffffffffffffffff', ['new'])
+        self.assertEqual(list(CaptureCacheEntry.objects.values_list('items', flat=True)), [['new']])
+
+    @override_settings(CAPTURE_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_entries_are_evicted_beyond_the_limit(self):
+        for i, h in enumerate(('000000000000000f', '0000000000000f00', '00000000000f0000')):
+            if i == 2:
+                capture_cache.lookup('000000000000000f')  # Used again, so the second one is the oldest
+            capture_cache.store(h, [i])
+            CaptureCacheEntry.objects.filter(image_hash=h).update(
+                last_used_at=timezone.now() - timedelta(minutes=10 - i))
+        self.assertEqual(sorted(CaptureCacheEntry.objects.values_list('image_hash', flat=True)),
+                         ['000000000000000f', '00000000000f0000'])
+
+
+class SessionSummaryTests(PipelineTestCase):
+    def summaries(self):
+        return {s.session_id: (s.count, s.category_counts, round(s.confidence_sum, 6), s.last_seen)
+                for s in Session.objects.all()}
+
+    def assertSummaryMatchesRebuild(self):
+        kept = self.summaries()
+        session_summary.rebuild()
+        self.assertEqual(kept, self.summaries())
+
+    def test_summary_follows_inserts_updates_and_deletes(self):
+        self.extract()
+        self.extract(jpeg((10, 200, 10)), session_id='s2')
+        self.assertEqual(Session.objects.get(session_id='s1').category_counts, {'Drinks': 2})
+        self.assertSummaryMatchesRebuild()
+
+        capture = ProductCapture.objects.filter(session_id='s1').latest('created_at')
+        capture.category = 'Food'
+        capture.confidence = 0.5
+        capture.save()
+        self.assertSummaryMatchesRebuild()
+
+        ProductCapture.objects.filter(pk=capture.pk).delete()
+        self.assertEqual(Session.objects.get(session_id='s1').count, 1)
+        self.assertSummaryMatchesRebuild()
+
+        ProductCapture.objects.filter(session_id='s1').get().delete()
+        self.assertFalse(Session.objects.filter(session_id='s1').exists())
+        self.assertSummaryMatchesRebuild()
+
+    def test_writes_bump_the_session_version(self):
+        self.extract()
+        version = Session.objects.get(session_id='s1').version
+        ProductCapture.objects.filter(product_name='Sprite').delete()
+        self.assertGreater(Session.objects.get(session_id='s1').version, version)
+
+    def test_queryset_delete_releases_each_reference_to_a_shared_image(self):
+        self.extract()
+        name = ProductCapture.objects.values_list('image', flat=True).first()
+        self.assertEqual(ImageBlob.objects.get(name=name).ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductCapture.objects.filter(product_name='Sprite').delete()
+        self.assertEqual(ImageBlob.objects.get(name=name).ref_count, 1)
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductCapture.objects.all().delete()
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+        self.assertFalse(default_storage.exists(name))
+
+
+class ImageStoreTests(PipelineTestCase):
+    def test_same_bytes_are_stored_once_and_counted(self):
+        data = jpeg()
+        name = image_store.acquire(data)
+        self.assertEqual(image_store.acquire(data, refs=2), name)
+        self.assertEqual(ImageBlob.objects.get(name=name).ref_count, 3)
+        self.assertEqual(len(default_storage.listdir('captures')[1]), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image_store.release(name, refs=2)
+        self.assertTrue(default_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            image_store.release(name)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_releasing_a_legacy_name_is_a_no_op(self):
+        image_store.release('captures/legacy.jpg')
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_discard_unreferenced_removes_only_orphan_files(self):
+        written = []
+        name = image_store.acquire(jpeg(), written=written)
+        self.assertEqual(written, [name])
+        image_store.discard_unreferenced(written)
+        self.assertTrue(default_storage.exists(name))
+        ImageBlob.objects.all().delete()
+        image_store.discard_unreferenced(written)
+        self.assertFalse(default_storage.exists(name))
+
+
+class MediaTests(PipelineTestCase):
+    def setUp(self):
+        super().setUp()
+        self.extract()
+        self.capture = self.client.get('/api/session/products/', {'session_id': 's1'}).json()[0]
+
+    def test_thumbnail_is_rendered_on_request_and_immutable(self):
+        response = self.client.get(self.capture['thumbnail_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as img:
+            self.assertLessEqual(max(img.size), 200)
+        response.close()
+
+    def test_matching_etag_is_a_304(self):
+        for url in (self.capture['image_url'], self.capture['medium_url']):
+            response = self.client.get(url)
+            etag = response['ETag']
+            response.close()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_unknown_media_is_a_404(self):
+        digest = '0' * 64
+        self.assertEqual(self.client.get(f'/api/media/{digest}/small/').status_code, 404)
+        self.assertEqual(self.client.get(self.capture['image_url'].replace('original', 'huge')).status_code, 404)
+
+
+class ReadCacheTests(PipelineTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.extract()
+
+    def test_unchanged_list_is_a_304_until_the_session_changes(self):
+        url = '/api/session/products/'
+        response = self.client.get(url, {'session_id': 's1'})
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, {'session_id': 's1'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.extract(jpeg((10, 200, 10)))
+        response = self.client.get(url, {'session_id': 's1'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 4)
+
+    def test_cached_body_is_served_without_querying_the_captures(self):
+        url = '/api/sessions/'
+        first = self.client.get(url)
+        with self.assertNumQueries(1):
+            second = self.client.get(url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        rows = [('s1', 'Coca Cola', 0.9, 3), ('s1', 'Sprite', 0.4, 2), ('s2', 'Tide', 0.8, 1), ('s3', 'Rice', 0.9, 0)]
+        for session_id, name, confidence, days_ago in rows:
+            capture = ProductCapture.objects.create(image='captures/x.jpg', product_name=name, unit='1L',
+                                                    category='Drinks', confidence=confidence, session_id=session_id)
+            ProductCapture.objects.filter(pk=capture.pk).update(
+                created_at=timezone.now() - timedelta(days=days_ago))
+
+    def export(self, **params):
+        response = self.client.get('/api/export/csv/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def names(self, **params):
+        _, body = self.export(**params)
+        return [row['product_name'] for row in csv.DictReader(io.StringIO(body.decode()))]
+
+    def test_filters(self):
+        self.assertEqual(self.names(session_id='s1'), ['Coca Cola', 'Sprite'])
+        self.assertEqual(self.names(session_id='s1,s2', min_confidence='0.5'), ['Coca Cola', 'Tide'])
+        self.assertEqual(self.names(all='1', date_from=str((timezone.now() - timedelta(days=1)).date())),
+                         ['Tide', 'Rice'])
+        self.assertEqual(self.names(all='1', date_to=(timezone.now() - timedelta(days=2, hours=1)).isoformat()),
+                         ['Coca Cola'])
+
+    def test_bad_parameters_are_a_400(self):
+        for params in ({'date_from': 'yesterday'}, {'min_confidence': 'high'}, {'type': 'pdf'}):
+            self.assertEqual(self.client.get('/api/export/csv/', params).status_code, 400)
+
+    def test_gzipped_ndjson(self):
+        response, body = self.export(session_id='s2', type='ndjson', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('inventory_export_s2.ndjson.gz', response['Content-Disposition'])
+        lines = [json.loads(line) for line in gzip.decompress(body).splitlines()]
+        self.assertEqual(lines, [{'product_name': 'Tide', 'unit': '1L', 'description': '', 'category': 'Drinks',
+                                  'confidence': 0.8}])
+
+    def test_xlsx(self):
+        _, body = self.export(session_id='s1', type='xlsx')
+        rows = list(load_workbook(io.BytesIO(body), read_only=True).active.values)
+        self.assertEqual(rows[0][0], 'product_name')
+        self.assertEqual([row[0] for row in rows[1:]], ['Coca Cola', 'Sprite'])
+
+
+class JobTests(PipelineTestCase):
+    def job(self, **fields):
+        job = ExtractionJob(session_id='j', **fields)
+        job.image.save('upload.jpg', ContentFile(jpeg()), save=False)
+        job.save()
+        return job
+
+    def test_job_is_claimed_once_and_saves_its_result(self):
+        job = self.job()
+        self.assertTrue(jobs.process_job(job.id))
+        self.assertFalse(jobs.process_job(job.id))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExtractionJob.STATUS_SUCCEEDED)
+        self.assertEqual([c['product_name'] for c in job.result], ['Coca Cola', 'Sprite'])
+        self.assertEqual(job.image.name, '')
+        self.assertEqual(self.model.calls, 1)
+
+    def test_stale_running_jobs_are_queued_again(self):
+        stale = self.job(status=ExtractionJob.STATUS_RUNNING, started_at=timezone.now() - timedelta(hours=1))
+        fresh = self.job(status=ExtractionJob.STATUS_RUNNING, started_at=timezone.now())
+        with self.assertLogs('inventory.jobs', 'WARNING'):
+            self.assertEqual(jobs.requeue_stale_jobs(), 1)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.started_at), (ExtractionJob.STATUS_QUEUED, None))
+        self.assertEqual(ExtractionJob.objects.get(pk=fresh.pk).status, ExtractionJob.STATUS_RUNNING)
+        self.assertTrue(jobs.process_job(stale.id))
+
+    def test_result_of_a_job_requeued_while_running_is_dropped(self):
+        job = self.job()
+        run_extraction = extraction.run_extraction
+
+        def requeued_meanwhile(*args, **kwargs):
+            ExtractionJob.objects.filter(pk=job.pk).update(status=ExtractionJob.STATUS_QUEUED, started_at=None)
+            return run_extraction(*args, **kwargs)
+
+        with mock.patch.object(extraction, 'run_extraction', requeued_meanwhile), \
+                self.assertLogs('inventory.jobs', 'WARNING'):
+            self.assertTrue(jobs.process_job(job.id))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExtractionJob.STATUS_QUEUED)
+        self.assertIsNone(job.result)
+
+    def test_failed_job_keeps_its_upload(self):
+        job = self.job()
+        with mock.patch.object(extraction, 'run_extraction', side_effect=RuntimeError('disk full')):
+            jobs.process_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (ExtractionJob.STATUS_FAILED, 'disk full'))
+        self.assertTrue(default_storage.exists(job.image.name))
+
+
+class CatalogTests(PipelineTestCase):
+    def test_codes_are_normalized_to_gtin14(self):
+        self.assertEqual(barcodes.normalize_gtin(' 4006381 333931 '), '04006381333931')
+        self.assertEqual(barcodes.normalize_gtin('036000291452'), '00036000291452')
+        self.assertEqual(barcodes.normalize_gtin('96385074'), '00000096385074')
+        self.assertEqual(barcodes.normalize_gtin('01234505', 'UPCE'), '00012000003455')
+        for bad in ('4006381333932', '40063813339', 'abc', '', None):
+            self.assertIsNone(barcodes.normalize_gtin(bad))
+
+    def test_entries_are_only_overwritten_by_sources_as_trusted(self):
+        gtin = '04006381333931'
+        self.assertTrue(catalog.upsert(gtin, {'product_name': 'Tide', 'category': 'cleanings'}, Product.SOURCE_MODEL))
+        self.assertEqual(Product.objects.get().category, 'Cleaning Supplies')
+        self.assertTrue(catalog.upsert(gtin, {'product_name': 'Tide 1kg'}, Product.SOURCE_IMPORT))
+        self.assertFalse(catalog.upsert(gtin, {'product_name': 'Tied'}, Product.SOURCE_CAPTURE))
+        self.assertEqual(Product.objects.get().product_name, 'Tide 1kg')
+
+    def test_known_barcode_is_answered_from_the_catalog(self):
+        Product.objects.create(gtin='04006381333931', product_name='Tide', unit='1kg', category='Cleaning Supplies')
+        response = self.extract(barcode='4006381333931')
+        self.assertEqual(response['X-Barcode-Catalog'], 'hit')
+        self.assertEqual(self.model.calls, 0)
+        capture = ProductCapture.objects.get()
+        self.assertEqual((capture.product_name, capture.barcode), ('Tide', '04006381333931'))
+        self.assertEqual(Product.objects.get().hits, 1)
+
+    def test_unambiguous_model_answer_is_learned_for_an_unknown_barcode(self):
+        self.model.content = json.dumps([json.loads(MODEL_CONTENT)[1]])
+        response = self.extract(barcode='036000291452')
+        self.assertEqual(response['X-Barcode-Catalog'], 'miss')
+        product = Product.objects.get()
+        self.assertEqual((product.gtin, product.product_name, product.source),
+                         ('00036000291452', 'Sprite', Product.SOURCE_MODEL))
+        self.assertEqual(ProductCapture.objects.get().barcode, '00036000291452')
+
+    def test_ambiguous_model_answer_is_not_learned(self):
+        self.extract(barcode='036000291452')
+        self.assertFalse(Product.objects.exists())
+        self.assertEqual(set(ProductCapture.objects.values_list('barcode', flat=True)), {''})
+
+
+class ProductIndexTests(PipelineTestCase):
+    ENTRIES = [('Coca Cola Original', '1L', 'Drinks'), ('Coca Cola Original', '500ml', 'Drinks'),
+               ('Milk', '1L', 'Food')]
+
+    def test_ocr_text_must_name_the_product_and_its_unit(self):
+        index = product_index.ProductIndex.build(self.ENTRIES)
+        match = index.contained('COCA-COLA Original\ntaste the feeling 1L', 0.85, 10)
+        self.assertEqual((match.product_name, match.unit), ('Coca Cola Original', '1L'))
+        self.assertIsNone(index.contained('Coca Cola Original 2L', 0.85, 10))
+        self.assertIsNone(index.contained('Fresh milk 1L', 0.85, 10))  # Too short a name to trust
+
+    def test_snapshot_and_journal_are_shared(self):
+        product_index.ProductIndex.build(self.ENTRIES).save(product_index.snapshot_path())
+        product_index.record('Sprite Zero', '1.5L', 'Drinks')
+        product_index.reset()  # As another worker would load it
+        self.assertEqual(len(product_index.get_index()), 4)
+        self.assertEqual(product_index.canonical('sprite  zero', '1.5l').product_name, 'Sprite Zero')
+        self.assertIsNone(product_index.canonical('Pepsi', '1L'))
+
+    @override_settings(EXTRACTION_OCR_MODE='blocking')
+    @mock.patch.object(extraction, 'run_ocr', return_value='Sprite\nlemon-lime 1.5L')
+    def test_capture_named_in_the_ocr_text_skips_the_model(self, run_ocr):
+        self.extract()
+        self.assertEqual(product_index.rebuild(), 2)
+        response = self.extract(jpeg((10, 200, 10)))
+        self.assertEqual(response['X-Product-Index'], 'hit')
+        self.assertEqual([c['product_name'] for c in response.json()], ['Sprite'])
+        self.assertEqual(self.model.calls, 1)
+
+
+class CategoryTests(PipelineTestCase):
+    TRAINING = [
+        ('cola soda 1L', 'Drinks'), ('orange juice drink', 'Drinks'), ('sparkling water bottle', 'Drinks'),
+        ('lemon soda can', 'Drinks'), ('iced tea drink', 'Drinks'), ('grape juice box', 'Drinks'),
+        ('bleach cleaner', 'Cleaning Supplies'), ('laundry detergent powder', 'Cleaning Supplies'),
+        ('dishwashing liquid', 'Cleaning Supplies'), ('floor cleaner pine', 'Cleaning Supplies'),
+        ('fabric softener', 'Cleaning Supplies'), ('detergent bar', 'Cleaning Supplies'),
+    ]
+
+    def train(self):
+        texts, labels = zip(*self.TRAINING)
+        model = categories.CategoryClassifier.train(list(texts), list(labels), epochs=200, min_df=1)
+        model.save(settings.CATEGORY_MODEL_PATH)
+        return model
+
+    def test_model_answers_are_repaired(self):
+        self.assertEqual(categories.normalize_category('Beverages'), 'Drinks')
+        self.assertEqual(categories.normalize_category('cleaning supplies!'), 'Cleaning Supplies')
+        self.assertIsNone(categories.normalize_category('Gadgets'))
+        self.assertIsNone(categories.normalize_category(None))
+
+    def test_classifier_learns_and_survives_a_round_trip(self):
+        model = self.train()
+        texts = ['cola soda 500ml', 'detergent for laundry']
+        self.assertEqual([c for c, _ in model.predict(texts)], ['Drinks', 'Cleaning Supplies'])
+        loaded = categories.CategoryClassifier.load(settings.CATEGORY_MODEL_PATH)
+        self.assertTrue((abs(loaded.probabilities(texts) - model.probabilities(texts)) < 1e-6).all())
+
+    def test_assigned_category_depends_on_the_mode(self):
+        with override_settings(CATEGORY_CLASSIFIER='validate'):
+            self.assertEqual(categories.assign_category('Gadgets', 'bleach'), 'Food')  # No model yet
+        self.train()
+        with override_settings(CATEGORY_CLASSIFIER='off'):
+            self.assertEqual(categories.assign_category('Drinks', 'laundry detergent'), 'Drinks')
+        with override_settings(CATEGORY_CLASSIFIER='validate', CATEGORY_OVERRIDE_CONFIDENCE=0.5):
+            self.assertEqual(categories.assign_category('Drinks', 'laundry detergent'), 'Cleaning Supplies')
+            self.assertEqual(categories.assign_category('Gadgets', 'cola soda'), 'Drinks')
+        with override_settings(CATEGORY_CLASSIFIER='validate', CATEGORY_OVERRIDE_CONFIDENCE=1.0):
+            self.assertEqual(categories.assign_category('Drinks', 'laundry detergent'), 'Drinks')
+        with override_settings(CATEGORY_CLASSIFIER='replace'):
+            self.assertEqual(categories.assign_category('Drinks', 'laundry detergent'), 'Cleaning Supplies')
+
+
+class BatchExtractionTests(PipelineTestCase):
+    def test_results_keep_the_position_of_each_image(self):
+        images = [io.BytesIO(jpeg()), io.BytesIO(b'not an image'), io.BytesIO(jpeg((10, 200, 10)))]
+        for i, image in enumerate(images):
+            image.name = f'img{i}.jpg'
+        response = self.client.post('/api/product/extract/batch/', {'images': images, 'session_id': 'b'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['index'] for r in results], [0, 1, 2])
+        self.assertEqual([r['filename'] for r in results], ['img0.jpg', 'img1.jpg', 'img2.jpg'])
+        self.assertIn('error', results[1])
+        self.assertIsNone(results[0]['product_index'])
+        self.assertEqual(len(results[2]['saved']), 2)
+        self.assertEqual(response.json()['failed_count'], 1)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.ids = [ProductCapture.objects.create(product_name=f'P{i}', unit='1', category='Food', confidence=1,
+                                                  session_id='page').pk for i in range(5)]
+
+    def get(self, **params):
+        return self.client.get('/api/session/products/', {'session_id': 'page', **params})
+
+    def test_pages_cover_every_capture_once(self):
+        seen, cursor = [], None
+        while True:
+            data = self.get(limit=2, **({'cursor': cursor} if cursor else {})).json()
+            seen.extend(p['id'] for p in data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(sorted(seen), sorted(str(pk) for pk in self.ids))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_garbage_cursor_is_a_400(self):
+        response = self.get(cursor='not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_with_a_tampered_key_is_a_400(self):
+        raw = json.dumps(['2024-01-01T00:00:00+00:00', 'zzz']).encode()
+        response = self.get(cursor=base64.urlsafe_b64encode(raw).decode().rstrip('='))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+    def test_bad_limit_is_a_400(self):
+        self.assertEqual(self.get(limit='many').status_code, 400)
+
+
+class UploadTests(PipelineTestCase):
+    def upload(self, data):
+        created = self.client.post('/api/uploads/', {'size': len(data), 'session_id': 'u'})
+        self.assertEqual(created.status_code, 201)
+        url = created.json()['upload_url']
+        half = len(data) // 2
+        for offset, chunk in ((0, data[:half]), (half, data[half:])):
+            response = self.client.patch(url, chunk, content_type='application/octet-stream',
+                                         headers={'Upload-Offset': str(offset)})
+            self.assertEqual(response.status_code, 200)
+        return url
+
+    def test_wrong_offset_is_a_409_with_the_server_offset(self):
+        data = jpeg()
+        created = self.client.post('/api/uploads/', {'size': len(data)}).json()
+        response = self.client.patch(created['upload_url'], data[:10], content_type='application/octet-stream',
+                                     headers={'Upload-Offset': '5'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 0)
+
+    def test_bad_content_length_is_a_400(self):
+        created = self.client.post('/api/uploads/', {'size': 100}).json()
+        response = self.client.patch(created['upload_url'], b'x' * 10, content_type='application/octet-stream',
+                                     headers={'Upload-Offset': '0'}, CONTENT_LENGTH='ten')
+        self.assertEqual(response.status_code, 400)
+
+    def test_chunk_is_refused_while_another_is_being_written(self):
+        data = jpeg()
+        created = self.client.post('/api/uploads/', {'size': len(data)}).json()
+        upload = Upload.objects.get(pk=created['upload_id'])
+        open(uploads.lock_path(upload), 'w').close()
+        response = self.client.patch(created['upload_url'], data, content_type='application/octet-stream',
+                                     headers={'Upload-Offset': '0'})
+        self.assertEqual(response.status_code, 409)
+
+        # The lock of a writer that died is taken over once it is stale
+        stale = time.time() - uploads.LOCK_STALE_SECONDS - 1
+        os.utime(uploads.lock_path(upload), (stale, stale))
+        response = self.client.patch(created['upload_url'], data, content_type='application/octet-stream',
+                                     headers={'Upload-Offset': '0'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['offset'], len(data))
+        self.assertFalse(os.path.exists(uploads.lock_path(upload)))
+
+    def test_finalize_extracts_and_removes_the_upload(self):
+        url = self.upload(jpeg())
+        response = self.client.post(f'{url}finalize/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_failed_finalize_can_be_retried(self):
+        data = jpeg()
+        url = self.upload(data)
+        lease = self.hold_model_slots()
+        self.assertEqual(self.client.post(f'{url}finalize/').status_code, 429)
+
+        # The upload is kept, complete and open
+        status = self.client.get(url)
+        self.assertEqual(status.status_code, 200)
+        self.assertEqual(status.json()['offset'], len(data))
+        self.assertEqual(Upload.objects.get().status, Upload.STATUS_OPEN)
+
+        admission.release(lease)
+        response = self.client.post(f'{url}finalize/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ProductCapture.objects.filter(session_id='u').count(), 2)
+
+
+class ReprocessTests(PipelineTestCase):
+    def reprocess(self, *args):
+        out = io.StringIO()
+        call_command('reprocess', '--all', *args, stdout=out)
+        return out.getvalue()
+
+    def test_reprocess_rederives_captures_without_the_model(self):
+        self.extract()
+        calls = self.model.calls
+        self.assertIn('0 of 1 runs', self.reprocess())
+
+        self.assertIn('1 of 1 runs', self.reprocess('--max-items', '1'))
+        self.assertEqual(list(ProductCapture.objects.values_list('product_name', flat=True)), ['Coca Cola'])
+        self.reprocess('--max-items', '2')
+        self.assertEqual(ProductCapture.objects.count(), 2)
+        self.assertEqual(self.model.calls, calls)
+
+    def test_dry_run_changes_nothing(self):
+        self.extract()
+        ids = set(ProductCapture.objects.values_list('pk', flat=True))
+        self.assertIn('Would replace the captures of 1 of 1 runs', self.reprocess('--max-items', '1', '--dry-run'))
+        self.assertEqual(set(ProductCapture.objects.values_list('pk', flat=True)), ids)
+
+    def test_edited_captures_are_kept_unless_forced(self):
+        capture = self.extract().json()[1]
+        response = self.client.put(f"/api/product/{capture['id']}/", {'description': 'lemon-lime soda'},
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.json()['edited_at'])
+
+        self.assertIn('Skipped 1 runs', self.reprocess())
+        self.assertEqual(ProductCapture.objects.get(pk=capture['id']).description, 'lemon-lime soda')
+
+        self.reprocess('--force')
+        self.assertFalse(ProductCapture.objects.filter(pk=capture['id']).exists())
+        self.assertEqual(sorted(ProductCapture.objects.values_list('product_name', flat=True)),
+                         ['Coca Cola', 'Sprite'])
@@ -0,0 +1,208 @@
+"""Small and medium derivatives of stored capture images.
+
+List screens only need a thumbnail, not the full phone photo. For every
+image in the content-addressed store (``captures/<sha256><ext>``) two
+derivatives are kept under ``thumbnails/<sha256>_<variant><ext>``, with the
+long edge at most ``THUMBNAIL_SMALL_EDGE`` / ``THUMBNAIL_MEDIUM_EDGE``
+pixels and encoded as ``THUMBNAIL_FORMAT`` (WebP by default).
+
+They are generated in a background pool once the capture's transaction has
+committed (see ``image_store.acquire``). ``ensure`` renders a missing one
+on first request, so a derivative URL never fails because the pool was
+busy or the process restarted. Media URLs contain the content hash and
+never change meaning, so they are served as immutable (see ``MediaView``).
+"""
+import io
+import logging
+import mimetypes
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count
+from django.urls import reverse
+
+from . import image_store, session_summary
+from .imaging import MIME_TYPES, encode
+from .models import ImageBlob, ProductCapture
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = 'thumbnails/'
+VARIANTS = ('small', 'medium')
+MEDIA_VARIANTS = ('original',) + VARIANTS
+
+_DIGEST_RE = re.compile(r'[0-9a-f]{64}')
+_NAME_RE = re.compile(re.escape(image_store.UPLOAD_DIR) + r'([0-9a-f]{64})\.\w+')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def digest_for(name):
+    """The content hash of a content-addressed image name, else None (legacy uploads)."""
+    match = _NAME_RE.fullmatch(name or '')
+    return match.group(1) if match else None
+
+
+def is_digest(value):
+    return _DIGEST_RE.fullmatch(value) is not None
+
+
+def etag(digest, variant):
+    """Strong ETag of a media response (thumbnails also depend on ``THUMBNAIL_FORMAT``)."""
+    if variant == 'original':
+        return f'"{digest}-original"'
+    return f'"{digest}-{variant}-{thumbnail_format().lower()}"'
+
+
+def max_edge(variant):
+    return settings.THUMBNAIL_MEDIUM_EDGE if variant == 'medium' else settings.THUMBNAIL_SMALL_EDGE
+
+
+def thumbnail_format():
+    return settings.THUMBNAIL_FORMAT.upper()
+
+
+def derivative_name(digest, variant):
+    return f'{THUMBNAIL_DIR}{digest}_{variant}{image_store.EXTENSIONS.get(thumbnail_format(), ".jpg")}'
+
+
+def content_type(variant, name):
+    if variant == 'original':
+        return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    return MIME_TYPES.get(thumbnail_format(), 'image/jpeg')
+
+
+def render(image_bytes, variant):
+    """Encode the ``variant`` derivative of ``image_bytes``."""
+    edge = max_edge(variant)
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # Let the JPEG decoder downscale while decoding (much cheaper than a full decode)
+        img.draft('RGB', (edge, edge))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        img.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        return encode(img, thumbnail_format(), settings.THUMBNAIL_QUALITY)
+
+
+def generate(digest, original_name, force=False):
+    """Write the missing derivatives of one stored image. Returns the names written."""
+    image_bytes = None
+    written = []
+    for variant in VARIANTS:
+        name = derivative_name(digest, variant)
+        if default_storage.exists(name):
+            if not force:
+                continue
+            default_storage.delete(name)
+        if image_bytes is None:
+            with default_storage.open(original_name, 'rb') as fh:
+                image_bytes = fh.read()
+        if image_store.write_file(name, render(image_bytes, variant)):
+            written.append(name)
+    return written
+
+
+def ensure(digest, original_name, variant):
+    """Return the storage name of a derivative, rendering it now if it does not exist yet."""
+    name = derivative_name(digest, variant)
+    if not default_storage.exists(name):
+        with default_storage.open(original_name, 'rb') as fh:
+            image_store.write_file(name, render(fh.read(), variant))
+    return name
+
+
+def get_executor():
+    """Return the shared thread pool that renders derivatives after ingest."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS,
+                                           thread_name_prefix='thumbnails')
+        return _executor
+
+
+def _generate_logged(digest, original_name):
+    try:
+        generate(digest, original_name)
+    except Exception:
+        logger.exception('Could not generate thumbnails for %s', original_name)
+
+
+def schedule(original_name):
+    """Render the derivatives of a newly stored image in the background."""
+    digest = digest_for(original_name)
+    if digest is None or not settings.THUMBNAIL_ENABLED:
+        return None
+    return get_executor().submit(_generate_logged, digest, original_name)
+
+
+def delete(original_name):
+    """Remove the derivatives of an image whose file is being deleted."""
+    digest = digest_for(original_name)
+    if digest is None:
+        return
+    for variant in VARIANTS:
+        default_storage.delete(derivative_name(digest, variant))
+
+
+def media_url(name, variant, request=None):
+    """Immutable URL of ``variant`` of the stored image ``name`` (None for legacy uploads)."""
+    digest = digest_for(name)
+    if digest is None:
+        return None
+    url = reverse('media', kwargs={'digest': digest, 'variant': variant})
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def adopt_legacy():
+    """Move images saved before the content-addressed store into it.
+
+    Their captures are repointed to ``captures/<sha256><ext>`` (so they get
+    media URLs and thumbnails) and the old file is deleted. Returns
+    ``(adopted, missing)`` counts of distinct old files.
+    """
+    adopted = missing = 0
+    rows = (ProductCapture.objects.exclude(image='').order_by()
+            .values('image').annotate(refs=Count('id')))
+    for row in rows:
+        name = row['image']
+        if digest_for(name) is not None:
+            continue
+        try:
+            with default_storage.open(name, 'rb') as fh:
+                image_bytes = fh.read()
+        except FileNotFoundError:
+            missing += 1
+            continue
+        with transaction.atomic():
+            new_name = image_store.acquire(image_bytes, refs=row['refs'])
+            captures = ProductCapture.objects.filter(image=name)
+            session_summary.touch(captures.values_list('session_id', flat=True))
+            captures.update(image=new_name)
+        if not ImageBlob.objects.filter(name=name).exists():
+            default_storage.delete(name)
+        adopted += 1
+    return adopted, missing
+
+
+def backfill(force=False, workers=4):
+    """Render the derivatives of every stored image. Returns ``(images, rendered, failed)``."""
+    def one(blob):
+        digest, name = blob
+        try:
+            return len(generate(digest, name, force)), False
+        except Exception:
+            logger.exception('Could not generate thumbnails for %s', name)
+            return 0, True
+
+    blobs = list(ImageBlob.objects.values_list('sha256', 'name'))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(one, blobs))
+    return len(blobs), sum(n for n, _ in results), sum(failed for _, failed in results)
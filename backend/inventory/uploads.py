@@ -0,0 +1,203 @@
+"""Resumable chunked uploads.
+
+A phone on a flaky connection that loses a multipart upload has to start
+again from zero. Instead a client can:
+
+1. create an upload with its total ``size`` (``POST /api/uploads/``),
+2. send the file in chunks (``PATCH /api/uploads/<id>/`` with the raw bytes
+   as the body and their position in an ``Upload-Offset`` header),
+3. extract it (``POST /api/uploads/<id>/finalize/``, with the options of
+   ``/api/product/extract/``).
+
+After a dropped connection it asks for the server's offset
+(``GET /api/uploads/<id>/``) and continues from there; whatever part of
+the interrupted chunk arrived is kept.
+
+Chunks are copied from the request into a spool file in
+``UPLOAD_SPOOL_DIR`` ``COPY_BUFFER`` bytes at a time, so an upload is never
+held in memory, and the finalized file is handed to extraction as an open
+file (see ``imaging.prepare_image``). The spool file's length is the
+upload's offset. Uploads that are not finalized within
+``UPLOAD_EXPIRY_HOURS`` are removed whenever a new one is created.
+
+Only one request writes to an upload at a time: the writer holds a
+``<id>.lock`` file next to the spool file, created with ``O_EXCL`` (which
+works on every platform) and touched as the chunk is copied. A lock that
+has not been touched for ``LOCK_STALE_SECONDS`` belongs to a writer that
+died and is taken over.
+"""
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Upload
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER = 64 * 1024
+LOCK_STALE_SECONDS = 60
+
+
+class UploadError(Exception):
+    """A request that does not fit the upload (answered with a 400)."""
+
+
+class UploadConflict(UploadError):
+    """The client's offset is not the server's (answered with a 409 and the server's offset)."""
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+def spool_path(upload):
+    return os.path.join(settings.UPLOAD_SPOOL_DIR, f'{upload.pk}.part')
+
+
+def lock_path(upload):
+    return os.path.join(settings.UPLOAD_SPOOL_DIR, f'{upload.pk}.lock')
+
+
+def _take_lock(path):
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+
+@contextmanager
+def _writer_lock(upload):
+    """Hold the upload's write lock; yields a function that keeps it fresh. Raises ``UploadConflict``."""
+    path = lock_path(upload)
+    if not _take_lock(path):
+        try:
+            stale = time.time() - os.path.getmtime(path) > LOCK_STALE_SECONDS
+        except FileNotFoundError:
+            stale = True  # Released in the meantime
+        if stale:
+            # Move the dead writer's lock aside (atomic, so only one request takes it over) and retry
+            aside = f'{path}.{uuid.uuid4().hex}'
+            try:
+                os.replace(path, aside)
+                os.remove(aside)
+            except FileNotFoundError:
+                pass
+        if not (stale and _take_lock(path)):
+            raise UploadConflict('Another chunk of this upload is being written', received(upload))
+    try:
+        yield lambda: os.utime(path)
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def received(upload):
+    """Bytes of ``upload`` stored so far."""
+    try:
+        return os.path.getsize(spool_path(upload))
+    except FileNotFoundError:
+        return 0
+
+
+def create(size, session_id='default'):
+    """Start an upload of ``size`` bytes. Raises ``UploadError`` for a bad size."""
+    if size <= 0:
+        raise UploadError('size must be positive')
+    if size > settings.UPLOAD_MAX_BYTES:
+        raise UploadError(f'Upload too large: {size} bytes (limit {settings.UPLOAD_MAX_BYTES})')
+    expire()
+    upload = Upload.objects.create(size=size, session_id=session_id)
+    os.makedirs(settings.UPLOAD_SPOOL_DIR, exist_ok=True)
+    open(spool_path(upload), 'wb').close()
+    return upload
+
+
+def append(upload, offset, stream, length):
+    """Copy ``length`` bytes from ``stream`` into ``upload`` at ``offset``; returns the new offset.
+
+    ``offset`` must be the number of bytes received so far. If ``stream``
+    ends early (the client went away) the bytes read until then are kept.
+    """
+    if upload.status != Upload.STATUS_OPEN:
+        raise UploadError('Upload is already finalized')
+    if length > settings.UPLOAD_CHUNK_MAX_BYTES:
+        raise UploadError(f'Chunk too large: {length} bytes (limit {settings.UPLOAD_CHUNK_MAX_BYTES})')
+    if offset < 0 or offset + length > upload.size:
+        raise UploadError(f'Chunk at {offset} of {length} bytes does not fit an upload of {upload.size} bytes')
+    try:
+        fh = open(spool_path(upload), 'r+b')
+    except FileNotFoundError:
+        raise UploadError('Upload has expired')
+    # One writer per upload; a retry racing its own stalled request is told where things stand
+    with fh, _writer_lock(upload) as touch:
+        current = os.fstat(fh.fileno()).st_size
+        if offset != current:
+            raise UploadConflict(f'Upload is at offset {current}, not {offset}', current)
+        fh.seek(offset)
+        remaining = length
+        touched = time.monotonic()
+        while remaining:
+            chunk = stream.read(min(COPY_BUFFER, remaining))
+            if not chunk:
+                break
+            fh.write(chunk)
+            remaining -= len(chunk)
+            if time.monotonic() - touched > 1:
+                touch()
+                touched = time.monotonic()
+        return fh.tell()
+
+
+def finalize(upload):
+    """Claim a complete upload for extraction; returns its spool file opened for reading.
+
+    The caller closes the file and then calls ``discard``, or ``reopen`` if
+    the extraction failed and may be retried.
+    """
+    current = received(upload)
+    if current != upload.size:
+        raise UploadConflict(f'Upload is incomplete: {current} of {upload.size} bytes', current)
+    # Atomically claim it, so a retried finalize does not extract the image twice
+    claimed = Upload.objects.filter(pk=upload.pk, status=Upload.STATUS_OPEN).update(
+        status=Upload.STATUS_FINALIZED
+    )
+    if not claimed:
+        raise UploadError('Upload is already finalized')
+    upload.status = Upload.STATUS_FINALIZED
+    return open(spool_path(upload), 'rb')
+
+
+def reopen(upload):
+    """Make a finalized upload finalizable again (its extraction failed), keeping the received bytes."""
+    Upload.objects.filter(pk=upload.pk).update(status=Upload.STATUS_OPEN)
+    upload.status = Upload.STATUS_OPEN
+
+
+def discard(upload):
+    """Delete an upload and its spool file."""
+    for path in (spool_path(upload), lock_path(upload)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    Upload.objects.filter(pk=upload.pk).delete()
+
+
+def expire():
+    """Discard uploads older than ``UPLOAD_EXPIRY_HOURS``. Returns how many."""
+    cutoff = timezone.now() - timedelta(hours=settings.UPLOAD_EXPIRY_HOURS)
+    stale = list(Upload.objects.filter(created_at__lt=cutoff))
+    for upload in stale:
+        discard(upload)
+    if stale:
+        logger.info('Discarded %d expired uploads', len(stale))
+    return len(stale)
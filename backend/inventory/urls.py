@@ -1,13 +1,24 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Under ASGI the native async view keeps many extractions in flight per worker
+extract_view = async_views.extract_product if settings.EXTRACTION_ASYNC_VIEW else views.ProductExtractView.as_view()
 
 urlpatterns = [
-    path('product/extract/', views.ProductExtractView.as_view(), name='extract-product'),
+    path('product/extract/', extract_view, name='extract-product'),
+    path('product/extract/batch/', views.ProductBatchExtractView.as_view(), name='extract-product-batch'),
+    path('product/jobs/<uuid:pk>/', views.ExtractionJobView.as_view(), name='extraction-job'),
+    path('uploads/', views.UploadsView.as_view(), name='uploads'),
+    path('uploads/<uuid:pk>/', views.UploadView.as_view(), name='upload'),
+    path('uploads/<uuid:pk>/finalize/', views.UploadFinalizeView.as_view(), name='upload-finalize'),
     path('export/csv/', views.ExportCSVView.as_view(), name='export-csv'),
     path('session/save/', views.SaveSessionView.as_view(), name='save-session'),
     path('session/products/', views.SessionProductsView.as_view(), name='session-products'),
     path('session/clear/', views.ClearSessionView.as_view(), name='clear-session'),
     path('health/', views.HealthCheckView.as_view(), name='health-check'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('media/<str:digest>/<str:variant>/', views.MediaView.as_view(), name='media'),
     path('product/<uuid:pk>/', views.ProductDetailView.as_view(), name='product-detail'),
     path('sessions/', views.SessionsListView.as_view(), name='sessions-list'),
 ]
\ No newline at end of file
@@ -1,284 +1,443 @@
-import base64
-import pytesseract
 from PIL import Image
-from django.http import HttpResponse, JsonResponse
 from django.conf import settings
-from django.db.models import Count, Max
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
-from openai import OpenAI
-import json
-from .models import ProductCapture
-from .serializers import ProductCaptureSerializer
-import csv
+from . import catalog, exporters, llm, metrics, product_index, read_cache, streaming, thumbnails, uploads
+from .extraction import (InvalidImageError, resolve_ocr_mode, run_batch_extraction, run_extraction,
+                         stream_extraction)
+from .jobs import get_job_queue
+from .models import ExtractionJob, ImageBlob, ProductCapture, Session, Upload
+from .pagination import InvalidCursor, is_paginated, paginate
+from .serializers import ExtractionJobSerializer, ProductCaptureSerializer
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 import io
-from django.core.files.base import ContentFile
+from django.core.files.base import ContentFile, File
+
+def is_truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def parse_extraction_options(data):
+    """Read max_items, ocr and cache from request data. Raises ValueError for a bad ocr mode."""
+    # Respect a max_items parameter to limit saves and cost
+    try:
+        max_items = int(data.get('max_items', 10))
+    except Exception:
+        max_items = 10
+
+    ocr_mode = resolve_ocr_mode(data.get('ocr'))
+
+    # cache=0 forces a fresh extraction even for a near-duplicate photo
+    use_cache = None
+    if 'cache' in data:
+        use_cache = is_truthy(data.get('cache'))
+    return max_items, ocr_mode, use_cache
+
+
+def enqueue_extraction_job(image, session_id, max_items, ocr_mode):
+    """Persist an upload (bytes or a file) as a queued ExtractionJob; returns the 202 payload."""
+    is_bytes = isinstance(image, bytes)
+    try:
+        Image.open(io.BytesIO(image) if is_bytes else image).verify()
+    except Exception as e:
+        raise InvalidImageError(f'Invalid image file: {e}')
+
+    job = ExtractionJob(session_id=session_id, max_items=max(0, max_items), ocr_mode=ocr_mode)
+    if not is_bytes:
+        image.seek(0)
+    job.image.save(f"upload_{timezone.now().strftime('%Y%m%d%H%M%S')}.jpg",
+                   ContentFile(image) if is_bytes else File(image), save=False)
+    job.save()
+    get_job_queue().submit(job.id)
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': reverse('extraction-job', kwargs={'pk': job.id}),
+    }
+
+
+STREAM_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+
+def parse_stream_format(value):
+    """Map the ``stream`` form field to 'ndjson', 'sse' or None (not streaming)."""
+    if value in (None, '') or str(value).lower() in ('0', 'false', 'no'):
+        return None
+    value = str(value).lower()
+    if value in STREAM_CONTENT_TYPES:
+        return value
+    if is_truthy(value):
+        return 'ndjson'
+    raise ValueError(f"Invalid stream format '{value}'; expected ndjson or sse")
+
+
+def busy_payload(exc):
+    """Body and headers of the 429 for ``llm.ModelBusy``."""
+    return {'error': str(exc), 'retry_after': exc.retry_after}, {'Retry-After': str(exc.retry_after)}
+
+
+def stream_frames(events, fmt):
+    """Frame ``stream_extraction`` events as NDJSON lines or SSE messages.
+
+    Closing the frames closes ``events`` too, so its admission lease is given
+    back even if the response is never iterated.
+    """
+    return streaming.ClosingIterator(_frames(events, fmt), events.close)
+
+
+def _frames(events, fmt):
+    frame = streaming.sse_event if fmt == 'sse' else streaming.ndjson_event
+    try:
+        for event, data in events:
+            if event == 'item':
+                data = ProductCaptureSerializer(data).data
+            yield frame(event, data)
+    except llm.ModelBusy as e:
+        yield frame('error', busy_payload(e)[0])
+    except Exception as e:
+        # Headers are long gone; report the failure in-band
+        yield frame('error', {'error': str(e)})
+
+
+def streaming_response(frames, fmt):
+    response = StreamingHttpResponse(frames, content_type=STREAM_CONTENT_TYPES[fmt])
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
+
+
+def extraction_headers(outcome):
+    headers = {'X-Capture-Cache': outcome['cache']}
+    if outcome['degraded']:
+        # The model API was unavailable; the captures were built from OCR alone
+        headers['X-Extraction-Degraded'] = 'ocr-only'
+    if outcome['catalog']:
+        headers['X-Barcode-Catalog'] = outcome['catalog']
+    if outcome['index']:
+        # Answered from the OCR text and the product index, without the model
+        headers['X-Product-Index'] = outcome['index']
+    return headers
+
+
+def extraction_response(request, image, session_id):
+    """Extract ``image`` (upload bytes or an open file) with the options in ``request.data``.
+
+    Shared by ``ProductExtractView`` and ``UploadFinalizeView``: streams the
+    captures, queues a job or answers with the saved captures.
+    """
+    try:
+        max_items, ocr_mode, use_cache = parse_extraction_options(request.data)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    try:
+        stream_format = parse_stream_format(request.data.get('stream'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    # Streaming mode: send each capture as soon as the model has produced and we have saved it
+    if stream_format:
+        try:
+            events = stream_extraction(image, session_id=session_id, max_items=max_items,
+                                       ocr_mode=ocr_mode, use_cache=use_cache,
+                                       barcode=request.data.get('barcode'))
+        except InvalidImageError as e:
+            return Response({'error': str(e)}, status=400)
+        except llm.ModelBusy as e:
+            # Admission is decided before the stream starts, so this is still a proper 429
+            data, headers = busy_payload(e)
+            return Response(data, status=429, headers=headers)
+        return streaming_response(stream_frames(events, stream_format), stream_format)
+
+    # Async mode: persist the upload, queue it for the worker pool and return immediately
+    if is_truthy(request.data.get('async', False)):
+        try:
+            return Response(enqueue_extraction_job(image, session_id, max_items, ocr_mode),
+                            status=202)
+        except InvalidImageError as e:
+            return Response({'error': str(e)}, status=400)
+
+    try:
+        outcome = run_extraction(image, session_id=session_id, max_items=max_items,
+                                 ocr_mode=ocr_mode, use_cache=use_cache,
+                                 barcode=request.data.get('barcode'))
+    except InvalidImageError as e:
+        return Response({'error': str(e)}, status=400)
+    except llm.ModelBusy as e:
+        # Too many model calls in flight across the workers; tell the client when to come back
+        data, headers = busy_payload(e)
+        return Response(data, status=429, headers=headers)
+    except Exception as e:
+        return Response({'error': str(e)}, status=500)
+
+    serializer = ProductCaptureSerializer(outcome['saved'], many=True)
+
+    # If debug flag provided in request, include the raw model content and parsed items
+    if is_truthy(request.data.get('debug', False)):
+        # Return saved objects plus the model's full content and the parsed JSON (also kept in the run)
+        return Response({
+            'saved': serializer.data,
+            'parsed_items': outcome['items'],
+            'model_content': outcome['content'],
+            'cache': outcome['cache'],
+            'degraded': outcome['degraded'],
+            'barcode': outcome['barcode'],
+            'index': outcome['index'],
+            'run': str(outcome['run'].pk),
+        }, headers=extraction_headers(outcome))
+
+    return Response(serializer.data, headers=extraction_headers(outcome))
+
 
 class ProductExtractView(APIView):
     parser_classes = (MultiPartParser, FormParser)
     
     def post(self, request, format=None):
-        image_file = request.FILES.get('image')
+        # Touching FILES parses (and receives) the multipart body
+        with metrics.stage('upload'):
+            image_file = request.FILES.get('image')
         session_id = request.data.get('session_id', 'default')
 
         if not image_file:
             return Response({'error': 'No image provided'}, status=400)
 
-        # Read uploaded file into bytes once and reuse (prevents EOF/file-pointer issues)
-        try:
-            image_bytes = image_file.read()
-        except Exception:
-            return Response({'error': 'Failed to read uploaded image'}, status=400)
+        # Pass the uploaded file itself; Django has already spooled a large one to disk
+        return extraction_response(request, image_file, session_id)
 
-        # Perform OCR using PIL from bytes
-        try:
-            pil_image = Image.open(io.BytesIO(image_bytes))
-        except Exception as e:
-            return Response({'error': f'Invalid image file: {e}'}, status=400)
 
-        ocr_text = pytesseract.image_to_string(pil_image)
+def upload_status(upload, offset):
+    return {
+        'upload_id': upload.id,
+        'size': upload.size,
+        'offset': offset,
+        'status': upload.status,
+        'upload_url': reverse('upload', kwargs={'pk': upload.id}),
+        'finalize_url': reverse('upload-finalize', kwargs={'pk': upload.id}),
+    }
 
-        # Prepare image for GPT (base64 from same bytes)
-        image_data = base64.b64encode(image_bytes).decode('utf-8')
-        
-        # Call GPT Vision API
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        
+
+def upload_error(e):
+    if isinstance(e, uploads.UploadConflict):
+        return Response({'error': str(e), 'offset': e.offset}, status=409)
+    return Response({'error': str(e)}, status=400)
+
+
+class UploadsView(APIView):
+    """Start a resumable upload of ``size`` bytes (see ``inventory.uploads``)."""
+    def post(self, request):
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({'error': 'size is required'}, status=400)
+        try:
+            upload = uploads.create(size, request.data.get('session_id', 'default'))
+        except uploads.UploadError as e:
+            return upload_error(e)
+        payload = upload_status(upload, 0)
+        return Response(payload, status=201, headers={'Location': payload['upload_url']})
+
+
+class UploadView(APIView):
+    """Report the offset of (GET), append a chunk to (PATCH) or abort (DELETE) an upload.
+
+    A chunk is the raw request body, written at the ``Upload-Offset``
+    header (or ``offset`` query parameter), which must equal the bytes
+    received so far; otherwise the answer is a 409 with the server's offset.
+    """
+    def get(self, request, pk):
+        upload = get_object_or_404(Upload, pk=pk)
+        return Response(upload_status(upload, uploads.received(upload)))
+
+    def patch(self, request, pk):
+        upload = get_object_or_404(Upload, pk=pk)
         try:
-            # Prefer the smaller vision-capable model (gpt-mini-4) and instruct it
-            # to prioritize visual analysis. Provide OCR text as auxiliary input.
-            response = client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": [
-                            {
-                                "type": "text",
-                                                "text": (
-                                                    "You are an assistant with strong visual reasoning. "
-                                                    "Prioritize understanding the image contents when extracting product information. "
-                                                    "Use OCR only as an auxiliary hint if the image text is unclear or partially occluded. "
-                                                    "Return only a valid JSON array of objects (even if there is only one item). "
-                                                    "Each object should contain the requested fields."
-                                                ),
-                            }
-                        ]
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                                {
-                                    "type": "text",
-                                            "text": f"""
-                                            Analyze the following product image using vision and the provided OCR text.
-                                            Return a JSON array of detected items (even if only one). For each item, include these fields:
-                                
-                                            - product_name
-                                            - unit (e.g., "500g", "1L", "12pcs")
-                                            - description (short text)
-                                            - category (Food, Medicine, Drinks, Hygiene, Insecticide, Cleanings, School Supplies, Office Supplies, Tobacco, Alcohol, Bread & Pastries, Baby Products, Pet Supplies, Hardware & Electrical, Clothing & Accessories, Mobile Load & E-Services, Rice & Grains)
-                                            - confidence (0 to 1, estimate based on clarity and completeness)
-                                
-                                            OCR Text: {ocr_text}
-                                
-                                            Use the image and OCR together. If uncertain, lower the confidence score.
-                                            Return JSON only (an array of objects).
-                                            """
-                                },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_data}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=300,
-            )
-            
-            # Parse GPT response
-            content = response.choices[0].message.content
-
-            def extract_json_from_text(text: str):
-                """Try several strategies to extract a JSON object/array from text.
-
-                Strategies (in order):
-                - Look for fenced code blocks labelled json (```json ... ```)
-                - Look for any triple-backtick block and attempt parse
-                - Find the first balanced JSON object {...}
-                - Find the first balanced JSON array [...]
-                - Fallback: attempt to locate first '{'..'}' span and parse
-                """
-                # 1) fenced code block with json
-                import re
-
-                # Allow fenced blocks that contain either an object or an array
-                fenced_json = re.search(r"```(?:json)?\s*([\[\{][\s\S]*?[\]\}])\s*```", text, re.IGNORECASE)
-                if fenced_json:
-                    candidate = fenced_json.group(1)
-                    try:
-                        return json.loads(candidate)
-                    except Exception:
-                        pass
-
-                # 2) any triple-backtick block
-                triple = re.search(r"```([\s\S]*?)```", text)
-                if triple:
-                    c = triple.group(1).strip()
-                    # try as-is
-                    try:
-                        return json.loads(c)
-                    except Exception:
-                        # maybe the block contains other text; try to find braces inside
-                        pass
-
-                # 3) balanced-brace object or array scanning
-                def find_balanced(text, open_ch, close_ch):
-                    start = None
-                    depth = 0
-                    for i, ch in enumerate(text):
-                        if ch == open_ch:
-                            if start is None:
-                                start = i
-                            depth += 1
-                        elif ch == close_ch and start is not None:
-                            depth -= 1
-                            if depth == 0:
-                                return text[start:i+1]
-                    return None
-
-                # Prefer array first, then object (avoids capturing only first object when model returned an array)
-                arr = find_balanced(text, '[', ']')
-                if arr:
-                    try:
-                        return json.loads(arr)
-                    except Exception:
-                        pass
-
-                obj = find_balanced(text, '{', '}')
-                if obj:
-                    try:
-                        return json.loads(obj)
-                    except Exception:
-                        pass
-
-                # 4) Fallback: locate first '{'.. last '}' and attempt
-                s = text.find('{')
-                e = text.rfind('}')
-                if s != -1 and e != -1 and e > s:
-                    candidate = text[s:e+1]
-                    try:
-                        return json.loads(candidate)
-                    except Exception as exc:
-                        raise ValueError(f'Failed to parse JSON from candidate substring: {exc}')
-
-                # Nothing worked
-                raise ValueError('No JSON object or array found in model response')
+            offset = int(request.headers.get('Upload-Offset', request.query_params.get('offset', '')))
+        except ValueError:
+            return Response({'error': 'Upload-Offset header is required'}, status=400)
+        try:
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return Response({'error': 'Invalid Content-Length header'}, status=400)
+        try:
+            with metrics.stage('upload'):
+                # Read the body straight from the request stream; never parse it into memory
+                offset = uploads.append(upload, offset, request.stream, length)
+        except uploads.UploadError as e:
+            return upload_error(e)
+        return Response(upload_status(upload, offset))
 
-            try:
-                parsed = extract_json_from_text(content)
-            except Exception as parse_err:
-                # include model content snippet for debugging (trim to reasonable length)
-                snippet = content[:2000] + ('...' if len(content) > 2000 else '')
-                raise ValueError(f'Failed to extract JSON from model response: {parse_err}; response snippet: {snippet}')
-
-            # Normalize to list
-            if isinstance(parsed, dict):
-                items = [parsed]
-            elif isinstance(parsed, list):
-                items = parsed
+    def delete(self, request, pk):
+        upload = get_object_or_404(Upload, pk=pk)
+        uploads.discard(upload)
+        return Response(status=204)
+
+
+class UploadFinalizeView(APIView):
+    """Extract a complete upload, with the options and responses of ``ProductExtractView``."""
+    def post(self, request, pk):
+        upload = get_object_or_404(Upload, pk=pk)
+        try:
+            image = uploads.finalize(upload)
+        except uploads.UploadError as e:
+            return upload_error(e)
+        # Streamed and queued extractions have decoded or copied the file before this returns
+        response = None
+        try:
+            response = extraction_response(request, image, upload.session_id)
+            return response
+        finally:
+            image.close()
+            if response is not None and response.status_code < 400:
+                uploads.discard(upload)
             else:
-                raise ValueError('Parsed model response is neither object nor array')
+                # Keep the bytes, so the client can retry the finalize without uploading again
+                uploads.reopen(upload)
+
+
+class ProductBatchExtractView(APIView):
+    """Extract many images (repeated ``images`` fields) in one request.
+
+    Images are analyzed concurrently and every resulting capture is saved
+    in a single transaction. One result per image is returned, in upload
+    order, with either the saved captures or an error.
+    """
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request, format=None):
+        with metrics.stage('upload'):
+            files = request.FILES.getlist('images')
+        session_id = request.data.get('session_id', 'default')
+
+        if not files:
+            return Response({'error': 'No images provided'}, status=400)
+        limit = settings.EXTRACTION_BATCH_MAX_IMAGES
+        if len(files) > limit:
+            return Response({'error': f'Too many images: {len(files)} (limit {limit})'}, status=400)
+
+        try:
+            max_items, ocr_mode, use_cache = parse_extraction_options(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
 
-            # Respect a max_items parameter to limit saves and cost
+        images = []
+        for f in files:
             try:
-                max_items = int(request.data.get('max_items', 10))
+                images.append((f.name, f.read()))
             except Exception:
-                max_items = 10
-
-            items = items[:max_items]
-
-            saved_objects = []
-            # Save each detected item as a ProductCapture
-            for idx, it in enumerate(items):
-                # Basic validation and defaults
-                name = it.get('product_name') if isinstance(it, dict) else None
-                unit = it.get('unit') if isinstance(it, dict) else ''
-                desc = it.get('description') if isinstance(it, dict) else ''
-                cat = it.get('category') if isinstance(it, dict) else 'Food'
-                conf = it.get('confidence') if isinstance(it, dict) else 0.0
-
-                if not name:
-                    # skip items without a product_name
-                    continue
-
-                # Create ProductCapture and attach image (same file for each item)
-                timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
-                image_name = f"capture_{timestamp}_{idx}.jpg"
-                content_file = ContentFile(image_bytes, name=image_name)
-
-                product_capture = ProductCapture(
-                    product_name=name,
-                    unit=unit or '',
-                    description=desc or '',
-                    category=cat or 'Food',
-                    confidence=float(conf) if conf is not None else 0.0,
-                    session_id=session_id
-                )
-                product_capture.image.save(content_file.name, content_file, save=False)
-                product_capture.save()
-                saved_objects.append(product_capture)
-
-            serializer = ProductCaptureSerializer(saved_objects, many=True)
-
-            # If debug flag provided in request, include the raw model content and parsed items
-            debug_flag = str(request.data.get('debug', False)).lower() in ('1', 'true', 'yes')
-            if debug_flag:
-                # Return saved objects plus the model's full content and the parsed JSON
-                print({
-                    'saved': serializer.data,
-                    'parsed_items': items,
-                    'model_content': content,
-                })
-                return Response({
-                    'saved': serializer.data,
-                    'parsed_items': items,
-                    'model_content': content,
-                })
+                return Response({'error': f'Failed to read uploaded image {f.name}'}, status=400)
 
-            return Response(serializer.data)
-            
+        try:
+            results = run_batch_extraction(images, session_id=session_id, max_items=max_items,
+                                           ocr_mode=ocr_mode, use_cache=use_cache)
         except Exception as e:
             return Response({'error': str(e)}, status=500)
 
+        payload = []
+        for result in results:
+            entry = {'index': result['index'], 'filename': result['filename']}
+            if 'error' in result:
+                entry['error'] = result['error']
+            else:
+                outcome = result['outcome']
+                entry['cache'] = outcome['cache']
+                entry['degraded'] = outcome['degraded']
+                entry['barcode'] = outcome['barcode']
+                # 'index' is the image's position in the batch
+                entry['product_index'] = outcome['index']
+                entry['saved'] = ProductCaptureSerializer(outcome['saved'], many=True).data
+            payload.append(entry)
+
+        return Response({
+            'results': payload,
+            'saved_count': sum(len(r.get('saved', [])) for r in payload),
+            'failed_count': sum(1 for r in payload if 'error' in r),
+        })
+
+
+class ExtractionJobView(APIView):
+    """Report the status, progress and results of a queued extraction job."""
+    def get(self, request, pk):
+        job = get_object_or_404(ExtractionJob, pk=pk)
+        return Response(ExtractionJobSerializer(job).data)
+
 class ExportCSVView(APIView):
+    """Stream saved captures as CSV (default), NDJSON or XLSX.
+
+    Query parameters:
+    - ``session_id``: one or more sessions (repeated or comma-separated); ``all=1`` exports every session
+    - ``date_from`` / ``date_to``: ISO dates or datetimes bounding ``created_at`` (inclusive)
+    - ``min_confidence``: only rows at or above this confidence
+    - ``type``: ``csv``, ``ndjson`` or ``xlsx``
+    - ``gzip=1``: gzip CSV/NDJSON output on the fly
+    """
     def get(self, request):
-        session_id = request.query_params.get('session_id', 'default')
-        
-        # Get products for this session
-        products = ProductCapture.objects.filter(session_id=session_id)
-        
-        # Create CSV response
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="inventory_export_{session_id}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['product_name', 'unit', 'description', 'category', 'confidence'])
-        
-        for product in products:
-            writer.writerow([
-                product.product_name,
-                product.unit,
-                product.description,
-                product.category,
-                product.confidence
-            ])
-        
+        params = request.query_params
+        products = ProductCapture.objects.all()
+
+        session_ids = []
+        if not is_truthy(params.get('all', False)):
+            for value in params.getlist('session_id') or ['default']:
+                session_ids.extend(s.strip() for s in value.split(',') if s.strip())
+            products = products.filter(session_id__in=session_ids or ['default'])
+
+        for param, lookup in (('date_from', 'gte'), ('date_to', 'lte')):
+            value = params.get(param)
+            if not value:
+                continue
+            d = parse_date(value)
+            if d is not None:
+                products = products.filter(**{f'created_at__date__{lookup}': d})
+                continue
+            dt = parse_datetime(value)
+            if dt is None:
+                return Response({'error': f'Invalid {param}: {value}'}, status=400)
+            if timezone.is_naive(dt):
+                dt = timezone.make_aware(dt)
+            products = products.filter(**{f'created_at__{lookup}': dt})
+
+        if params.get('min_confidence'):
+            try:
+                products = products.filter(confidence__gte=float(params['min_confidence']))
+            except ValueError:
+                return Response({'error': 'min_confidence must be a number'}, status=400)
+
+        products = products.order_by('created_at')
+
+        export_type = params.get('type', 'csv').lower()
+        if export_type not in exporters.FORMATS:
+            return Response({'error': f"Unsupported export type '{export_type}'"}, status=400)
+        content_type, ext = exporters.FORMATS[export_type]
+        filename = f"inventory_export_{session_ids[0]}" if len(session_ids) == 1 else 'inventory_export'
+
+        if export_type == 'xlsx':
+            try:
+                fh = exporters.write_xlsx(products)
+            except ImportError:
+                return Response({'error': 'XLSX export requires the openpyxl package'}, status=400)
+            response = StreamingHttpResponse(exporters.iter_file(fh), content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="{filename}.{ext}"'
+            return response
+
+        stream = exporters.stream_csv(products) if export_type == 'csv' else exporters.stream_ndjson(products)
+        if is_truthy(params.get('gzip', False)):
+            stream = exporters.gzip_stream(stream)
+            content_type, ext = 'application/gzip', f'{ext}.gz'
+
+        # Create streaming response; rows are read and written chunk by chunk
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{ext}"'
         return response
 
 class SaveSessionView(APIView):
@@ -291,19 +450,113 @@ class SaveSessionView(APIView):
     
 class HealthCheckView(APIView):
     def get(self, request):
-        return Response({'status': 'healthy', 'timestamp': timezone.now()})
+        return Response({
+            'status': 'healthy',
+            'timestamp': timezone.now(),
+            'model_api': llm.get_breaker().state,
+        })
+
+
+class MetricsView(APIView):
+    """Prometheus scrape endpoint, summed over every worker process (see ``inventory.metrics``)."""
+
+    def get(self, request):
+        if not settings.METRICS_ENABLED:
+            return Response({'error': 'Metrics are disabled'}, status=404)
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Media URLs name their content, so a response never goes stale
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class MediaView(APIView):
+    """Serve a stored image (``original``) or a thumbnail (``medium``, ``small``) by content hash.
+
+    Responses carry a strong ETag and a year-long immutable Cache-Control,
+    and a matching ``If-None-Match`` gets a 304 without touching storage.
+    A thumbnail that has not been rendered yet is rendered on this request.
+    """
+    def get(self, request, digest, variant):
+        if variant not in thumbnails.MEDIA_VARIANTS or not thumbnails.is_digest(digest):
+            return Response({'error': 'Not found'}, status=404)
+        etag = thumbnails.etag(digest, variant)
+        if etag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+            return response
+
+        original = ImageBlob.objects.filter(sha256=digest).values_list('name', flat=True).first()
+        if original is None:
+            return Response({'error': 'Not found'}, status=404)
+        try:
+            name = original if variant == 'original' else thumbnails.ensure(digest, original, variant)
+            fh = default_storage.open(name, 'rb')
+        except FileNotFoundError:
+            return Response({'error': 'Not found'}, status=404)
+        response = FileResponse(fh, content_type=thumbnails.content_type(variant, name))
+        response['ETag'] = etag
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+def parse_fields(params, allowed):
+    """Parse a ``fields=a,b`` projection. Returns None when absent; raises ValueError for unknown names."""
+    raw = params.get('fields')
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
 
 class SessionProductsView(APIView):
+    """List a session's captures, newest first.
+
+    Pass ``limit`` and/or ``cursor`` to page through the results with a
+    keyset cursor on (created_at, id); the response is then
+    ``{"results": [...], "next_cursor": ...}``. ``fields`` restricts the
+    returned fields (``id`` is always included). Responses carry an ETag
+    derived from the session's version (see ``inventory.read_cache``).
+    """
     def get(self, request):
         session_id = request.query_params.get('session_id')
         if not session_id:
             return Response({'error': 'session_id is required'}, status=400)
-        
-        products = ProductCapture.objects.filter(session_id=session_id).order_by('-created_at')
-        serializer = ProductCaptureSerializer(products, many=True)
-        return Response(serializer.data)
 
-from django.shortcuts import get_object_or_404
+        stamp, updated_at = read_cache.session_stamp(session_id)
+        return read_cache.conditional(request, stamp, updated_at, lambda: self.list(request, session_id))
+
+    def list(self, request, session_id):
+        url_fields = ProductCaptureSerializer.URL_FIELDS
+        try:
+            fields = parse_fields(request.query_params,
+                                  [f.name for f in ProductCapture._meta.fields] + list(url_fields))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        products = ProductCapture.objects.filter(session_id=session_id)
+        if fields:
+            # Only read the projected columns (plus the pagination keys); media URLs need the image name
+            columns = {'image' if f in url_fields else f for f in fields}
+            products = products.only(*(columns | {'id', 'created_at'}))
+
+        if not is_paginated(request.query_params):
+            products = products.order_by('-created_at')
+            return Response(ProductCaptureSerializer(products, many=True, fields=fields).data)
+
+        try:
+            rows, next_cursor = paginate(products, request.query_params, 'created_at', 'id')
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({
+            'results': ProductCaptureSerializer(rows, many=True, fields=fields).data,
+            'next_cursor': next_cursor,
+        })
+
 from django.core.files.uploadedfile import UploadedFile
 
 class ProductDetailView(APIView):
@@ -326,7 +579,10 @@ class ProductDetailView(APIView):
 
         serializer = ProductCaptureSerializer(product, data=data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            serializer.save(edited_at=timezone.now())
+            # A user-reviewed capture with a barcode is the best catalog entry we can get
+            catalog.confirm(serializer.instance)
+            product_index.confirm(serializer.instance)
             return Response(serializer.data)
         # Return validation errors (helpful for debugging client 400s)
         return Response(serializer.errors, status=400)
@@ -348,23 +604,47 @@ class ClearSessionView(APIView):
 
 
 class SessionsListView(APIView):
-    """Return a list of sessions with counts and last seen timestamp."""
+    """Return a list of sessions with counts and last seen timestamp.
+
+    Supports the same ``limit``/``cursor`` paging (on last_seen, session_id),
+    ``fields`` projection and ETags as ``SessionProductsView``.
+    """
+    FIELDS = ('session_id', 'count', 'last_seen', 'categories', 'mean_confidence')
+
     def get(self, request):
-        sessions = (
-            ProductCapture.objects
-            .values('session_id')
-            .annotate(count=Count('id'), last_seen=Max('created_at'))
-            .order_by('-last_seen')
-        )
+        stamp, updated_at = read_cache.sessions_stamp()
+        return read_cache.conditional(request, stamp, updated_at, lambda: self.list(request))
+
+    def list(self, request):
+        try:
+            fields = parse_fields(request.query_params, self.FIELDS) or self.FIELDS
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        # Read the incrementally maintained summaries instead of aggregating every capture
+        sessions = Session.objects.exclude(last_seen=None)
+        next_cursor = None
+        paginated = is_paginated(request.query_params)
+        if paginated:
+            try:
+                sessions, next_cursor = paginate(sessions, request.query_params, 'last_seen', 'session_id')
+            except InvalidCursor as e:
+                return Response({'error': str(e)}, status=400)
+        else:
+            sessions = sessions.order_by('-last_seen')
 
         # Normalize session_id (empty strings -> 'default')
-        result = [
-            {
-                'session_id': s['session_id'] or 'default',
-                'count': s['count'],
-                'last_seen': s['last_seen'],
+        result = []
+        for s in sessions:
+            row = {
+                'session_id': s.session_id or 'default',
+                'count': s.count,
+                'last_seen': s.last_seen,
+                'categories': s.category_counts,
+                'mean_confidence': s.mean_confidence,
             }
-            for s in sessions
-        ]
+            result.append({k: row[k] for k in fields})
 
-        return Response(result)
\ No newline at end of file
+        if paginated:
+            return Response({'results': result, 'next_cursor': next_cursor})
+        return Response(result)
@@ -11,6 +11,7 @@ import { Textarea } from '@/components/ui/textarea';
 import { AlertCircle, CheckCircle } from 'lucide-react';
 import type { ExtractionResponse, ProductCapture } from './types/product';
 import { api } from './lib/api';
+import { scanBarcode } from './lib/barcode';
 import { ConnectionStatus } from './components/ConnectionsStatus';
 
 function App() {
@@ -35,10 +36,11 @@ function App() {
     setAlert(null);
 
     try {
-      const items = await api.extractProduct({
+      const items = await api.extractProductResumable({
         image: imageBlob,
         session_id: sessionId,
         max_items: 10,
+        barcode: await scanBarcode(imageBlob),
       });
 
       if (Array.isArray(items) && items.length > 0) {
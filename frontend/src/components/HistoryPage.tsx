@@ -251,6 +251,16 @@ export function HistoryPage({ sessionId, onProductUpdate }: HistoryPageProps) {
                   <Card key={product.id} className="overflow-hidden hover:shadow-md transition-shadow">
                     <CardContent className="p-4">
                       <div className="flex justify-between items-start mb-3">
+                        {product.thumbnail_url && (
+                          <img
+                            src={product.thumbnail_url}
+                            alt=""
+                            loading="lazy"
+                            width={64}
+                            height={64}
+                            className="h-16 w-16 rounded object-cover mr-3 flex-shrink-0 bg-gray-100"
+                          />
+                        )}
                         <div className="flex-1">
                           <h3 className="font-semibold text-lg line-clamp-2 mb-1">
                             {product.product_name}
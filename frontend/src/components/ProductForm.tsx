@@ -10,6 +10,7 @@ import {
   SelectValue,
 } from '@/components/ui/select';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
+import { PRODUCT_CATEGORIES } from '@/types/product';
 import type { ExtractionResponse, ProductCategory } from '@/types/product';
 
 interface ProductFormProps {
@@ -32,15 +33,6 @@ export function ProductForm({
     onSubmit(formData);
   };
 
-  const categories: ProductCategory[] = [
-    'Food',
-    'Medicine',
-    'Drinks',
-    'Hygiene',
-    'Insecticide',
-    'Cleanings',
-  ];
-
   return (
     <Card className="w-full max-w-2xl mx-auto">
       <CardHeader>
@@ -96,7 +88,7 @@ export function ProductForm({
                   <SelectValue placeholder="Select category" />
                 </SelectTrigger>
                 <SelectContent>
-                  {categories.map((category) => (
+                  {PRODUCT_CATEGORIES.map((category) => (
                     <SelectItem key={category} value={category}>
                       {category}
                     </SelectItem>
@@ -36,7 +36,17 @@ export function ProductList({ products, onExport, onRemove, onEdit }: ProductLis
                   className="border rounded-lg p-4 space-y-2 hover:bg-gray-50 transition-colors"
                 >
                   <div className="flex justify-between items-start">
-                    <div>
+                    {product.thumbnail_url && (
+                      <img
+                        src={product.thumbnail_url}
+                        alt=""
+                        loading="lazy"
+                        width={48}
+                        height={48}
+                        className="h-12 w-12 rounded object-cover mr-3 flex-shrink-0 bg-gray-100"
+                      />
+                    )}
+                    <div className="flex-1">
                       <h4 className="font-semibold text-lg line-clamp-2">
                         {product.product_name}
                       </h4>
@@ -1,6 +1,11 @@
 import axios from "axios";
 
-import type { ExtractionResponse, ProductCapture } from "@/types/product";
+import type {
+  BatchExtractionResponse,
+  ExtractionResponse,
+  ExtractionStreamEvent,
+  ProductCapture,
+} from "@/types/product";
 
 const apiClient = axios.create({
   baseURL: "/api",
@@ -13,20 +18,24 @@ function handleAxiosError(err: any) {
 }
 
 export const api = {
-  // Upload image and request extraction. Accepts a Blob or File and session_id
+  // Upload image and request extraction. Accepts a Blob or File and session_id.
+  // A barcode scanned on the device lets the backend answer from its catalog.
   async extractProduct({
     image,
     session_id,
     max_items = 10,
+    barcode,
   }: {
     image: Blob;
     session_id?: string;
     max_items?: number;
+    barcode?: string;
   }): Promise<ProductCapture[]> {
     const fd = new FormData();
     fd.append("image", image, "capture.jpg");
     if (session_id) fd.append("session_id", session_id);
     fd.append("max_items", String(max_items));
+    if (barcode) fd.append("barcode", barcode);
 
     try {
       const res = await apiClient.post("/product/extract/", fd, {
@@ -38,6 +47,135 @@ export const api = {
     }
   },
 
+  // Upload an image in chunks that survive a dropped connection, then extract it.
+  // After a failed chunk the upload continues from the offset the server has.
+  async extractProductResumable({
+    image,
+    session_id,
+    max_items = 10,
+    barcode,
+    chunkSize = 512 * 1024,
+    retries = 5,
+  }: {
+    image: Blob;
+    session_id?: string;
+    max_items?: number;
+    barcode?: string;
+    chunkSize?: number;
+    retries?: number;
+  }): Promise<ProductCapture[]> {
+    try {
+      const { data: upload } = await apiClient.post("/uploads/", {
+        size: image.size,
+        session_id,
+      });
+      const url = `/uploads/${upload.upload_id}/`;
+      let offset = 0;
+      let failures = 0;
+      while (offset < image.size) {
+        try {
+          const res = await apiClient.patch(url, image.slice(offset, offset + chunkSize), {
+            headers: {
+              "Content-Type": "application/octet-stream",
+              "Upload-Offset": String(offset),
+            },
+          });
+          offset = res.data.offset;
+          failures = 0;
+        } catch (e: any) {
+          if (++failures > retries) throw e;
+          await new Promise((resolve) => setTimeout(resolve, 500 * 2 ** failures));
+          // A 409 carries the server's offset; otherwise ask for it
+          offset =
+            e?.response?.data?.offset ??
+            (await apiClient.get(url).then((res) => res.data.offset, () => offset));
+        }
+      }
+
+      const fd = new FormData();
+      fd.append("max_items", String(max_items));
+      if (barcode) fd.append("barcode", barcode);
+      const res = await apiClient.post(`${url}finalize/`, fd);
+      return res.data as ProductCapture[];
+    } catch (e) {
+      return handleAxiosError(e);
+    }
+  },
+
+  // Upload an image and receive each saved capture as soon as the model produces it.
+  // onItem is called per capture; resolves with every capture once the stream ends.
+  async extractProductStream({
+    image,
+    session_id,
+    max_items = 10,
+    onItem,
+  }: {
+    image: Blob;
+    session_id?: string;
+    max_items?: number;
+    onItem?: (item: ProductCapture) => void;
+  }): Promise<ProductCapture[]> {
+    const fd = new FormData();
+    fd.append("image", image, "capture.jpg");
+    if (session_id) fd.append("session_id", session_id);
+    fd.append("max_items", String(max_items));
+    fd.append("stream", "ndjson");
+
+    // axios buffers the whole body in the browser, so use fetch to read it incrementally
+    const res = await fetch("/api/product/extract/", { method: "POST", body: fd });
+    if (!res.ok || !res.body) {
+      return Promise.reject(await res.json().catch(() => res.statusText));
+    }
+
+    const items: ProductCapture[] = [];
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = "";
+    for (;;) {
+      const { done, value } = await reader.read();
+      buffered += decoder.decode(value, { stream: !done });
+      const lines = buffered.split("\n");
+      buffered = done ? "" : lines.pop() ?? "";
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const event = JSON.parse(line) as ExtractionStreamEvent;
+        if (event.event === "item") {
+          items.push(event.data);
+          onItem?.(event.data);
+        } else if (event.event === "error") {
+          return Promise.reject(event.data);
+        }
+      }
+      if (done) break;
+    }
+    return items;
+  },
+
+  // Upload several images in one request; the backend extracts them concurrently
+  async extractProducts({
+    images,
+    session_id,
+    max_items = 10,
+  }: {
+    images: Blob[];
+    session_id?: string;
+    max_items?: number;
+  }): Promise<BatchExtractionResponse> {
+    const fd = new FormData();
+    images.forEach((image, i) => fd.append("images", image, `capture_${i}.jpg`));
+    if (session_id) fd.append("session_id", session_id);
+    fd.append("max_items", String(max_items));
+
+    try {
+      const res = await apiClient.post("/product/extract/batch/", fd, {
+        headers: { "Content-Type": "multipart/form-data" },
+      });
+      return res.data as BatchExtractionResponse;
+    } catch (e) {
+      return handleAxiosError(e);
+    }
+  },
+
   // Get products for a session
   async getSessionProducts(sessionId: string): Promise<ProductCapture[]> {
     try {
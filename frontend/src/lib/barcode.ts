@@ -0,0 +1,53 @@
+// Scan an EAN/UPC barcode on the device with the browser's BarcodeDetector (Chrome on
+// Android, among others). The backend decodes barcodes itself too, but sending the code
+// lets it answer from its catalog even where server-side decoding is unavailable.
+
+interface DetectedBarcode {
+  rawValue: string;
+  format: string;
+}
+
+interface BarcodeDetectorInstance {
+  detect(source: ImageBitmapSource): Promise<DetectedBarcode[]>;
+}
+
+type BarcodeDetectorConstructor = new (options?: { formats?: string[] }) => BarcodeDetectorInstance;
+
+const FORMATS = ["ean_13", "ean_8", "upc_a", "upc_e"];
+
+// Expand an 8-digit UPC-E code to its 12-digit UPC-A form (as expand_upce in
+// backend/inventory/barcodes.py). The backend reads 8 digits as EAN-8.
+function expandUpcE(code: string): string {
+  const [number, body, check] = [code[0], code.slice(1, 7), code[7]];
+  const last = body[5];
+  let core: string;
+  if ("012".includes(last)) core = body.slice(0, 2) + last + "0000" + body.slice(2, 5);
+  else if (last === "3") core = body.slice(0, 3) + "00000" + body.slice(3, 5);
+  else if (last === "4") core = body.slice(0, 4) + "00000" + body[4];
+  else core = body.slice(0, 5) + "0000" + last;
+  return number + core + check;
+}
+
+function toCode(barcode: DetectedBarcode): string | undefined {
+  const code = barcode.rawValue;
+  if (barcode.format === "upc_e" && /^\d{8}$/.test(code)) return expandUpcE(code);
+  return code || undefined;
+}
+
+// Resolves with the first code found, or undefined when there is none or the browser cannot scan.
+export async function scanBarcode(image: Blob): Promise<string | undefined> {
+  const Detector = (globalThis as { BarcodeDetector?: BarcodeDetectorConstructor }).BarcodeDetector;
+  if (!Detector) return undefined;
+  try {
+    const bitmap = await createImageBitmap(image);
+    try {
+      const codes = await new Detector({ formats: FORMATS }).detect(bitmap);
+      return codes[0] ? toCode(codes[0]) : undefined;
+    } finally {
+      bitmap.close();
+    }
+  } catch (e) {
+    console.warn("Barcode scan failed:", e);
+    return undefined;
+  }
+}
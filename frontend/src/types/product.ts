@@ -1,8 +1,33 @@
-export type ProductCategory = 'Food' | 'Medicine' | 'Drinks' | 'Hygiene' | 'Insecticide' | 'Cleanings';
+// Must match ProductCapture.CATEGORY_CHOICES in backend/inventory/models.py
+export const PRODUCT_CATEGORIES = [
+  'Food',
+  'Drinks',
+  'Medicine',
+  'Hygiene',
+  'Cleaning Supplies',
+  'Insecticide',
+  'School Supplies',
+  'Office Supplies',
+  'Tobacco',
+  'Alcohol',
+  'Frozen Goods',
+  'Bread & Pastries',
+  'Baby Products',
+  'Pet Supplies',
+  'Hardware & Electrical',
+  'Clothing & Accessories',
+  'Mobile Load & E-Services',
+  'Rice & Grains',
+] as const;
+
+export type ProductCategory = (typeof PRODUCT_CATEGORIES)[number];
 
 export interface ProductCapture {
   id: string;
   image_url: string;
+  // Small (list) and medium derivatives of the image; cacheable forever
+  thumbnail_url?: string | null;
+  medium_url?: string | null;
   product_name: string;
   unit: string;
   description: string;
@@ -10,6 +35,7 @@ export interface ProductCapture {
   confidence: number;
   created_at: string;
   session_id?: string;
+  barcode?: string;
 }
 
 export interface ExtractionResponse {
@@ -20,10 +46,46 @@ export interface ExtractionResponse {
   category: ProductCategory;
   confidence: number;
   image_url?: string;
+  thumbnail_url?: string | null;
+  medium_url?: string | null;
   session_id?: string;
   created_at?: string;
+  edited_at?: string | null;
+}
+
+export interface BatchExtractionResult {
+  index: number;
+  filename: string;
+  saved?: ProductCapture[];
+  cache?: 'hit' | 'miss' | 'off';
+  degraded?: boolean;
+  barcode?: string | null;
+  product_index?: 'hit' | null;
+  error?: string;
 }
 
+export interface BatchExtractionResponse {
+  results: BatchExtractionResult[];
+  saved_count: number;
+  failed_count: number;
+}
+
+// One NDJSON line of a streamed extraction (stream=1)
+export type ExtractionStreamEvent =
+  | { event: 'item'; data: ProductCapture }
+  | {
+      event: 'done';
+      data: {
+        cache: 'hit' | 'miss' | 'off';
+        degraded: boolean;
+        barcode: string | null;
+        catalog: 'hit' | 'miss' | null;
+        index: 'hit' | null;
+        saved_count: number;
+      };
+    }
+  | { event: 'error'; data: { error: string } };
+
 // For form data
 export interface ProductFormData {
   product_name: string;